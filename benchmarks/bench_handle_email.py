@@ -0,0 +1,138 @@
+"""
+Бенчмарк разбора писем: для каждого письма из benchmarks/corpus измеряет время разбора
+(email.message_from_bytes + handle_email), память, которую удерживает результат разбора
+(выделенные блоки и их объем), и пиковую память во время разбора.
+
+    python benchmarks/bench_handle_email.py                  # сравнить с baseline.json
+    python benchmarks/bench_handle_email.py --save-baseline  # записать текущие результаты как baseline
+
+Если какая-то метрика хуже baseline больше допустимого порога или baseline нет, скрипт завершается с кодом 1.
+По умолчанию сравниваются только метрики памяти — они не зависят от машины, и baseline.json с ними
+хранится в репозитории. Время зависит от машины: --with-time сравнивает и его, baseline для этого
+записывают и сравнивают на одном и том же окружении (--save-baseline --with-time).
+Корпус писем не хранится в репозитории: если его нет, он генерируется make_corpus.py.
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+from email import message_from_bytes
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from email_handler import handle_email  # noqa: E402
+import make_corpus  # noqa: E402
+
+BENCH_DIR = Path(__file__).parent
+CORPUS_DIR = BENCH_DIR / "corpus"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+
+# Допустимое ухудшение относительно baseline (доля)
+TOLERANCE = {"time_ms": 0.25, "allocated_blocks": 0.10, "allocated_kb": 0.10, "peak_kb": 0.10}
+# Допустимое ухудшение в абсолютных единицах: у маленьких значений (десятки блоков, единицы КБ)
+# случайный разброс между запусками больше относительного порога
+SLACK = {"time_ms": 0.5, "allocated_blocks": 10, "allocated_kb": 8, "peak_kb": 16}
+# Метрики, которые не зависят от машины и сравниваются по умолчанию
+MEMORY_METRICS = ("allocated_blocks", "allocated_kb", "peak_kb")
+
+
+def parse(raw: bytes):
+    return asyncio.run(handle_email(message_from_bytes(raw)))
+
+
+def measure(raw: bytes, repeat: int) -> dict:
+    parse(raw)  # прогрев
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(raw)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = parse(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    diff = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0]
+    del result
+
+    return {
+        # Лучший из замеров меньше всего зависит от фоновой нагрузки на машину
+        "time_ms": round(min(timings), 3),
+        "allocated_blocks": sum(stat.count_diff for stat in diff),
+        "allocated_kb": round(sum(stat.size_diff for stat in diff) / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, metrics_to_compare: tuple[str, ...]) -> list[str]:
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            regressions.append(f"{name}: нет в baseline")
+            continue
+        for metric in metrics_to_compare:
+            if metric not in base:
+                regressions.append(f"{name}: {metric} нет в baseline")
+                continue
+            tolerance = TOLERANCE[metric]
+            limit = base[metric] * (1 + tolerance) + SLACK[metric]
+            if metrics[metric] > limit:
+                regressions.append(f"{name}: {metric} {metrics[metric]} > {base[metric]} (+{tolerance:.0%} +{SLACK[metric]})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора писем handle_email")
+    parser.add_argument("--repeat", type=int, default=20, help="число замеров времени на письмо")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты в baseline.json")
+    parser.add_argument("--with-time", action="store_true",
+                        help="сравнивать (и записывать в baseline) время разбора — только на одной и той же машине")
+    args = parser.parse_args()
+    metrics_to_compare = MEMORY_METRICS + (("time_ms",) if args.with_time else ())
+
+    if not list(CORPUS_DIR.glob("*.eml")):
+        make_corpus.main()
+
+    # Отключаем логи handle_email (кроме ошибок), чтобы мерить разбор, а не вывод
+    logging.disable(logging.WARNING)
+
+    results = {}
+    print(f"{'письмо':<24}{'размер, КБ':>12}{'время, мс':>12}{'блоков':>10}{'удержано, КБ':>14}{'пик, КБ':>12}")
+    for path in sorted(CORPUS_DIR.glob("*.eml")):
+        raw = path.read_bytes()
+        metrics = measure(raw, args.repeat)
+        results[path.stem] = metrics
+        print(f"{path.stem:<24}{len(raw) / 1024:>12.0f}{metrics['time_ms']:>12}{metrics['allocated_blocks']:>10}"
+              f"{metrics['allocated_kb']:>14}{metrics['peak_kb']:>12}")
+
+    if args.save_baseline:
+        baseline = {name: {metric: metrics[metric] for metric in metrics_to_compare} for name, metrics in results.items()}
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Baseline записан в {BASELINE_PATH}")
+        return
+
+    if not BASELINE_PATH.exists():
+        print("baseline.json не найден, запустите с --save-baseline")
+        sys.exit(1)
+
+    regressions = compare(results, json.loads(BASELINE_PATH.read_text(encoding="utf-8")), metrics_to_compare)
+    if regressions:
+        print("Ухудшение относительно baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("Результаты в пределах baseline")
+
+
+if __name__ == "__main__":
+    main()
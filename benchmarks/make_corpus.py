@@ -0,0 +1,128 @@
+"""
+Генерирует корпус писем Superset для бенчмарка handle_email (benchmarks/corpus/*.eml).
+Письма детерминированы (фиксированные seed, даты и границы MIME), поэтому повторный запуск
+дает те же файлы. Запуск: python benchmarks/make_corpus.py
+"""
+import random
+from pathlib import Path
+from email.header import Header
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+DATE = "Mon, 06 Oct 2025 06:00:03 +0000"
+
+HTML_BODY = """<html><body>
+<b>Superset report</b>
+<p>{title}</p>
+<p><a href="https://superset.example.com/superset/dashboard/42/">Explore in Superset</a></p>
+{images}
+</body></html>"""
+
+
+def _fake_pdf(size: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    return b"%PDF-1.4\n" + rnd.randbytes(size) + b"\n%%EOF\n"
+
+
+def _fake_png(size: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    return b"\x89PNG\r\n\x1a\n" + rnd.randbytes(size)
+
+
+def _message(subject: str, charset: str, boundary: str) -> MIMEMultipart:
+    msg = MIMEMultipart("mixed", boundary=boundary)
+    msg["Subject"] = Header(subject, charset).encode()
+    msg["From"] = "superset@example.com"
+    msg["To"] = "box01@mail.ru"
+    msg["Date"] = DATE
+    msg["Message-ID"] = f"<{boundary}@superset.example.com>"
+    return msg
+
+
+def _attachment(part, filename: str, charset: str = "utf-8", rfc2231: bool = False):
+    """Добавляет заголовок вложения. По умолчанию имя кодируется как в Superset (RFC 2047),
+    rfc2231=True — как в некоторых почтовых серверах (filename*=charset''...)."""
+    if rfc2231:
+        part.add_header("Content-Disposition", "attachment", filename=(charset, "", filename))
+    else:
+        part.add_header("Content-Disposition", "attachment", filename=Header(filename, charset).encode())
+    return part
+
+
+def small_png_utf8() -> MIMEMultipart:
+    msg = _message("[Superset] Продажи за день", "utf-8", "bench-small-png")
+    msg.attach(MIMEText(HTML_BODY.format(title="Продажи за день", images=""), "html", "utf-8"))
+    msg.attach(_attachment(MIMEImage(_fake_png(60_000, 1), "png"), "Продажи за день.png"))
+    return msg
+
+
+def pdf_koi8r_filename() -> MIMEMultipart:
+    msg = _message("[Superset] Остатки на складах", "koi8-r", "bench-koi8r-pdf")
+    msg.attach(MIMEText(HTML_BODY.format(title="Остатки на складах", images=""), "html", "koi8-r"))
+    msg.attach(_attachment(MIMEApplication(_fake_pdf(250_000, 2), "pdf"), "Остатки на складах.pdf", "koi8-r"))
+    return msg
+
+
+def pdf_rfc2231_filename() -> MIMEMultipart:
+    msg = _message("[Superset] Weekly revenue", "utf-8", "bench-rfc2231-pdf")
+    msg.attach(MIMEText(HTML_BODY.format(title="Weekly revenue", images=""), "html", "utf-8"))
+    msg.attach(_attachment(MIMEApplication(_fake_pdf(400_000, 3), "pdf"), "Выручка по неделям.pdf", rfc2231=True))
+    return msg
+
+
+def pdf_large() -> MIMEMultipart:
+    msg = _message("[Superset] Полный отчет по магазинам", "utf-8", "bench-large-pdf")
+    msg.attach(MIMEText(HTML_BODY.format(title="Полный отчет по магазинам", images=""), "html", "utf-8"))
+    msg.attach(_attachment(MIMEApplication(_fake_pdf(2_000_000, 4), "pdf"), "Полный отчет по магазинам.pdf"))
+    return msg
+
+
+def mixed_many_parts() -> MIMEMultipart:
+    """Тело с десятью встроенными картинками графиков, CSV (пропускается) и два отчета — PDF и PNG."""
+    msg = _message("[Superset] Дашборд руководителя", "utf-8", "bench-mixed")
+    related = MIMEMultipart("related", boundary="bench-mixed-related")
+    images = "\n".join(f'<img src="cid:chart{i}">' for i in range(10))
+    related.attach(MIMEText(HTML_BODY.format(title="Дашборд руководителя", images=images), "html", "utf-8"))
+    for i in range(10):
+        image = MIMEImage(_fake_png(30_000, 100 + i), "png")
+        image.add_header("Content-ID", f"<chart{i}>")
+        image.add_header("Content-Disposition", "inline")
+        related.attach(image)
+    msg.attach(related)
+
+    csv = MIMEApplication(("Магазин;Выручка\n" * 5000).encode("utf-8"), "csv")
+    msg.attach(_attachment(csv, "Выгрузка.csv"))
+    msg.attach(_attachment(MIMEApplication(_fake_pdf(300_000, 5), "pdf"), "Дашборд руководителя.pdf"))
+    msg.attach(_attachment(MIMEImage(_fake_png(120_000, 6), "png"), "Дашборд руководителя.png"))
+    return msg
+
+
+def no_attachments() -> MIMEMultipart:
+    msg = _message("[Superset] Алерт: нет данных", "utf-8", "bench-no-attachments")
+    msg.attach(MIMEText(HTML_BODY.format(title="Нет данных за последний час", images=""), "html", "utf-8"))
+    return msg
+
+
+CORPUS = {
+    "small_png_utf8": small_png_utf8,
+    "pdf_koi8r_filename": pdf_koi8r_filename,
+    "pdf_rfc2231_filename": pdf_rfc2231_filename,
+    "pdf_large": pdf_large,
+    "mixed_many_parts": mixed_many_parts,
+    "no_attachments": no_attachments,
+}
+
+
+def main():
+    CORPUS_DIR.mkdir(exist_ok=True)
+    for name, build in CORPUS.items():
+        path = CORPUS_DIR / f"{name}.eml"
+        path.write_bytes(build().as_bytes())
+        print(f"{path.name}: {path.stat().st_size / 1024:.0f} КБ")
+
+
+if __name__ == "__main__":
+    main()
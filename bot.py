@@ -1,6 +1,24 @@
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from config import Config
 
 
-# Инициализация бота
-bot = Bot(token=Config.BOT_TOKEN)
\ No newline at end of file
+# Общая HTTP-сессия (пул соединений с Telegram) для ботов всех тенантов.
+# С TELEGRAM_API_SERVER боты работают через собственный сервер Bot API в локальном режиме
+api = TelegramAPIServer.from_base(Config.TELEGRAM_API_SERVER, is_local=True) if Config.TELEGRAM_API_SERVER else PRODUCTION
+session = AiohttpSession(api=api)
+
+
+def create_bot(token: str) -> Bot:
+    return Bot(token=token, session=session)
+
+
+# Бот из BOT_TOKEN создается при первом обращении: с TENANTS_FILE токен в окружении может быть не задан
+_default_bot: dict[str, Bot | None] = {"instance": None}
+
+
+def default_bot() -> Bot:
+    if _default_bot["instance"] is None:
+        _default_bot["instance"] = create_bot(Config.BOT_TOKEN)
+    return _default_bot["instance"]
@@ -5,6 +5,19 @@ load_dotenv()
 
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
+    # Несколько ботов и баз SeaTable в одном процессе: JSON-список тенантов (см. tenants.py).
+    # Если не задан, работает один тенант с параметрами из переменных окружения
+    TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+    # Собственный сервер Bot API (telegram-bot-api --local), например http://localhost:8081.
+    # Вложения передаются ему путем к файлу на диске, лимит размера — 2000 МБ вместо 50 МБ
+    TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
+    TELEGRAM_MAX_FILE_MB = int(os.getenv("TELEGRAM_MAX_FILE_MB", "2000" if TELEGRAM_API_SERVER else "50"))
+    # Каталог для файлов отправки; должен быть доступен серверу Bot API. Если у сервера он смонтирован
+    # по другому пути, этот путь указывается в TELEGRAM_SPOOL_SERVER_DIR
+    TELEGRAM_SPOOL_DIR = os.getenv("TELEGRAM_SPOOL_DIR", "data/telegram_spool")
+    TELEGRAM_SPOOL_SERVER_DIR = os.getenv("TELEGRAM_SPOOL_SERVER_DIR", "")
+    # Через сколько секунд удалять файлы, оставшиеся от прерванных рассылок
+    TELEGRAM_SPOOL_TTL = int(os.getenv("TELEGRAM_SPOOL_TTL", "86400"))
 
     IMAP_SERVER = os.getenv("IMAP_SERVER")
     IMAP_EMAIL_SR01 = os.getenv("IMAP_EMAIL_SR01")
@@ -15,9 +28,116 @@ class Config:
     IMAP_PASSWORD_SR03 = os.getenv("IMAP_PASSWORD_SR03")
     IMAP_EMAIL_SR04 = os.getenv("IMAP_EMAIL_SR04")
     IMAP_PASSWORD_SR04 = os.getenv("IMAP_PASSWORD_SR04")
+    # Через сколько секунд перезапускать IDLE (сервер разрывает IDLE примерно через 29 минут)
+    IMAP_IDLE_REFRESH = int(os.getenv("IMAP_IDLE_REFRESH", "600"))
+    # Максимальная задержка между попытками переподключения к IMAP, в секундах
+    IMAP_RECONNECT_MAX_DELAY = int(os.getenv("IMAP_RECONNECT_MAX_DELAY", "300"))
+    # Выборка писем: full — письмо целиком, bodystructure — по BODYSTRUCTURE только части с PDF/PNG
+    IMAP_FETCH_MODE = os.getenv("IMAP_FETCH_MODE", "full").lower()
+    # Архивация обработанных писем: "" — выключена, move — перенос в IMAP_ARCHIVE_FOLDER после доставки,
+    # expunge — удаление доставленных писем старше IMAP_RETENTION_DAYS дней.
+    # Доставленные письма отмечаются на сервере ключевым словом $Delivered
+    IMAP_ARCHIVE_MODE = os.getenv("IMAP_ARCHIVE_MODE", "").lower()
+    IMAP_ARCHIVE_FOLDER = os.getenv("IMAP_ARCHIVE_FOLDER", "Archive")
+    IMAP_RETENTION_DAYS = int(os.getenv("IMAP_RETENTION_DAYS", "30"))
+    IMAP_ARCHIVE_INTERVAL = int(os.getenv("IMAP_ARCHIVE_INTERVAL", "300"))
+    IMAP_ARCHIVE_BATCH = int(os.getenv("IMAP_ARCHIVE_BATCH", "500"))
 
     SEATABLE_API_TOKEN = os.getenv("SEATABLE_API_TOKEN")
     SEATABLE_SERVER = os.getenv("SEATABLE_SERVER")
     SEATABLE_USERS_TABLE_ID = os.getenv("SEATABLE_USERS_TABLE_ID")
     SEATABLE_MAILBOXES_TABLE_ID = os.getenv("SEATABLE_MAILBOXES_TABLE_ID")
-    SEATABLE_T_CHATS_TABLE_ID = os.getenv("SEATABLE_T_CHATS_TABLE_ID")
\ No newline at end of file
+    SEATABLE_T_CHATS_TABLE_ID = os.getenv("SEATABLE_T_CHATS_TABLE_ID")
+    # Квота запросов к API SeaTable (у каждого тенанта своя): запросов в минуту, допустимый всплеск
+    # и число повторов после ответа 429
+    SEATABLE_RATE_LIMIT = int(os.getenv("SEATABLE_RATE_LIMIT", "240"))
+    SEATABLE_RATE_BURST = int(os.getenv("SEATABLE_RATE_BURST", "20"))
+    SEATABLE_MAX_RETRIES = int(os.getenv("SEATABLE_MAX_RETRIES", "5"))
+    # Как часто перечитывать таблицы, если подписка на события SeaTable не работает, в секундах
+    SEATABLE_POLL_INTERVAL = int(os.getenv("SEATABLE_POLL_INTERVAL", "60"))
+    # Подписка на изменения таблиц в реальном времени (socket.io на dtable_socket)
+    SEATABLE_EVENTS_ENABLED = os.getenv("SEATABLE_EVENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+    SEATABLE_SOCKET_PATH = os.getenv("SEATABLE_SOCKET_PATH", "/dtable-server/socket.io")
+    # Локальная копия таблиц SeaTable (SQLite); пустое значение отключает её
+    SEATABLE_SNAPSHOT_PATH = os.getenv("SEATABLE_SNAPSHOT_PATH", "data/seatable_snapshot.sqlite3")
+    # Как часто перечитывать таблицы полностью (между полными чтениями — только измененные по _mtime строки)
+    SEATABLE_FULL_SYNC_INTERVAL = int(os.getenv("SEATABLE_FULL_SYNC_INTERVAL", "3600"))
+
+    # Режим диагностики цикла событий (см. diagnostics.py)
+    DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    DIAGNOSTICS_DIR = os.getenv("DIAGNOSTICS_DIR", "diagnostics")
+    # Колбэки дольше этого времени (в секундах) считаются блокирующими
+    SLOW_CALLBACK_THRESHOLD = float(os.getenv("SLOW_CALLBACK_THRESHOLD", "0.1"))
+    DIAGNOSTICS_SAMPLE_INTERVAL = int(os.getenv("DIAGNOSTICS_SAMPLE_INTERVAL", "30"))
+    DIAGNOSTICS_TRACEMALLOC_FRAMES = int(os.getenv("DIAGNOSTICS_TRACEMALLOC_FRAMES", "10"))
+
+    # Бюджет отправки в Telegram: сообщений в секунду на бота, параллельных загрузок
+    # и минимальный интервал между сообщениями в один чат (личный / группа), в секундах
+    TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", "25"))
+    TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "4"))
+    TELEGRAM_USER_INTERVAL = float(os.getenv("TELEGRAM_USER_INTERVAL", "1"))
+    TELEGRAM_GROUP_INTERVAL = float(os.getenv("TELEGRAM_GROUP_INTERVAL", "3"))
+    # Приоритеты рассылки по фрагментам темы письма, JSON: {"Срочно": 10}
+    DELIVERY_SUBJECT_PRIORITIES = os.getenv("DELIVERY_SUBJECT_PRIORITIES", "{}")
+    # Локальный список недоступных получателей и переездов групп в супергруппы (SQLite)
+    RECIPIENTS_DB_PATH = os.getenv("RECIPIENTS_DB_PATH", "data/recipients.sqlite3")
+
+    # Трассировка обработки писем: спаны в формате OTLP/JSON пишутся в ротируемый файл
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+    TRACES_FILE = os.getenv("TRACES_FILE", "logs/traces.jsonl")
+
+    # HTTP API для приема отчетов напрямую, без почты (POST /reports, см. http_api.py)
+    HTTP_API_ENABLED = os.getenv("HTTP_API_ENABLED", "false").lower() in ("1", "true", "yes")
+    HTTP_API_HOST = os.getenv("HTTP_API_HOST", "0.0.0.0")
+    HTTP_API_PORT = int(os.getenv("HTTP_API_PORT", "8080"))
+    # Bearer-токен для запросов к API
+    HTTP_API_TOKEN = os.getenv("HTTP_API_TOKEN", "")
+    HTTP_API_MAX_UPLOAD_MB = int(os.getenv("HTTP_API_MAX_UPLOAD_MB", str(TELEGRAM_MAX_FILE_MB)))
+    # Лимит всего запроса: больший отклоняется по Content-Length, не читая тела
+    HTTP_API_MAX_REQUEST_MB = int(os.getenv("HTTP_API_MAX_REQUEST_MB", str(HTTP_API_MAX_UPLOAD_MB * 4)))
+
+    # Встроенный SMTP-приемник: Superset отправляет письма прямо боту (см. smtp_receiver.py)
+    SMTP_RECEIVER_ENABLED = os.getenv("SMTP_RECEIVER_ENABLED", "false").lower() in ("1", "true", "yes")
+    SMTP_RECEIVER_HOST = os.getenv("SMTP_RECEIVER_HOST", "127.0.0.1")
+    SMTP_RECEIVER_PORT = int(os.getenv("SMTP_RECEIVER_PORT", "8025"))
+    SMTP_RECEIVER_MAX_SIZE_MB = int(os.getenv("SMTP_RECEIVER_MAX_SIZE_MB", str(TELEGRAM_MAX_FILE_MB)))
+    # Адреса и подсети клиентов, от которых принимаются письма (через запятую)
+    SMTP_RECEIVER_ALLOWED_IPS = os.getenv("SMTP_RECEIVER_ALLOWED_IPS", "127.0.0.0/8,::1")
+    # Разрешенные отправители MAIL FROM: адреса или домены вида @company.ru; пусто — любые
+    SMTP_RECEIVER_ALLOWED_SENDERS = os.getenv("SMTP_RECEIVER_ALLOWED_SENDERS", "")
+
+    # История доставки: адрес базы SQLAlchemy (SQLite через aiosqlite или PostgreSQL через asyncpg),
+    # пустое значение отключает запись. Просмотр: python -m delivery_history
+    DELIVERY_HISTORY_URL = os.getenv("DELIVERY_HISTORY_URL", "sqlite+aiosqlite:///data/delivery_history.sqlite3")
+    DELIVERY_HISTORY_BATCH = int(os.getenv("DELIVERY_HISTORY_BATCH", "100"))
+    DELIVERY_HISTORY_FLUSH_INTERVAL = float(os.getenv("DELIVERY_HISTORY_FLUSH_INTERVAL", "2"))
+
+    # Watchdog: перезапуск зависших IMAP-потоков и отмена зависших отправок (состояние — /health/live, /health/ready)
+    WATCHDOG_ENABLED = os.getenv("WATCHDOG_ENABLED", "true").lower() in ("1", "true", "yes")
+    WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "5"))
+    # Сколько секунд сверх ожидаемого ждать heartbeat IMAP-потока, прежде чем оборвать его соединение
+    WATCHDOG_IMAP_TIMEOUT = float(os.getenv("WATCHDOG_IMAP_TIMEOUT", "120"))
+    # Предел ожидания вызовов из IMAP-потока в цикл событий (get_last_uid и т.п.)
+    WATCHDOG_CALL_TIMEOUT = float(os.getenv("WATCHDOG_CALL_TIMEOUT", "60"))
+    # После стольких перезапусков подряд без heartbeat /health/live сообщает, что процесс пора перезапустить
+    WATCHDOG_MAX_RESTARTS = int(os.getenv("WATCHDOG_MAX_RESTARTS", "5"))
+    # Предел одной отправки файла в Telegram, в секундах
+    TELEGRAM_SEND_TIMEOUT = float(os.getenv("TELEGRAM_SEND_TIMEOUT", "300"))
+
+    # Выгрузка отчетов из Superset по расписанию через REST API (вместо писем)
+    SUPERSET_PULL_ENABLED = os.getenv("SUPERSET_PULL_ENABLED", "false").lower() in ("1", "true", "yes")
+    SUPERSET_URL = os.getenv("SUPERSET_URL", "http://localhost:8088")
+    SUPERSET_USERNAME = os.getenv("SUPERSET_USERNAME", "")
+    SUPERSET_PASSWORD = os.getenv("SUPERSET_PASSWORD", "")
+    # db или ldap — как настроена авторизация в Superset
+    SUPERSET_PROVIDER = os.getenv("SUPERSET_PROVIDER", "db")
+    # JSON-список расписаний: cron, mailboxes, dashboard или chart, format, subject, filters, time_bucket, tenant
+    SUPERSET_SCHEDULES_FILE = os.getenv("SUPERSET_SCHEDULES_FILE", "superset_schedules.json")
+    # Сколько секунд ждать готовности снимка и как часто его опрашивать
+    SUPERSET_SCREENSHOT_TIMEOUT = float(os.getenv("SUPERSET_SCREENSHOT_TIMEOUT", "120"))
+    SUPERSET_POLL_INTERVAL = float(os.getenv("SUPERSET_POLL_INTERVAL", "2"))
+    # Сколько секунд готовая выгрузка переиспользуется расписаниями с тем же дашбордом и фильтрами
+    SUPERSET_EXPORT_CACHE_TTL = int(os.getenv("SUPERSET_EXPORT_CACHE_TTL", "600"))
+
+    # Сколько секунд при запуске ждать входа во все ящики, прежде чем продолжить без них
+    STARTUP_IMAP_TIMEOUT = float(os.getenv("STARTUP_IMAP_TIMEOUT", "60"))
\ No newline at end of file
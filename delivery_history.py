@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import (BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table, Text,
+                        func, insert, select)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+deliveries = Table(
+    "deliveries", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("attempted_at", DateTime(timezone=True), nullable=False),
+    Column("tenant", String(64), nullable=False),
+    Column("mailbox", String(255), nullable=False),
+    Column("uid", String(32)),
+    Column("trace_id", String(32)),
+    Column("subject", Text),
+    Column("chat_id", String(32), nullable=False),
+    Column("filename", Text),
+    Column("bytes", BigInteger, nullable=False, default=0),
+    # Ожидание в очереди планировщика и задержка от прихода отчета до конца отправки, в миллисекундах
+    Column("queue_wait_ms", Integer),
+    Column("latency_ms", Integer),
+    # sent, failed, skipped (получатель недоступен), retry (лимит Telegram), migrated (группа стала супергруппой)
+    Column("outcome", String(16), nullable=False),
+    Column("error", Text),
+    Index("ix_deliveries_chat_time", "chat_id", "attempted_at"),
+    Index("ix_deliveries_mailbox_time", "mailbox", "attempted_at"),
+    Index("ix_deliveries_time", "attempted_at"),
+)
+
+
+def create_engine(url: str) -> AsyncEngine:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database:
+        Path(parsed.database).parent.mkdir(parents=True, exist_ok=True)
+    return create_async_engine(url)
+
+
+class DeliveryHistory:
+    """История доставки отчетов: каждая попытка отправки файла в Telegram записывается в базу
+    (SQLite по умолчанию, PostgreSQL через DELIVERY_HISTORY_URL). record() не блокирует: запись попадает в буфер,
+    который сбрасывается в базу при DELIVERY_HISTORY_BATCH записях или раз в DELIVERY_HISTORY_FLUSH_INTERVAL секунд."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._engine: AsyncEngine | None = None
+        self._buffer: list[dict] = []
+        self._flush_needed = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._stopping = False
+
+    def record(self, **row):
+        row.setdefault("attempted_at", datetime.now(timezone.utc))
+        self._buffer.append(row)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._run(), name="delivery-history-writer")
+        if len(self._buffer) >= Config.DELIVERY_HISTORY_BATCH:
+            self._flush_needed.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=Config.DELIVERY_HISTORY_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            await self.flush()
+
+    async def _get_engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_engine(self.url)
+            async with self._engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+        return self._engine
+
+    async def flush(self):
+        """Записывает накопленные записи одной транзакцией. При ошибке базы записи возвращаются в буфер
+        (не больше десяти пачек, чтобы недоступная база не съела память)."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            engine = await self._get_engine()
+            async with engine.begin() as conn:
+                await conn.execute(insert(deliveries), batch)
+        except Exception as e:
+            logger.error(f"Не удалось записать историю доставки ({len(batch)} записей): {e}")
+            self._buffer = (batch + self._buffer)[-Config.DELIVERY_HISTORY_BATCH * 10:]
+
+    async def close(self):
+        """Останавливает фоновую запись и сбрасывает остаток буфера. Писатель не отменяется, а дописывает
+        текущую пачку и завершается сам: отмена посреди flush() потеряла бы уже извлеченные из буфера записи."""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            self._stopping = True
+            self._flush_needed.set()
+            await asyncio.gather(writer, return_exceptions=True)
+            self._stopping = False
+        await self.flush()
+        if self._engine is not None:
+            await self._engine.dispose()
+
+
+_history: dict[str, DeliveryHistory | None] = {"instance": None}
+
+
+def get_history() -> DeliveryHistory | None:
+    """История доставки (None, если DELIVERY_HISTORY_URL пуст)"""
+    if _history["instance"] is None and Config.DELIVERY_HISTORY_URL:
+        _history["instance"] = DeliveryHistory(Config.DELIVERY_HISTORY_URL)
+    return _history["instance"]
+
+
+def record_delivery(**row):
+    history = get_history()
+    if history is not None:
+        history.record(**row)
+
+
+async def close_history():
+    if _history["instance"] is not None:
+        await _history["instance"].close()
+
+
+# Запросы к истории из командной строки:
+#   python -m delivery_history lookup --chat -1001234567890 --subject "Продажи" --since 2026-10-19
+#   python -m delivery_history stats --since 7d --by mailbox
+
+_MOSCOW_TZ = timezone(timedelta(hours=3))
+
+
+def _parse_time(value: str) -> datetime:
+    """Дата (2026-10-19), дата и время (2026-10-19T09:00) или смещение назад: 24h, 7d"""
+    if value[:-1].isdigit() and value[-1] in "hd":
+        amount = int(value[:-1])
+        return datetime.now(timezone.utc) - (timedelta(hours=amount) if value[-1] == "h" else timedelta(days=amount))
+    parsed = datetime.fromisoformat(value)
+    parsed = parsed if parsed.tzinfo else parsed.replace(tzinfo=_MOSCOW_TZ)
+    # SQLite хранит время без часового пояса, поэтому и в базе, и в запросах — UTC
+    return parsed.astimezone(timezone.utc)
+
+
+def _filters(args) -> list:
+    conditions = []
+    if args.since:
+        conditions.append(deliveries.c.attempted_at >= _parse_time(args.since))
+    if args.until:
+        conditions.append(deliveries.c.attempted_at < _parse_time(args.until))
+    if getattr(args, "chat", None):
+        conditions.append(deliveries.c.chat_id == args.chat)
+    if args.mailbox:
+        conditions.append(deliveries.c.mailbox == args.mailbox)
+    if getattr(args, "subject", None):
+        conditions.append(deliveries.c.subject.like(f"%{args.subject}%"))
+    if getattr(args, "outcome", None):
+        conditions.append(deliveries.c.outcome == args.outcome)
+    return conditions
+
+
+async def _lookup(engine: AsyncEngine, args):
+    query = (select(deliveries).where(*_filters(args))
+             .order_by(deliveries.c.attempted_at.desc()).limit(args.limit))
+    async with engine.connect() as conn:
+        rows = (await conn.execute(query)).mappings().all()
+
+    if not rows:
+        print("Записей не найдено")
+        return
+    for row in rows:
+        attempted_at = row["attempted_at"]
+        if attempted_at.tzinfo is None:
+            attempted_at = attempted_at.replace(tzinfo=timezone.utc)
+        attempted_at = attempted_at.astimezone(_MOSCOW_TZ).strftime("%d.%m.%Y %H:%M:%S")
+        latency = f"{row['latency_ms'] / 1000:.1f} с" if row["latency_ms"] is not None else "—"
+        print(f"{attempted_at}  {row['outcome']:<8} {row['chat_id']:<16} {row['mailbox']:<24} "
+              f"задержка {latency:<9} {row['filename']}  «{row['subject']}»"
+              + (f"  ошибка: {row['error']}" if row["error"] else ""))
+
+
+async def _stats(engine: AsyncEngine, args):
+    group = {"mailbox": deliveries.c.mailbox, "chat": deliveries.c.chat_id,
+             "tenant": deliveries.c.tenant, "outcome": deliveries.c.outcome}[args.by]
+    conditions = _filters(args)
+    totals = (select(group.label("key"),
+                     func.count().label("attempts"),
+                     func.sum(func.coalesce(deliveries.c.bytes, 0)).label("bytes"),
+                     func.min(deliveries.c.attempted_at).label("first"),
+                     func.max(deliveries.c.attempted_at).label("last"))
+              .where(*conditions).group_by(group).order_by(group))
+    # Задержки только успешных отправок — по ним считаются медиана и 95-й перцентиль
+    latencies = (select(group.label("key"), deliveries.c.latency_ms, deliveries.c.queue_wait_ms)
+                 .where(*conditions, deliveries.c.outcome == "sent", deliveries.c.latency_ms.is_not(None)))
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(totals)).mappings().all()
+        sent: dict[str, list[tuple[int, int]]] = {}
+        for key, latency_ms, queue_wait_ms in await conn.execute(latencies):
+            sent.setdefault(key, []).append((latency_ms, queue_wait_ms or 0))
+
+    if not rows:
+        print("Записей не найдено")
+        return
+
+    print(f"{args.by:<28} {'попыток':>8} {'отправлено':>10} {'МБ':>8} {'в час':>8} "
+          f"{'задержка: сред.':>16} {'медиана':>8} {'p95':>8} {'очередь сред.':>14}")
+    for row in rows:
+        values = sent.get(row["key"], [])
+        latency = sorted(latency_ms for latency_ms, _ in values)
+        hours = max((row["last"] - row["first"]).total_seconds() / 3600, 1 / 60)
+        p95 = latency[min(len(latency) - 1, int(len(latency) * 0.95))] / 1000 if latency else None
+        print(f"{str(row['key']):<28} {row['attempts']:>8} {len(values):>10} {(row['bytes'] or 0) / 2 ** 20:>8.1f} "
+              f"{len(values) / hours:>8.1f} "
+              + (f"{statistics.fmean(latency) / 1000:>15.1f}с {statistics.median(latency) / 1000:>7.1f}с {p95:>7.1f}с "
+                 f"{statistics.fmean(wait for _, wait in values) / 1000:>13.1f}с" if latency else f"{'—':>16}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m delivery_history", description="История доставки отчетов")
+    parser.add_argument("--url", default=Config.DELIVERY_HISTORY_URL, help="адрес базы (по умолчанию DELIVERY_HISTORY_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    lookup = commands.add_parser("lookup", help="попытки доставки по чату, ящику, теме")
+    lookup.add_argument("--chat", help="id чата или пользователя Telegram")
+    lookup.add_argument("--subject", help="фрагмент темы отчета")
+    lookup.add_argument("--outcome", choices=["sent", "failed", "skipped", "retry", "migrated"])
+    lookup.add_argument("--limit", type=int, default=50)
+
+    stats = commands.add_parser("stats", help="задержка и пропускная способность доставки")
+    stats.add_argument("--by", choices=["mailbox", "chat", "tenant", "outcome"], default="mailbox")
+
+    for command in (lookup, stats):
+        command.add_argument("--mailbox", help="ящик")
+        command.add_argument("--since", help="с какого момента: 2026-10-19, 2026-10-19T09:00 (МСК), 24h, 7d")
+        command.add_argument("--until", help="до какого момента, в том же формате")
+
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("не задан DELIVERY_HISTORY_URL")
+
+    async def run():
+        engine = create_engine(args.url)
+        try:
+            await (_lookup if args.command == "lookup" else _stats)(engine, args)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
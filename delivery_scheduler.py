@@ -0,0 +1,277 @@
+import json
+import heapq
+import time
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramMigrateToChat
+from aiogram.types import BufferedInputFile
+
+from config import Config
+from utils import TokenBucket
+from tracing import Span
+from tenants import Tenant, current_tenant, use_tenant
+from recipients import (RecipientInactiveError, is_inactive, unreachable_reason, deactivate_recipient,
+                        migrate_recipient)
+from seatable_api import get_mailbox_priority
+from delivery_history import record_delivery
+from health import watchdog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 1.0
+
+
+class FileTooLargeError(ValueError):
+    """Файл больше лимита Telegram (TELEGRAM_MAX_FILE_MB)"""
+
+
+@dataclass(order=True)
+class DeliveryJob:
+    """Отправка одного файла в один чат. Сортируется по виртуальному времени окончания (finish_tag)."""
+    finish_tag: float
+    seq: int
+    mailbox: str = field(compare=False)
+    chat_id: str = field(compare=False)
+    filename: str = field(compare=False)
+    content: bytes = field(compare=False)
+    caption: str | None = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    trace: Span | None = field(default=None, compare=False)
+    # Адрес файла на диске для локального сервера Bot API (file://); без него файл загружается из памяти
+    path: str | None = field(default=None, compare=False)
+    # Размер файла: content пуст, если файл есть только на диске
+    size: int | None = field(default=None, compare=False)
+    # Тенант, в контексте которого поставлена отправка: его ботом она и уходит
+    tenant: Tenant = field(default_factory=current_tenant, compare=False)
+    queued_ns: int = field(default_factory=time.time_ns, compare=False)
+
+    def __post_init__(self):
+        if self.size is None:
+            self.size = len(self.content)
+
+    @property
+    def chat_key(self) -> tuple[str, str]:
+        # Лимиты Telegram считаются для каждого бота отдельно
+        return self.tenant.name, self.chat_id
+
+
+class DeliveryScheduler:
+    """Планировщик отправки отчетов в Telegram со взвешенной справедливой очередью (WFQ) по ящикам.
+
+    Каждая отправка получает виртуальное время окончания: max(текущее виртуальное время,
+    окончание предыдущей отправки того же ящика) + 1 / приоритет. Первой уходит отправка
+    с наименьшим временем, поэтому небольшая срочная рассылка с высоким приоритетом обгоняет
+    уже стоящую в очереди массовую рассылку другого ящика, а ящики с равным приоритетом
+    делят пропускную способность поровну.
+
+    Частота ограничена бюджетом Telegram (TELEGRAM_RATE_LIMIT сообщений в секунду на бота тенанта)
+    и минимальным интервалом между сообщениями в один чат. Очередь и воркеры общие для всех тенантов."""
+
+    def __init__(self):
+        self._queue: list[DeliveryJob] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        # Окончание последней отправки ящика: (тенант, ящик) -> виртуальное время
+        self._last_finish: dict[tuple[str, str], float] = {}
+        self._chat_ready_at: dict[tuple[str, str], float] = {}
+        self._busy_chats: set[tuple[str, str]] = set()
+        self._changed = asyncio.Event()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def submit(self, mailbox: str, chat_id: str, filename: str, content: bytes, caption: str | None,
+               priority: float = DEFAULT_PRIORITY, trace: Span | None = None, path: str | None = None,
+               size: int | None = None) -> asyncio.Future:
+        """Ставит отправку в очередь. Возвращает future, которое завершится после отправки
+        (или с исключением, если отправить не удалось). Если передан trace, отправка
+        записывается в него отдельным спаном вместе со временем ожидания в очереди.
+        path — адрес уже записанного на диск файла для локального сервера Bot API,
+        size — его размер, если content не передается."""
+        self._ensure_started()
+
+        # Ящики с одинаковым адресом у разных тенантов — разные очереди
+        tenant = current_tenant()
+        key = (tenant.name, mailbox)
+        start = max(self._virtual_time, self._last_finish.get(key, 0.0))
+        finish_tag = start + 1 / max(priority, 0.01)
+        self._last_finish[key] = finish_tag
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, DeliveryJob(finish_tag, next(self._seq), mailbox, str(chat_id), filename,
+                                                content, caption, future, trace, path, size, tenant))
+        self._changed.set()
+        return future
+
+    def _ensure_started(self):
+        if self._workers:
+            return
+        for i in range(Config.TELEGRAM_SEND_CONCURRENCY):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"delivery-worker-{i}"))
+
+    def _bucket(self, tenant: Tenant) -> TokenBucket:
+        if tenant.name not in self._buckets:
+            self._buckets[tenant.name] = TokenBucket(Config.TELEGRAM_RATE_LIMIT)
+        return self._buckets[tenant.name]
+
+    def _chat_interval(self, chat_id: str) -> float:
+        # У групп и каналов отрицательные id, лимит Telegram для них строже
+        return Config.TELEGRAM_GROUP_INTERVAL if chat_id.startswith("-") else Config.TELEGRAM_USER_INTERVAL
+
+    def _pop_ready(self) -> tuple[DeliveryJob | None, float | None]:
+        """Достает первую по порядку WFQ отправку, чат которой свободен и не упирается в лимит.
+        Если такой нет, возвращает, сколько ждать до освобождения ближайшего чата."""
+        now = time.monotonic()
+        skipped = []
+        job = None
+        wait = None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            ready_at = self._chat_ready_at.get(candidate.chat_key, 0.0)
+            if candidate.chat_key not in self._busy_chats and ready_at <= now:
+                job = candidate
+                break
+            skipped.append(candidate)
+            if candidate.chat_key not in self._busy_chats:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return job, wait
+
+    async def _next_job(self) -> DeliveryJob:
+        while True:
+            job, wait = self._pop_ready()
+            if job:
+                self._busy_chats.add(job.chat_key)
+                self._virtual_time = max(self._virtual_time, job.finish_tag)
+                return job
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            # Недоступные получатели, переезды групп и SeaTable — того тенанта, чья это отправка
+            with use_tenant(job.tenant):
+                try:
+                    await self._send(job)
+                except Exception as e:
+                    # Воркер не должен умирать: иначе каждая такая ошибка навсегда уменьшает число параллельных отправок
+                    logger.error(f"[{job.mailbox}] Ошибка планировщика при отправке в чат {job.chat_id}: {e}", exc_info=True)
+
+    async def _send(self, job: DeliveryJob):
+        chat_key = job.chat_key
+        started_ns = time.time_ns()
+        retry = False
+        span = None
+        try:
+            # Получатель мог стать недоступным, пока отправка стояла в очереди
+            if is_inactive(job.chat_id):
+                raise RecipientInactiveError(f"получатель {job.chat_id} помечен недоступным")
+            # Telegram все равно отклонит файл больше лимита — не тратим время на загрузку
+            if job.size > Config.TELEGRAM_MAX_FILE_MB * 1024 * 1024:
+                raise FileTooLargeError(f"файл {job.filename} больше {Config.TELEGRAM_MAX_FILE_MB} МБ")
+
+            await self._bucket(job.tenant).acquire()
+            if job.trace:
+                span = job.trace.child("telegram.send_document", mailbox=job.mailbox, chat_id=job.chat_id,
+                                       filename=job.filename, bytes=job.size,
+                                       queue_wait_ms=(started_ns - job.queued_ns) // 1_000_000)
+            # Зависшую отправку watchdog отменит через TELEGRAM_SEND_TIMEOUT секунд
+            await watchdog.guard(
+                f"telegram.send_document {job.chat_id} ({job.mailbox})",
+                job.tenant.bot.send_document(
+                    chat_id=job.chat_id,
+                    document=job.path or BufferedInputFile(job.content, filename=job.filename),
+                    caption=job.caption if job.caption else None,
+                    # Большой файл грузится дольше стандартных 60 секунд сессии
+                    request_timeout=int(Config.TELEGRAM_SEND_TIMEOUT),
+                ),
+                Config.TELEGRAM_SEND_TIMEOUT,
+            )
+            # Ожидающий отправку мог быть отменен — тогда результат уже некому передавать
+            if not job.future.done():
+                job.future.set_result(None)
+            if span:
+                span.end()
+            self._record(job, started_ns, "sent")
+        except TelegramRetryAfter as e:
+            if span:
+                span.end(error=e)
+            self._record(job, started_ns, "retry", e)
+            # Telegram просит подождать — возвращаем отправку в очередь с тем же местом
+            logger.warning(f"[{job.mailbox}] Лимит Telegram для чата {job.chat_id}, повтор через {e.retry_after} с")
+            self._chat_ready_at[chat_key] = time.monotonic() + e.retry_after
+            heapq.heappush(self._queue, job)
+            retry = True
+        except TelegramMigrateToChat as e:
+            if span:
+                span.end(error=e)
+            self._record(job, started_ns, "migrated", e)
+            # Группа стала супергруппой — запоминаем новый id и отправляем туда же, не теряя места в очереди
+            await migrate_recipient(job.chat_id, str(e.migrate_to_chat_id))
+            job.chat_id = str(e.migrate_to_chat_id)
+            heapq.heappush(self._queue, job)
+            retry = True
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            if span:
+                span.end(error=e)
+            self._record(job, started_ns, "skipped" if isinstance(e, RecipientInactiveError) else "failed", e)
+            reason = unreachable_reason(e)
+            if reason:
+                await deactivate_recipient(job.chat_id, reason)
+        finally:
+            self._busy_chats.discard(chat_key)
+            if not retry:
+                self._chat_ready_at[chat_key] = time.monotonic() + self._chat_interval(chat_key[1])
+            self._changed.set()
+
+    @staticmethod
+    def _record(job: DeliveryJob, started_ns: int, outcome: str, error: Exception | None = None):
+        """Записывает попытку отправки в историю доставки. Задержка считается от прихода отчета (начала трассы)."""
+        trace = job.trace
+        record_delivery(
+            tenant=job.tenant.name, mailbox=job.mailbox, chat_id=job.chat_id, filename=job.filename,
+            subject=job.caption, bytes=job.size, outcome=outcome,
+            uid=trace.attributes.get("uid") if trace else None,
+            trace_id=trace.trace_id if trace else None,
+            queue_wait_ms=(started_ns - job.queued_ns) // 1_000_000,
+            latency_ms=(time.time_ns() - trace.start_ns) // 1_000_000 if trace else None,
+            error=str(error) if error else None,
+        )
+
+
+async def get_delivery_priority(mailbox: str, subject: str) -> float:
+    """Приоритет рассылки: наибольший из приоритета ящика (колонка priority в Mailboxes)
+    и приоритетов, заданных для фрагментов темы в DELIVERY_SUBJECT_PRIORITIES."""
+    priorities = [DEFAULT_PRIORITY]
+
+    mailbox_priority = await get_mailbox_priority(mailbox)
+    if mailbox_priority is not None:
+        priorities = [mailbox_priority]
+
+    for fragment, priority in _subject_priorities().items():
+        if fragment.lower() in (subject or "").lower():
+            priorities.append(float(priority))
+
+    return max(priorities)
+
+
+def _subject_priorities() -> dict[str, float]:
+    try:
+        return json.loads(Config.DELIVERY_SUBJECT_PRIORITIES or "{}")
+    except ValueError:
+        logger.error("Некорректный DELIVERY_SUBJECT_PRIORITIES, ожидается JSON-объект {\"фрагмент темы\": приоритет}")
+        return {}
+
+
+delivery_scheduler = DeliveryScheduler()
@@ -0,0 +1,176 @@
+import sys
+import time
+import signal
+import asyncio
+import cProfile
+import logging
+import pstats
+import threading
+import traceback
+import tracemalloc
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Diagnostics:
+    """Режим диагностики цикла событий. Включается через DIAGNOSTICS_ENABLED.
+    - asyncio debug: в лог пишутся колбэки, которые выполнялись дольше SLOW_CALLBACK_THRESHOLD секунд;
+    - отдельный поток раз в DIAGNOSTICS_SAMPLE_INTERVAL секунд сохраняет стеки потоков и корутин,
+      а если цикл событий не ответил за порог — сохраняет стек потока цикла в момент зависания;
+    - по SIGUSR1 сохраняется снимок памяти tracemalloc, по SIGUSR2 включается/выключается cProfile.
+    Все срезы пишутся в папку DIAGNOSTICS_DIR."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.threshold = Config.SLOW_CALLBACK_THRESHOLD
+        self.directory = Path(Config.DIAGNOSTICS_DIR)
+        self._loop_thread_id = threading.get_ident()
+        self._profiler: cProfile.Profile | None = None
+        self._samples_logger = logging.getLogger("diagnostics.samples")
+        self._handler: logging.Handler | None = None
+        self._sampler_thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def enable(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Срезы стеков пишем в отдельный файл, чтобы не засорять основной лог
+        handler = RotatingFileHandler(
+            self.directory / "samples.log",
+            maxBytes=10 * 1024 * 1024,
+            backupCount=3,
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        self._handler = handler
+        self._samples_logger.addHandler(handler)
+        self._samples_logger.propagate = False
+        self._samples_logger.setLevel(logging.INFO)
+
+        self.loop.set_debug(True)
+        self.loop.slow_callback_duration = self.threshold
+        logging.getLogger('asyncio').setLevel(logging.WARNING)
+
+        tracemalloc.start(Config.DIAGNOSTICS_TRACEMALLOC_FRAMES)
+
+        if hasattr(signal, "SIGUSR1"):
+            self.loop.add_signal_handler(signal.SIGUSR1, self.dump_memory_snapshot)
+            self.loop.add_signal_handler(signal.SIGUSR2, self.toggle_profiler)
+
+        self._stopped.clear()
+        self._sampler_thread = threading.Thread(target=self._sampler, name="diagnostics-sampler", daemon=True)
+        self._sampler_thread.start()
+        logger.info(f"Режим диагностики включен: порог медленных колбэков {self.threshold} с, "
+                    f"срезы в {self.directory.resolve()}")
+
+    def disable(self):
+        """Выключает режим диагностики при остановке бота: останавливает поток срезов, снимает обработчики
+        сигналов и сохраняет незавершенный профиль. Вызывается из потока цикла событий."""
+        self._stopped.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join(timeout=self.threshold + 2)
+            self._sampler_thread = None
+
+        if hasattr(signal, "SIGUSR1"):
+            self.loop.remove_signal_handler(signal.SIGUSR1)
+            self.loop.remove_signal_handler(signal.SIGUSR2)
+        if self._profiler is not None:
+            self.toggle_profiler()
+
+        tracemalloc.stop()
+        self.loop.set_debug(False)
+        if self._handler is not None:
+            self._samples_logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+        logger.info("Режим диагностики выключен")
+
+    def _sampler(self):
+        """Периодически снимает стеки и проверяет, не заблокирован ли цикл событий."""
+        while not self._stopped.wait(Config.DIAGNOSTICS_SAMPLE_INTERVAL):
+
+            responded = threading.Event()
+            started = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(responded.set)
+            except RuntimeError:
+                return  # цикл событий закрыт
+
+            if not responded.wait(self.threshold):
+                # Снимаем стек именно сейчас, пока цикл событий стоит на блокирующем вызове
+                self._write_sample(f"Цикл событий не отвечает дольше {self.threshold} с")
+                # Цикл событий может и не ответить, если его остановили, — тогда поток тоже завершается
+                while not responded.wait(1):
+                    if self._stopped.is_set() or self.loop.is_closed():
+                        return
+                logger.warning(f"Цикл событий был заблокирован {time.monotonic() - started:.3f} с, "
+                               f"стек сохранен в {self.directory / 'samples.log'}")
+            else:
+                self._write_sample("Периодический срез")
+
+    def _write_sample(self, reason: str):
+        lines = [f"===== {reason} ====="]
+
+        frames = sys._current_frames()
+        for thread in threading.enumerate():
+            frame = frames.get(thread.ident)
+            if frame is None:
+                continue
+            marker = " (цикл событий)" if thread.ident == self._loop_thread_id else ""
+            lines.append(f"--- Поток {thread.name}{marker}")
+            lines.extend(line.rstrip() for line in traceback.format_stack(frame))
+
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            tasks = set()
+        lines.append(f"--- Корутины: {len(tasks)}")
+        for task in tasks:
+            lines.append(f"* {task.get_name()}: {task.get_coro()!r}")
+            for frame in task.get_stack(limit=5):
+                lines.append(f"    {frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}")
+
+        self._samples_logger.info("\n".join(lines))
+
+    def dump_memory_snapshot(self):
+        """Сохраняет снимок памяти tracemalloc и пишет в лог самые крупные места выделения."""
+        path = self.directory / f"tracemalloc-{datetime.now():%Y%m%d-%H%M%S}.snapshot"
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(str(path))
+
+        current, peak = tracemalloc.get_traced_memory()
+        logger.info(f"Снимок памяти сохранен в {path}: текущая {current / 1024 / 1024:.1f} МБ, "
+                    f"пик {peak / 1024 / 1024:.1f} МБ")
+        for stat in snapshot.statistics("lineno")[:10]:
+            logger.info(f"  {stat}")
+
+    def toggle_profiler(self):
+        """Первый вызов включает cProfile в потоке цикла событий, второй — выключает и сохраняет результат."""
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            logger.info("cProfile включен, повторный SIGUSR2 сохранит результат")
+            return
+
+        self._profiler.disable()
+        path = self.directory / f"profile-{datetime.now():%Y%m%d-%H%M%S}.prof"
+        self._profiler.dump_stats(str(path))
+        stats_path = path.with_suffix(".txt")
+        with open(stats_path, "w", encoding="utf-8") as stream:
+            pstats.Stats(str(path), stream=stream).sort_stats("cumulative").print_stats(50)
+        self._profiler = None
+        logger.info(f"Профиль сохранен в {path} (сводка: {stats_path})")
+
+
+def setup_diagnostics(loop: asyncio.AbstractEventLoop) -> Diagnostics | None:
+    """Включает режим диагностики, если он задан в настройках. Вызывается из потока цикла событий."""
+    if not Config.DIAGNOSTICS_ENABLED:
+        return None
+    diagnostics = Diagnostics(loop)
+    diagnostics.enable()
+    return diagnostics
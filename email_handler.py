@@ -2,19 +2,36 @@ import os
 import time
 import asyncio
 import logging
+import threading
+import contextvars
+import concurrent.futures
 import email.utils
+from pathlib import Path
 
-from bot import bot
+from config import Config
+from utils import Backoff
+from tracing import Span
+from health import watchdog, interrupt_connection
 from seatable_api import get_last_uid, update_last_uid, get_users_to_send, get_chats_to_send
-from aiogram.types import BufferedInputFile
-from imap_tools import MailBox, AND
+from delivery_scheduler import delivery_scheduler, get_delivery_priority
+from recipients import RecipientInactiveError, filter_active, unreachable_reason
+from tenants import current_tenant
+from telegram_spool import spool_enabled, write_spool, remove_spool, local_uri
+from imap_tools import MailBox, AND, MailMessageFlags
+from imap_partial_fetch import fetch_report_parts
 from email.header import decode_header
-from datetime import timezone, timedelta
+from datetime import datetime, timezone, timedelta
 
 
 logger = logging.getLogger(__name__)
 
 
+def report_subject(subject: str, formatted_date: str) -> str:
+    """Тема рассылки: без метки [Superset] и с датой отчета"""
+    subject = subject.replace('[Superset]', '').strip()
+    return f"{subject} {formatted_date}" if subject else formatted_date
+
+
 async def handle_email(email_msg):
     """
     Извлекает из письма тему и вложения (только PDF и PNG файлы).
@@ -43,8 +60,7 @@ async def handle_email(email_msg):
         subject = ' '.join(decoded_subject)
 
         # Обрабатываем тему: удаляем [Superset] и добавляем дату
-        subject = subject.replace('[Superset]', '').strip()
-        subject = f"{subject} {formatted_date}" if subject else formatted_date
+        subject = report_subject(subject, formatted_date)
         logger.info(f"Обработанная тема письма: {subject}")
 
         attachments = []
@@ -139,122 +155,499 @@ async def handle_email(email_msg):
 
 
 
-async def distribute_attachments(email: str, subject: str, attachments: list[tuple[str, bytes]],
-                                 loop: asyncio.AbstractEventLoop):
-    """Рассылает вложения пользователям, подписанным на указанный email"""
+async def distribute_attachments(email: str, subject: str, attachments: list[tuple[str, bytes | Path]],
+                                 loop: asyncio.AbstractEventLoop, trace: Span | None = None) -> bool:
+    """Рассылает вложения пользователям, подписанным на указанный email.
+    Вложение — содержимое файла или, для локального сервера Bot API, уже записанный в TELEGRAM_SPOOL_DIR файл
+    (так HTTP API передает загрузку, не читая ее в память); такие файлы удаляются после рассылки.
+    trace — спан обработки письма, к которому добавляются этапы поиска получателей и отправки.
+    Возвращает True, если все отправки завершились (недоступные получатели не считаются ошибкой)."""
+    own_trace = trace is None
+    if own_trace:
+        trace = Span("report", mailbox=email, subject=subject)
+    spooled = [content for _, content in attachments if isinstance(content, Path)]
+    deliveries = []
+
     try:
-        # Получаем список telegram_id пользователей
-        telegram_users_ids = await get_users_to_send(email)
-        # Получаем список telegram_id групп
-        telegram_chats_ids = await get_chats_to_send(email)
+        with trace.child("resolve_recipients", mailbox=email) as span:
+            # Получаем список telegram_id пользователей
+            telegram_users_ids = await get_users_to_send(email)
+            # Получаем список telegram_id групп
+            telegram_chats_ids = await get_chats_to_send(email)
 
-        telegram_ids = telegram_users_ids + telegram_chats_ids
+            # Пропускаем недоступных получателей, переехавшие группы заменяем новыми id
+            telegram_ids = filter_active(telegram_users_ids + telegram_chats_ids)
+            span.set_attribute("recipients", len(telegram_ids))
+        trace.set_attribute("recipients", len(telegram_ids))
 
         if not telegram_ids:
             logger.error(f"[{email}] Нет подписчиков или групп для рассылки")
-            return
-
-        # Рассылаем вложения
-        for telegram_id in telegram_ids:
-            for filename, content in attachments:
-                try:
-                    await bot.send_document(
-                        chat_id=telegram_id,
-                        document=BufferedInputFile(content, filename=filename),
-                        caption=subject if subject else None
-                    )
-                    logger.info(f"[{email}] Отправлено пользователю {telegram_id}: {filename}")
-                except Exception as e:
-                    logger.error(f"[{email}] Ошибка отправки пользователю {telegram_id}: {e}")
+            return False
+
+        # Для локального сервера Bot API каждое вложение один раз пишется на диск и отправляется всем по пути
+        paths = [None] * len(attachments)
+        if spool_enabled():
+            with trace.child("spool", attachments=len(attachments)):
+                for i, (filename, content) in enumerate(attachments):
+                    if not isinstance(content, Path):
+                        content = await asyncio.to_thread(write_spool, filename, content)
+                        spooled.append(content)
+                    paths[i] = local_uri(content)
+        sizes = [content.stat().st_size if isinstance(content, Path) else len(content) for _, content in attachments]
+
+        # Ставим вложения в очередь планировщика с приоритетом ящика/темы
+        priority = await get_delivery_priority(email, subject)
+        deliveries = [
+            (telegram_id, filename,
+             delivery_scheduler.submit(email, telegram_id, filename, content if isinstance(content, bytes) else b"",
+                                       subject, priority, trace, path, size))
+            for telegram_id in telegram_ids
+            for (filename, content), path, size in zip(attachments, paths, sizes)
+        ]
+
+        delivered = True
+        for telegram_id, filename, delivery in deliveries:
+            try:
+                # shield: если рассылку отменят, отправка останется в очереди, а ее future — незавершенным
+                await asyncio.shield(delivery)
+                logger.info(f"[{email}] Отправлено пользователю {telegram_id}: {filename}")
+            except RecipientInactiveError as e:
+                logger.info(f"[{email}] Пропущен получатель {telegram_id}: {e}")
+            except Exception as e:
+                logger.error(f"[{email}] Ошибка отправки пользователю {telegram_id}: {e}")
+                if not unreachable_reason(e):
+                    delivered = False
+
+        return delivered
 
     except Exception as e:
         logger.error(f"[{email}] Критическая ошибка рассылки: {str(e)}", exc_info=True)
+        if own_trace:
+            trace.end(error=e)
+        return False
 
+    finally:
+        # Файлы нужны серверу Bot API, пока не завершатся все отправки. Если рассылку отменили,
+        # поставленные отправки остаются в очереди планировщика, поэтому удаление ждет их future
+        if spooled:
+            pending = asyncio.gather(*(delivery for _, _, delivery in deliveries), return_exceptions=True)
+            pending.add_done_callback(lambda _: _remove_spooled(spooled))
+        if own_trace:
+            trace.end()
 
-async def resend_report(message, account_email: str, loop: asyncio.AbstractEventLoop):
+
+def _remove_spooled(paths: list[Path]):
+    for path in paths:
+        remove_spool(path)
+
+
+# Фоновые рассылки отчетов, принятых не через IMAP: держим ссылки, чтобы задачи не собрал сборщик мусора
+_background_deliveries: set[asyncio.Task] = set()
+
+
+async def _deliver(email: str, subject: str, attachments: list[tuple[str, bytes | Path]], trace: Span):
+    try:
+        delivered = await distribute_attachments(email, subject, attachments, asyncio.get_running_loop(), trace)
+        trace.set_attribute("delivered", delivered)
+        logger.info(f"[{email}] Отчет «{subject}» разослан: {delivered}")
+    except Exception as e:
+        logger.error(f"[{email}] Ошибка рассылки отчета: {e}", exc_info=True)
+        trace.end(error=e)
+    finally:
+        trace.end()
+
+
+def schedule_delivery(email: str, subject: str, attachments: list[tuple[str, bytes | Path]], trace: Span) -> asyncio.Task:
+    """Запускает рассылку в фоне, не дожидаясь отправки. Спан trace закрывается по ее завершении."""
+    task = asyncio.create_task(_deliver(email, subject, attachments, trace))
+    _background_deliveries.add(task)
+    task.add_done_callback(_background_deliveries.discard)
+    return task
+
+
+async def resend_report(message, account_email: str, loop: asyncio.AbstractEventLoop, trace: Span | None = None):
     """Запускает пересылку PDF-вложения и запускает обновление last_uid (последнего обработанного письма)"""
+    trace = trace or Span("report", mailbox=account_email, uid=str(message.uid))
     try:
         print(f"[{account_email}] Обработка письма UID={message.uid}, тема: {message.subject}")
 
         # Обработка письма и извлечение данных
-        subject, attachments = await handle_email(message.obj)
+        with trace.child("handle_email") as span:
+            subject, attachments = await handle_email(message.obj)
+            span.set_attribute("attachments", len(attachments))
+            span.set_attribute("bytes", sum(len(content) for _, content in attachments))
+        trace.set_attribute("subject", subject)
 
         # Пересылка пользователям из БД
         if attachments:
-            await distribute_attachments(account_email, subject, attachments, loop)
+            delivered = await distribute_attachments(account_email, subject, attachments, loop, trace)
 
             # Обновляем last_uid, если вложения были успешно отправлены
-            await update_last_uid(account_email, str(message.uid))
+            with trace.child("checkpoint", uid=str(message.uid)):
+                checkpointed = await update_last_uid(account_email, str(message.uid))
+
+            # Письмо можно убрать из INBOX только после подтвержденной доставки
+            if delivered and checkpointed:
+                _mark_processed(account_email, message.uid)
         else:
             print(f"[{account_email}] Вложений нет, рассылка не требуется.")
+            _mark_processed(account_email, message.uid)
 
     except Exception as e:
         print(f"[{account_email}] Ошибка обработки письма UID={message.uid}: {e}")
+        trace.end(error=e)
 
+    finally:
+        trace.end()
 
-def imap_idle_listener(account, loop):
-    """Слушает входящие письма на одном почтовом аккаунте через IMAP IDLE."""
-    while True:
+
+def _start_trace(message, account_email: str, detected_ns: int, fetch_started_ns: int, fetch_finished_ns: int) -> Span:
+    """Открывает трассу обработки письма и записывает этапы, прошедшие в потоке IMAP:
+    от даты письма (заголовок Date) до обнаружения ботом и выборку письма с сервера."""
+    try:
+        arrived_ns = int(email.utils.parsedate_to_datetime(message.obj['Date']).timestamp() * 1e9)
+    except (TypeError, ValueError):
+        arrived_ns = detected_ns
+
+    trace = Span("report", start_ns=min(arrived_ns, detected_ns), mailbox=account_email, uid=str(message.uid))
+    trace.child("imap.arrival", start_ns=arrived_ns,
+                detection_delay_ms=(detected_ns - arrived_ns) // 1_000_000).end(end_ns=detected_ns)
+    trace.child("imap.fetch", start_ns=fetch_started_ns, mailbox=account_email,
+                bytes=message.size).end(end_ns=fetch_finished_ns)
+    return trace
+
+
+def _call_in_loop(coro, loop: asyncio.AbstractEventLoop):
+    """Выполняет корутину в цикле событий и ждет результат из потока не дольше WATCHDOG_CALL_TIMEOUT секунд.
+    По таймауту корутина отменяется: иначе она продолжила бы работать, хотя результат уже никто не ждет."""
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout=Config.WATCHDOG_CALL_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+# Если соединение для выборки простаивало дольше этого времени, перед использованием проверяем его NOOP
+_FETCH_KEEPALIVE_SECONDS = 60
+
+# Выборщики писем: (тенант, адрес ящика) -> выборщик. Через них обработанные письма передаются на архивацию
+_fetchers: dict[tuple[str, str], "MailboxFetcher"] = {}
+
+# IMAP-ключевое слово, которым отмечаются письма с подтвержденной доставкой. Отметка хранится на сервере,
+# поэтому архивация находит доставленные письма и после перезапуска бота
+DELIVERED_KEYWORD = "$Delivered"
+
+
+def imap_ready_name(email: str) -> str:
+    """Имя проверки готовности IMAP-ящика текущего тенанта: у разных тенантов могут быть одноименные ящики"""
+    return f"imap:{current_tenant().name}:{email}"
+
+
+def _mark_processed(account_email: str, uid):
+    fetcher = _fetchers.get((current_tenant().name, account_email))
+    if fetcher:
+        fetcher.mark_processed(uid)
+
+
+def _login(account) -> MailBox:
+    """Открывает IMAP-соединение с ящиком и выбирает папку INBOX."""
+    return MailBox(account["imap"]).login(account["email"], account["password"], initial_folder='INBOX')
+
+
+class MailboxFetcher:
+    """Выборка и рассылка писем одного ящика через отдельное, постоянно открытое соединение.
+    Работает в своём потоке и просыпается по сигналу от IDLE-соединения, поэтому письмо,
+    пришедшее во время выборки или рассылки, замечается сразу, а не на следующем цикле IDLE."""
+
+    def __init__(self, account, loop: asyncio.AbstractEventLoop):
+        self.account = account
+        self.loop = loop
+        self._wakeup = threading.Event()
+        self._mailbox: MailBox | None = None
+        self._last_used = 0.0
+        # Наибольший UID, уже переданный на рассылку (last_uid в SeaTable обновляется с задержкой)
+        self._dispatched_uid: int | None = None
+        self._backoff = Backoff(max_delay=Config.IMAP_RECONNECT_MAX_DELAY)
+        # Когда пришло первое еще не обработанное уведомление (для трассировки)
+        self._woken_at_ns: int | None = None
+        # Письма с подтвержденной доставкой, которым еще не поставлено ключевое слово DELIVERED_KEYWORD
+        self._processed_uids: list[str] = []
+        self._processed_lock = threading.Lock()
+        self._last_archived = time.monotonic()
+        self._archive_folder_ready = False
+        # Контекст (тенант) для потока выборки и его перезапусков
+        self._context = contextvars.copy_context()
+        self._thread: threading.Thread | None = None
+        self._name = f"imap-fetch:{current_tenant().name}:{account['email']}"
+
+    def start(self):
+        """Запускает поток выборки под наблюдением watchdog"""
+        watchdog.register(self._name, Config.WATCHDOG_IMAP_TIMEOUT, restart=self.restart)
+        self._thread = threading.Thread(target=self._context.copy().run, args=(self.run,),
+                                        name=self._name, daemon=True)
+        self._thread.start()
+
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def restart(self):
+        """Вызывается watchdog, если поток не прислал heartbeat: обрывает зависшее соединение,
+        а если поток завершился — запускает новый."""
+        if not self.alive():
+            logger.warning(f"[{self.account['email']}] Поток выборки остановился, запускаем заново")
+            self.start()
+            self.wake()
+        elif interrupt_connection(self._mailbox):
+            logger.warning(f"[{self.account['email']}] Поток выборки завис, соединение оборвано")
+
+    def wake(self):
+        """Сигнал о том, что в ящике могли появиться новые письма."""
+        if self._woken_at_ns is None:
+            self._woken_at_ns = time.time_ns()
+        self._wakeup.set()
+
+    def mark_processed(self, uid):
+        """Письмо обработано и доставлено — его можно архивировать. Вызывается из цикла событий.
+        Поток выборки просыпается (без выборки писем) и сразу отмечает письмо на сервере."""
+        if Config.IMAP_ARCHIVE_MODE in ("move", "expunge"):
+            with self._processed_lock:
+                self._processed_uids.append(str(uid))
+            self._wakeup.set()
+
+    def run(self):
+        # Поток просыпается по уведомлению, а по таймеру — для heartbeat и архивации
+        timeout = _FETCH_KEEPALIVE_SECONDS
+        if Config.IMAP_ARCHIVE_MODE:
+            timeout = min(timeout, Config.IMAP_ARCHIVE_INTERVAL)
+        while True:
+            watchdog.beat(self._name, expect=timeout)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            # Время уведомления задано, только если будил wake(): mark_processed будит поток без выборки
+            detected_ns, self._woken_at_ns = self._woken_at_ns, None
+            watchdog.beat(self._name)
+            try:
+                if detected_ns is not None:
+                    self._fetch_new_messages(detected_ns)
+                self._flag_delivered()
+                self._archive()
+                self._backoff.reset()
+            except Exception as e:
+                delay = self._backoff.next_delay()
+                logger.error(f"[{self.account['email']}] Ошибка выборки писем: {e}. Повтор через {delay:.1f} с")
+                self._close()
+                watchdog.beat(self._name, expect=delay)
+                time.sleep(delay)
+                self.wake()
+
+    def _connection(self) -> MailBox:
+        """Возвращает открытое соединение для выборки, при необходимости проверяя или переоткрывая его."""
+        if self._mailbox is not None and time.monotonic() - self._last_used > _FETCH_KEEPALIVE_SECONDS:
+            try:
+                self._mailbox.client.noop()
+            except Exception:
+                logger.info(f"[{self.account['email']}] Соединение для выборки устарело, переподключаемся")
+                self._close()
+
+        if self._mailbox is None:
+            self._mailbox = _login(self.account)
+            logger.info(f"[{self.account['email']}] Открыто соединение для выборки писем")
+
+        self._last_used = time.monotonic()
+        return self._mailbox
+
+    def _close(self):
+        if self._mailbox is None:
+            return
         try:
-            with MailBox(account["imap"]).login(account["email"], account["password"]) as mailbox:
-                mailbox.folder.set('INBOX')
-                print(f"[{account['email']}] Подключен, выбрана папка INBOX. Ожидание писем...")
+            self._mailbox.logout()
+        except Exception:
+            pass
+        self._mailbox = None
+
+    def _flag_delivered(self):
+        """Ставит письмам с подтвержденной доставкой ключевое слово DELIVERED_KEYWORD.
+        Архивация ищет письма по нему, а не по списку в памяти, который теряется при перезапуске."""
+        with self._processed_lock:
+            uids, self._processed_uids = self._processed_uids, []
+        if not uids:
+            return
 
-                while True:
-                    print(f"[{account['email']}] Вошли в режим IDLE")
-                    for _ in mailbox.idle.wait(timeout=300):  # Ждём новые письма до 5 минут
-                        break
+        try:
+            self._connection().flag(uids, DELIVERED_KEYWORD, True, chunks=Config.IMAP_ARCHIVE_BATCH)
+        except Exception:
+            # Вернем письма в очередь, отметка повторится после переподключения
+            with self._processed_lock:
+                self._processed_uids[:0] = uids
+            raise
+
+    def _archive(self):
+        """Раз в IMAP_ARCHIVE_INTERVAL секунд убирает обработанные письма из INBOX пакетами,
+        чтобы поиск и переподключение не замедлялись по мере роста ящика:
+        move — переносит письма с ключевым словом DELIVERED_KEYWORD в IMAP_ARCHIVE_FOLDER (UID MOVE),
+        expunge — удаляет такие письма старше IMAP_RETENTION_DAYS."""
+        if not Config.IMAP_ARCHIVE_MODE or time.monotonic() - self._last_archived < Config.IMAP_ARCHIVE_INTERVAL:
+            return
+        self._last_archived = time.monotonic()
 
-                    # Получаем все непрочитанные письма
-                    messages = list(mailbox.fetch(AND(seen=False)))
+        if Config.IMAP_ARCHIVE_MODE == "move":
+            self._move_processed()
+        elif Config.IMAP_ARCHIVE_MODE == "expunge":
+            self._expunge_expired()
+        else:
+            logger.error(f"Неизвестный IMAP_ARCHIVE_MODE: {Config.IMAP_ARCHIVE_MODE}")
 
-                    if not messages:
-                        print(f"[{account['email']}] Нет непрочитанных писем. Ожидание новых.")
-                        continue
+    def _move_processed(self):
+        mailbox = self._connection()
+        uids = mailbox.uids(AND(keyword=DELIVERED_KEYWORD))
+        if not uids:
+            return
 
-                    # Получаем последний обработанный UID
-                    last_uid = asyncio.run_coroutine_threadsafe(
-                        get_last_uid(account['email']), loop
-                    ).result()
-
-                    # Преобразуем к int, если значение есть
-                    last_uid = int(last_uid) if last_uid is not None else None
-
-                    if last_uid is None:
-                        # Обрабатываем только самое свежее письмо
-                        latest_message = max(messages, key=lambda m: int(m.uid))
-                        print(f"[{account['email']}] Первая инициализация. Обрабатываем письмо UID={latest_message.uid}")
-
-                        asyncio.run_coroutine_threadsafe(
-                            resend_report(latest_message, account['email'], loop),
-                            loop
-                        )
-                        # После обработки обновим last_uid
-                        asyncio.run_coroutine_threadsafe(
-                            update_last_uid(account['email'], str(latest_message.uid)), loop
-                        )
-                        continue
+        if not self._archive_folder_ready:
+            if not mailbox.folder.exists(Config.IMAP_ARCHIVE_FOLDER):
+                mailbox.folder.create(Config.IMAP_ARCHIVE_FOLDER)
+            self._archive_folder_ready = True
+        mailbox.move(uids, Config.IMAP_ARCHIVE_FOLDER, chunks=Config.IMAP_ARCHIVE_BATCH)
+        logger.info(f"[{self.account['email']}] Перенесено в {Config.IMAP_ARCHIVE_FOLDER}: {len(uids)} писем")
+
+    def _expunge_expired(self):
+        """Удаляет только письма с подтвержденной доставкой (как и move): last_uid сдвигается и после
+        неудачной рассылки, а письма с меньшим UID могли вовсе не обрабатываться."""
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=Config.IMAP_RETENTION_DAYS)
+        mailbox = self._connection()
+        uids = mailbox.uids(AND(keyword=DELIVERED_KEYWORD, date_lt=cutoff))
+        if not uids:
+            return
 
-                    # Фильтруем только новые письма
-                    unseen_messages = [m for m in messages if int(m.uid) > last_uid]
-                    if any(int(m.uid) < last_uid for m in messages):
-                        print(
-                            f"[{account['email']}] ERROR: Обнаружены письма с UID меньше последнего обработанного ({last_uid}). Они будут проигнорированы.")
+        mailbox.delete(uids, chunks=Config.IMAP_ARCHIVE_BATCH)
+        logger.info(f"[{self.account['email']}] Удалено писем старше {Config.IMAP_RETENTION_DAYS} дн.: {len(uids)}")
 
-                    if not unseen_messages:
-                        print(f"[{account['email']}] Новых непрочитанных писем нет.")
-                        continue
+    def _fetch_new_messages(self, detected_ns: int):
+        email_addr = self.account['email']
+
+        # Получаем все непрочитанные письма
+        mailbox = self._connection()
+        fetch_started_ns = time.time_ns()
+        partial = Config.IMAP_FETCH_MODE == 'bodystructure'
+        if partial:
+            # Сначала только UID: тела скачиваются после фильтра по last_uid и только нужные части
+            messages = {}
+            uids = sorted(int(uid) for uid in mailbox.uids(AND(seen=False)))
+        else:
+            messages = {int(m.uid): m for m in mailbox.fetch(AND(seen=False))}
+            uids = sorted(messages)
+        self._last_used = time.monotonic()
 
-                    # Сортируем по UID (на всякий случай)
-                    unseen_messages.sort(key=lambda m: int(m.uid))
+        if not uids:
+            logger.info(f"[{email_addr}] Нет непрочитанных писем. Ожидание новых.")
+            return
+
+        # Получаем последний обработанный UID
+        last_uid = _call_in_loop(get_last_uid(email_addr), self.loop)
+
+        # Преобразуем к int, если значение есть
+        last_uid = int(last_uid) if last_uid is not None else None
+
+        first_init = last_uid is None and self._dispatched_uid is None
+        if first_init:
+            # Обрабатываем только самое свежее письмо
+            new_uids = uids[-1:]
+            logger.info(f"[{email_addr}] Первая инициализация. Обрабатываем письмо UID={new_uids[0]}")
+        else:
+            last_uid = max(uid for uid in (last_uid, self._dispatched_uid) if uid is not None)
+
+            # Фильтруем только новые письма
+            new_uids = [uid for uid in uids if uid > last_uid]
+            if any(uid < last_uid for uid in uids):
+                logger.error(f"[{email_addr}] Обнаружены письма с UID меньше последнего обработанного ({last_uid}). "
+                             f"Они будут проигнорированы.")
+
+            if not new_uids:
+                logger.info(f"[{email_addr}] Новых непрочитанных писем нет.")
+                if partial:
+                    mailbox.flag([str(uid) for uid in uids], MailMessageFlags.SEEN, True)
+                return
+
+        if partial:
+            messages = fetch_report_parts(mailbox, new_uids)
+            # BODY.PEEK не ставит \Seen — отмечаем прочитанными сами, как это делает полная выборка
+            mailbox.flag([str(uid) for uid in uids], MailMessageFlags.SEEN, True)
+        fetch_finished_ns = time.time_ns()
+        self._last_used = time.monotonic()
+
+        # Обрабатываем каждое новое письмо
+        for uid in new_uids:
+            self._dispatched_uid = uid
+            message = messages.get(uid)
+            if message is None:
+                # Вложений-отчетов нет, тело не скачивалось: last_uid не двигаем, как и для писем без вложений
+                self.mark_processed(uid)
+                continue
+            trace = _start_trace(message, email_addr, detected_ns, fetch_started_ns, fetch_finished_ns)
+            asyncio.run_coroutine_threadsafe(resend_report(message, email_addr, self.loop, trace), self.loop)
+
+        if first_init:
+            # После обработки обновим last_uid
+            asyncio.run_coroutine_threadsafe(update_last_uid(email_addr, str(new_uids[0])), self.loop)
 
-                    # Обрабатываем каждое новое письмо
-                    for message in unseen_messages:
-                        asyncio.run_coroutine_threadsafe(
-                            resend_report(message, account['email'], loop),
-                            loop
-                        )
+
+def imap_idle_listener(account, loop):
+    """Слушает входящие письма на одном почтовом аккаунте через IMAP IDLE.
+    IDLE-соединение только ждёт уведомлений от сервера и будит MailboxFetcher, который забирает
+    письма через своё соединение. IDLE перезапускается раньше, чем сервер его разорвёт,
+    а после ошибок переподключение идёт с растущей задержкой. Оба потока шлют heartbeat watchdog,
+    который обрывает зависшее соединение или запускает завершившийся поток заново."""
+    email_addr = account['email']
+    key = (current_tenant().name, email_addr)
+    fetcher = _fetchers.get(key)
+    if fetcher is None or not fetcher.alive():
+        fetcher = MailboxFetcher(account, loop)
+        _fetchers[key] = fetcher
+        fetcher.start()
+    # Сразу забираем письма, пришедшие, пока бот был выключен
+    fetcher.wake()
+
+    name = f"imap-idle:{current_tenant().name}:{email_addr}"
+    ready_name = imap_ready_name(email_addr)
+    thread = threading.current_thread()
+    context = contextvars.copy_context()
+    connection: dict[str, MailBox | None] = {"mailbox": None}
+
+    def restart():
+        if not thread.is_alive():
+            logger.warning(f"[{email_addr}] IDLE-поток остановился, запускаем заново")
+            threading.Thread(target=context.copy().run, args=(imap_idle_listener, account, loop),
+                             name=thread.name, daemon=True).start()
+        elif interrupt_connection(connection["mailbox"]):
+            logger.warning(f"[{email_addr}] IDLE-соединение зависло и оборвано")
+
+    watchdog.register(name, Config.WATCHDOG_IMAP_TIMEOUT, restart=restart)
+    watchdog.set_ready(ready_name, False)
+
+    backoff = Backoff(max_delay=Config.IMAP_RECONNECT_MAX_DELAY)
+    while True:
+        try:
+            watchdog.beat(name)
+            with _login(account) as mailbox:
+                connection["mailbox"] = mailbox
+                logger.info(f"[{email_addr}] Подключен, выбрана папка INBOX. Ожидание писем...")
+                watchdog.set_ready(ready_name)
+                backoff.reset()
+
+                while True:
+                    watchdog.beat(name, expect=Config.IMAP_IDLE_REFRESH)
+                    responses = mailbox.idle.wait(timeout=Config.IMAP_IDLE_REFRESH)
+                    if responses:
+                        logger.info(f"[{email_addr}] Получено уведомление IDLE")
+                    # По таймауту тоже будим выборку — страховка от потерянных уведомлений
+                    fetcher.wake()
 
         except Exception as e:
-            print(f"[{account['email']}] Ошибка подключения или работы с IMAP: {e}")
-            time.sleep(10)
+            connection["mailbox"] = None
+            watchdog.set_ready(ready_name, False)
+            delay = backoff.next_delay()
+            logger.error(f"[{email_addr}] Ошибка подключения или работы с IMAP: {e}. "
+                         f"Повтор через {delay:.1f} с")
+            watchdog.beat(name, expect=delay)
+            time.sleep(delay)
@@ -0,0 +1,180 @@
+import time
+import socket
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class StalledOperationError(TimeoutError):
+    """Операция не завершилась в отведенное время и отменена watchdog."""
+
+
+@dataclass
+class _Component:
+    """Долгоживущая часть бота (например, IMAP-слушатель ящика), которая регулярно отправляет heartbeat."""
+    name: str
+    timeout: float
+    restart: Callable[[], None] | None
+    deadline: float = field(default_factory=time.monotonic)
+    restarts: int = 0
+    # Перезапуски подряд без единого heartbeat между ними
+    failed_restarts: int = 0
+
+
+@dataclass(eq=False)
+class _Operation:
+    name: str
+    task: asyncio.Task
+    deadline: float
+    started: float = field(default_factory=time.monotonic)
+
+
+class Watchdog:
+    """Следит за тем, что бот не завис молча.
+
+    Компоненты (IMAP-слушатели и потоки выборки) отправляют heartbeat и сообщают, когда ждать следующего.
+    Если heartbeat не пришел к сроку, компонент перезапускается (например, закрывается зависшее соединение,
+    чтобы поток переподключился). Операции в цикле событий (отправки в Telegram) отменяются, если не
+    уложились в отведенное время. Проверка идет раз в WATCHDOG_INTERVAL секунд, состояние отдается
+    в /health/live и /health/ready."""
+
+    def __init__(self):
+        self._components: dict[str, _Component] = {}
+        self._operations: set[_Operation] = set()
+        self._readiness: dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._last_tick = time.monotonic()
+        self._task: asyncio.Task | None = None
+
+    def register(self, name: str, timeout: float, restart: Callable[[], None] | None = None):
+        """Ставит компонент под наблюдение. timeout — сколько ждать heartbeat сверх объявленного ожидания."""
+        with self._lock:
+            self._components[name] = _Component(name, timeout, restart, deadline=time.monotonic() + timeout)
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._components.pop(name, None)
+
+    def beat(self, name: str, expect: float = 0.0):
+        """Heartbeat компонента: он жив и следующий heartbeat пришлет не позже чем через expect секунд
+        (плюс timeout компонента). Можно вызывать из любого потока."""
+        component = self._components.get(name)
+        if component is None:
+            return
+        component.deadline = time.monotonic() + expect + component.timeout
+        component.failed_restarts = 0
+
+    def set_ready(self, name: str, ready: bool = True):
+        """Отмечает готовность части бота к работе (например, вход в ящик выполнен)."""
+        self._readiness[name] = ready
+
+    async def wait_ready(self, names: list[str], timeout: float) -> list[str]:
+        """Ждет, пока части бота отметятся готовыми. Возвращает те, что не успели за timeout секунд."""
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = [name for name in names if not self._readiness.get(name)]
+            if not pending or time.monotonic() >= deadline:
+                return pending
+            await asyncio.sleep(0.1)
+
+    async def guard(self, name: str, awaitable: Awaitable[Any], timeout: float) -> Any:
+        """Выполняет операцию под наблюдением: если она не завершилась за timeout секунд,
+        watchdog отменяет ее и здесь поднимается StalledOperationError."""
+        task = asyncio.ensure_future(awaitable)
+        operation = _Operation(name, task, time.monotonic() + timeout)
+        self._operations.add(operation)
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._operations.discard(operation)
+
+        if task.cancelled():
+            raise StalledOperationError(f"{name}: нет ответа дольше {timeout:.0f} с, операция отменена")
+        return task.result()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="watchdog")
+
+    async def _run(self):
+        while True:
+            self._last_tick = time.monotonic()
+            try:
+                self._check_components()
+                self._check_operations()
+            except Exception as e:
+                logger.error(f"Ошибка проверки watchdog: {e}", exc_info=True)
+            await asyncio.sleep(Config.WATCHDOG_INTERVAL)
+
+    def _check_components(self):
+        now = time.monotonic()
+        with self._lock:
+            overdue = [component for component in self._components.values() if component.deadline < now]
+        for component in overdue:
+            component.restarts += 1
+            component.failed_restarts += 1
+            # Следующая проверка — не раньше, чем компонент успеет переподключиться
+            component.deadline = now + component.timeout
+            logger.error(f"Watchdog: {component.name} не отвечает, перезапуск #{component.restarts}")
+            if component.restart is None:
+                continue
+            try:
+                component.restart()
+            except Exception as e:
+                logger.error(f"Watchdog: не удалось перезапустить {component.name}: {e}")
+
+    def _check_operations(self):
+        now = time.monotonic()
+        for operation in list(self._operations):
+            if operation.deadline < now and not operation.task.done():
+                logger.error(f"Watchdog: {operation.name} выполняется {now - operation.started:.0f} с, отменяем")
+                operation.task.cancel()
+
+    def liveness(self) -> dict:
+        """Бот жив, если цикл событий не заблокирован и ни один компонент не зависает после
+        WATCHDOG_MAX_RESTARTS перезапусков подряд — иначе процесс пора перезапустить целиком."""
+        now = time.monotonic()
+        stuck = sorted(name for name, component in self._components.items()
+                       if component.failed_restarts >= Config.WATCHDOG_MAX_RESTARTS)
+        # Без запущенного watchdog (WATCHDOG_ENABLED=false) тиков нет, и задержку цикла событий не измерить
+        if self._task is None:
+            return {"alive": not stuck, "watchdog_lag_s": None, "stuck": stuck}
+        loop_lag = now - self._last_tick
+        alive = loop_lag < Config.WATCHDOG_INTERVAL * 3 and not stuck
+        return {"alive": alive, "watchdog_lag_s": round(loop_lag, 1), "stuck": stuck}
+
+    def readiness(self) -> dict:
+        """Бот готов, если все части отметились готовыми и ни один компонент не просрочил heartbeat."""
+        now = time.monotonic()
+        not_ready = sorted(name for name, ready in self._readiness.items() if not ready)
+        overdue = sorted(name for name, component in self._components.items() if component.deadline < now)
+        components = {
+            name: {"restarts": component.restarts, "next_heartbeat_in_s": round(component.deadline - now, 1)}
+            for name, component in sorted(self._components.items())
+        }
+        return {"ready": not not_ready and not overdue, "not_ready": not_ready, "overdue": overdue,
+                "components": components, "in_flight": len(self._operations)}
+
+
+def interrupt_connection(mailbox) -> bool:
+    """Обрывает сокет IMAP-соединения, чтобы зависший на нем поток получил ошибку и переподключился."""
+    sock = getattr(getattr(mailbox, "client", None), "sock", None)
+    if sock is None:
+        return False
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    return True
+
+
+watchdog = Watchdog()
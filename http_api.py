@@ -0,0 +1,247 @@
+import hmac
+import time
+import asyncio
+import logging
+import contextlib
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+
+import uvicorn
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+
+from config import Config
+from tracing import Span
+from email_handler import report_subject, schedule_delivery
+from health import watchdog
+from tenants import use_tenant
+from seatable_api import find_tenant_mailbox
+from telegram_spool import spool_enabled, create_spool, remove_spool
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Superset Telegram Bot", docs_url=None, redoc_url=None)
+_bearer = HTTPBearer(auto_error=False)
+
+# Поля формы, кроме файлов, — короткие строки
+_MAX_FIELD_SIZE = 64 * 1024
+
+
+def _check_token(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)):
+    """Проверяет заголовок Authorization: Bearer <HTTP_API_TOKEN>"""
+    if not Config.HTTP_API_TOKEN:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "HTTP_API_TOKEN не задан")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(),
+                                                      Config.HTTP_API_TOKEN.encode()):
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Неверный токен",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def _file_extension(filename: str, content_type: str) -> str | None:
+    """Тип вложения по имени файла или content-type — так же, как для вложений писем"""
+    filename = filename.lower()
+    content_type = content_type.lower()
+    for extension in (".pdf", ".png"):
+        if filename.endswith(extension) or extension[1:] in content_type:
+            return extension
+    return None
+
+
+def _too_large(message: str) -> HTTPException:
+    return HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, message)
+
+
+class _FormReader:
+    """Потоковый разбор multipart/form-data. Тело запроса приходит порциями, размер каждого файла проверяется
+    по ходу чтения. Файлы PDF/PNG из поля files копятся в памяти, а для локального сервера Bot API сразу пишутся
+    в TELEGRAM_SPOOL_DIR — дальше по рассылке передается путь, и файл в память не читается вовсе."""
+
+    def __init__(self, boundary: bytes, limit: int):
+        self.limit = limit
+        self.fields: dict[str, str] = {}
+        self.files: list[tuple[str, bytes | Path]] = []
+        self.sizes: list[int] = []
+        self._events: list[tuple[str, object]] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part: dict | None = None
+        self._spooled: list[Path] = []
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._headers.clear,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": lambda: self._events.append(("headers", dict(self._headers))),
+            "on_part_data": lambda data, start, end: self._events.append(("data", data[start:end])),
+            "on_part_end": lambda: self._events.append(("end", None)),
+        })
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    async def feed(self, chunk: bytes):
+        # Колбэки парсера синхронные, поэтому запись на диск идет после разбора каждой порции
+        self._parser.write(chunk)
+        events, self._events = self._events, []
+        for kind, value in events:
+            if kind == "headers":
+                await self._begin_part(value)
+            elif kind == "data":
+                await self._write(value)
+            else:
+                await self._end_part()
+
+    def finalize(self):
+        self._parser.finalize()
+
+    async def _begin_part(self, headers: dict[bytes, bytes]):
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if b"filename" not in options:
+            self._part = {"name": name, "value": bytearray()}
+            return
+
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        extension = _file_extension(filename, headers.get(b"content-type", b"").decode("latin-1"))
+        self._part = {"name": name, "filename": filename or f"report{extension}", "size": 0, "skip": False}
+        if name != "files" or not extension:
+            logger.warning(f"Пропущено вложение недопустимого типа: {filename}")
+            self._part["skip"] = True
+        elif spool_enabled():
+            path = await asyncio.to_thread(create_spool, self._part["filename"])
+            self._spooled.append(path)
+            self._part["path"] = path
+            self._part["file"] = await asyncio.to_thread(open, path, "wb")
+        else:
+            self._part["chunks"] = []
+
+    async def _write(self, data: bytes):
+        part = self._part
+        if "value" in part:
+            part["value"] += data
+            if len(part["value"]) > _MAX_FIELD_SIZE:
+                raise _too_large(f"Поле {part['name']} слишком длинное")
+            return
+        if part["skip"]:
+            return
+        part["size"] += len(data)
+        if part["size"] > self.limit:
+            raise _too_large(f"Файл {part['filename']} больше {Config.HTTP_API_MAX_UPLOAD_MB} МБ")
+        if "file" in part:
+            await asyncio.to_thread(part["file"].write, data)
+        else:
+            part["chunks"].append(data)
+
+    async def _end_part(self):
+        part, self._part = self._part, None
+        if "value" in part:
+            self.fields[part["name"]] = part["value"].decode("utf-8", errors="replace")
+        elif "file" in part:
+            await asyncio.to_thread(part["file"].close)
+            self.files.append((part["filename"], part["path"]))
+            self.sizes.append(part["size"])
+        elif not part["skip"]:
+            self.files.append((part["filename"], b"".join(part["chunks"])))
+            self.sizes.append(part["size"])
+
+    def discard(self):
+        """Запрос отклонен — удаляет уже записанные на диск файлы"""
+        if self._part and "file" in self._part:
+            self._part["file"].close()
+        for path in self._spooled:
+            remove_spool(path)
+
+
+@app.post("/reports", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(_check_token)])
+async def post_report(request: Request):
+    """Принимает отчет напрямую, минуя почту, и рассылает его получателям ящика.
+    Форма: mailbox — ящик (email) из таблицы Mailboxes, по нему выбираются получатели; subject — тема;
+    files — один или несколько PDF/PNG файлов. Ответ возвращается сразу после приема файлов, рассылка идет в фоне."""
+    request_limit = Config.HTTP_API_MAX_REQUEST_MB * 1024 * 1024
+    content_length = request.headers.get("content-length", "")
+    # Слишком большой запрос отклоняется до чтения тела
+    if content_length.isdigit() and int(content_length) > request_limit:
+        raise _too_large(f"Запрос больше {Config.HTTP_API_MAX_REQUEST_MB} МБ")
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Ожидается multipart/form-data")
+
+    reader = _FormReader(options[b"boundary"], Config.HTTP_API_MAX_UPLOAD_MB * 1024 * 1024)
+    started_ns = time.time_ns()
+    received = 0
+    try:
+        try:
+            async for chunk in request.stream():
+                # Content-Length может не быть (chunked), поэтому размер считается и по ходу чтения
+                received += len(chunk)
+                if received > request_limit:
+                    raise _too_large(f"Запрос больше {Config.HTTP_API_MAX_REQUEST_MB} МБ")
+                await reader.feed(chunk)
+            reader.finalize()
+        except MultipartParseError as e:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Некорректное тело multipart/form-data: {e}")
+        finished_ns = time.time_ns()
+
+        mailbox = reader.fields.get("mailbox")
+        if not mailbox:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Не указано поле mailbox")
+        found = await find_tenant_mailbox(mailbox)
+        if not found:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, f"Ящик {mailbox} не найден в таблице Mailboxes")
+        if not reader.files:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Нет вложений в формате PDF или PNG")
+    except BaseException as e:
+        reader.discard()
+        if isinstance(e, HTTPException):
+            logger.warning(f"Отклонен отчет по HTTP: {e.status_code} {e.detail}")
+        raise
+    tenant, mailbox = found
+
+    trace = Span("report", start_ns=started_ns, mailbox=mailbox, tenant=tenant.name, source="http")
+    trace.child("http.upload", start_ns=started_ns, attachments=len(reader.files),
+                bytes=sum(reader.sizes)).end(end_ns=finished_ns)
+
+    # Тема оформляется так же, как у писем Superset: без [Superset] и с датой по Москве
+    subject = report_subject(reader.fields.get("subject", ""),
+                             datetime.now(timezone(timedelta(hours=3))).strftime('%d.%m.%Y %H:%M'))
+    trace.set_attribute("subject", subject)
+
+    with use_tenant(tenant):
+        schedule_delivery(mailbox, subject, reader.files, trace)
+
+    return {"status": "accepted", "subject": subject, "files": [filename for filename, _ in reader.files]}
+
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: 503, если цикл событий заблокирован или компонент не оживает после перезапусков"""
+    state = watchdog.liveness()
+    return JSONResponse(state, status_code=status.HTTP_200_OK if state["alive"] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: 503, пока бот не подключился к Telegram и ящикам или если компонент просрочил heartbeat"""
+    state = watchdog.readiness()
+    return JSONResponse(state, status_code=status.HTTP_200_OK if state["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """uvicorn в цикле событий бота: сигналы остановки обрабатывает aiogram, а не uvicorn"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def run_http_api():
+    """Запускает HTTP API в текущем цикле событий"""
+    server = _EmbeddedServer(uvicorn.Config(app, host=Config.HTTP_API_HOST, port=Config.HTTP_API_PORT,
+                                            log_config=None, access_log=False))
+    logger.info(f"HTTP API слушает {Config.HTTP_API_HOST}:{Config.HTTP_API_PORT}")
+    await server.serve()
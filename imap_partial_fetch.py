@@ -0,0 +1,221 @@
+import re
+import logging
+from dataclasses import dataclass
+from email import message_from_bytes
+from email.header import decode_header
+from email.message import Message
+from email.parser import BytesHeaderParser
+from urllib.parse import unquote
+
+from imap_tools import AND, MailBox, MailMessage
+
+logger = logging.getLogger(__name__)
+
+# Расширения и типы вложений, которые рассылает бот (см. handle_email)
+_REPORT_EXTENSIONS = ('.pdf', '.png')
+_REPORT_TYPES = ('pdf', 'png')
+
+# Сколько писем запрашивать одной командой FETCH
+_FETCH_CHUNK = 50
+
+_TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+_LITERAL_RE = re.compile(rb'\{\d+\}$')
+
+
+class _Literal(bytes):
+    """Строка, пришедшая литералом {n} — в отличие от атома, не может быть NIL."""
+
+
+@dataclass
+class PartialMessage:
+    """Письмо, из которого скачаны только заголовки и части с PDF/PNG-вложениями.
+    Повторяет поля MailMessage из imap_tools, которые использует обработка писем."""
+    uid: str
+    obj: Message
+    size: int
+
+    @property
+    def subject(self) -> str:
+        subject = self.obj['Subject'] or ''
+        return ''.join(part.decode(encoding or 'utf-8', errors='replace') if isinstance(part, bytes) else part
+                       for part, encoding in decode_header(subject))
+
+
+def _tokens(data: list) -> list:
+    """Разбивает ответ imaplib на лексемы. Литералы imaplib отдает кортежем (строка до {n}, данные)."""
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            tokens.extend(_TOKEN_RE.findall(_LITERAL_RE.sub(b'', head)))
+            tokens.append(_Literal(literal))
+        elif isinstance(item, bytes):
+            tokens.extend(_TOKEN_RE.findall(item))
+    return tokens
+
+
+def _parse(tokens: list, pos: int = 0):
+    """Разбирает одно выражение IMAP: список, строку, NIL или атом. Возвращает (значение, следующая позиция)."""
+    token = tokens[pos]
+    if isinstance(token, _Literal):
+        return bytes(token), pos + 1
+    if token == b'(':
+        items = []
+        pos += 1
+        while tokens[pos] != b')':
+            item, pos = _parse(tokens, pos)
+            items.append(item)
+        return items, pos + 1
+    if token.startswith(b'"'):
+        return re.sub(rb'\\(.)', rb'\1', token[1:-1]), pos + 1
+    if token.upper() == b'NIL':
+        return None, pos + 1
+    return token, pos + 1
+
+
+def _parse_fetch_response(data: list) -> dict[int, dict[bytes, object]]:
+    """Разбирает ответ UID FETCH: {uid: {b'BODYSTRUCTURE': ..., b'BODY[HEADER]': ...}}"""
+    tokens = _tokens(data)
+    result = {}
+    pos = 0
+    while pos < len(tokens):
+        # Каждое письмо: "<номер> (КЛЮЧ значение КЛЮЧ значение ...)"
+        if tokens[pos] == b'(' or not tokens[pos].isdigit():
+            pos += 1
+            continue
+        items, pos = _parse(tokens, pos + 1)
+        fields = {items[i].upper(): items[i + 1] for i in range(0, len(items) - 1, 2)}
+        uid = fields.get(b'UID')
+        if uid is not None:
+            result[int(uid)] = fields
+    return result
+
+
+def _text(value) -> str:
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else ''
+
+
+def _params(value) -> dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]).lower(): _text(value[i + 1]) for i in range(0, len(value) - 1, 2)}
+
+
+def _decoded_filename(params: dict[str, str]) -> str | None:
+    """Имя файла из параметров filename/name (в том числе RFC 2047 и RFC 2231).
+    Возвращает '' если имя есть, но его не удалось надежно разобрать (например, filename*0*)."""
+    for key in ('filename', 'name'):
+        if key in params:
+            try:
+                return ''.join(part.decode(encoding or 'utf-8') if isinstance(part, bytes) else part
+                               for part, encoding in decode_header(params[key]))
+            except (LookupError, UnicodeDecodeError):
+                return ''
+        if f'{key}*' in params:
+            charset, _, value = params[f'{key}*'].partition("'")
+            try:
+                return unquote(value.partition("'")[2], encoding=charset or 'utf-8', errors='strict')
+            except (LookupError, UnicodeDecodeError):
+                return ''
+        if any(param.startswith(f'{key}*') for param in params):
+            return ''
+    return None
+
+
+def _report_sections(structure, prefix: str = '') -> list[str]:
+    """Номера MIME-частей (для BODY[n]), которые handle_email может принять как вложение-отчет:
+    у части есть имя файла и это PDF или PNG. Если имя не разобрать, часть берется на всякий случай."""
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        # multipart: вложенные части, затем подтип и данные расширения
+        sections = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            sections += _report_sections(child, f'{prefix}{number}.')
+        return sections
+
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    if content_type.startswith(('text/', 'message/')):
+        return []
+
+    # Расширение части: md5, затем disposition — (тип (параметры))
+    disposition = structure[8] if len(structure) > 8 else None
+    params = _params(structure[2])
+    if isinstance(disposition, list) and len(disposition) > 1:
+        params = {**params, **_params(disposition[1])}
+
+    filename = _decoded_filename(params)
+    if filename is None:
+        return []
+    if filename == '' or filename.lower().endswith(_REPORT_EXTENSIONS) or any(t in content_type for t in _REPORT_TYPES):
+        return [prefix.rstrip('.') or '1']
+    return []
+
+
+def _build_message(header: bytes, parts: list[bytes]) -> Message:
+    """Собирает письмо из заголовков и скачанных частей: multipart/mixed только с нужными вложениями."""
+    message = BytesHeaderParser().parsebytes(header)
+    for name in ('Content-Type', 'Content-Transfer-Encoding'):
+        del message[name]
+    message['Content-Type'] = 'multipart/mixed'
+    message.set_payload([message_from_bytes(part) for part in parts])
+    return message
+
+
+def _fetch_full(mailbox: MailBox, uid: int) -> MailMessage | None:
+    """Обычная выборка письма целиком через imap_tools (без отметки \\Seen, как и BODY.PEEK)."""
+    return next(iter(mailbox.fetch(AND(uid=str(uid)), mark_seen=False)), None)
+
+
+def fetch_report_parts(mailbox: MailBox, uids: list[int]) -> dict[int, PartialMessage | MailMessage | None]:
+    """Скачивает письма по BODYSTRUCTURE: сначала структуру и заголовки, затем только MIME-части с PDF/PNG
+    (BODY.PEEK[n]). Для писем без подходящих частей тело не скачивается, в результате для них None.
+    Письма, которые не являются multipart, скачиваются целиком."""
+    result: dict[int, PartialMessage | MailMessage | None] = {}
+    client = mailbox.client
+
+    for start in range(0, len(uids), _FETCH_CHUNK):
+        chunk = uids[start:start + _FETCH_CHUNK]
+        uid_set = ','.join(str(uid) for uid in chunk)
+        typ, data = client.uid('FETCH', uid_set, '(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])')
+        if typ != 'OK':
+            raise RuntimeError(f"UID FETCH BODYSTRUCTURE вернул {typ}: {data}")
+
+        for uid, fields in _parse_fetch_response(data).items():
+            structure = fields.get(b'BODYSTRUCTURE')
+            header = fields.get(b'BODY[HEADER]') or b''
+            size = int(fields.get(b'RFC822.SIZE') or 0)
+
+            if not isinstance(structure, list) or not isinstance(structure[0], list):
+                # Не multipart — части выбирать не из чего
+                typ, data = client.uid('FETCH', str(uid), '(UID BODY.PEEK[])')
+                body = _parse_fetch_response(data).get(uid, {}).get(b'BODY[]') if typ == 'OK' else None
+                if body:
+                    result[uid] = PartialMessage(str(uid), message_from_bytes(body), size)
+                else:
+                    logger.warning(f"UID FETCH BODY[] письма {uid} вернул {typ}, выбираем письмо целиком")
+                    result[uid] = _fetch_full(mailbox, uid)
+                continue
+
+            sections = _report_sections(structure)
+            if not sections:
+                logger.info(f"Письмо UID={uid} без PDF/PNG-вложений, тело не скачивается")
+                result[uid] = None
+                continue
+
+            items = ' '.join(f'BODY.PEEK[{section}.MIME] BODY.PEEK[{section}]' for section in sections)
+            typ, data = client.uid('FETCH', str(uid), f'(UID {items})')
+            if typ != 'OK':
+                raise RuntimeError(f"UID FETCH частей письма {uid} вернул {typ}: {data}")
+            fields = _parse_fetch_response(data).get(uid, {})
+            parts = [(fields.get(f'BODY[{section}.MIME]'.encode()) or b'') + (fields.get(f'BODY[{section}]'.encode()) or b'')
+                     for section in sections]
+            logger.info(f"Письмо UID={uid}: скачаны части {', '.join(sections)} из {size} байт")
+            result[uid] = PartialMessage(str(uid), _build_message(header, parts), size)
+
+    return result
@@ -1,65 +1,163 @@
+import time
 import asyncio
 import logging
 import threading
+import contextvars
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 import handlers
 import custom_logging
 from config import Config
-from bot import bot
-from email_handler import imap_idle_listener
+from tenants import Tenant, TenantMiddleware, load_tenants, use_tenant
+from diagnostics import setup_diagnostics
+from tracing import setup_tracing
+from email_handler import imap_idle_listener, imap_ready_name
+from http_api import run_http_api
+from smtp_receiver import run_smtp_receiver
+from superset_api import close_client as close_superset_client, start_superset_schedules
+from seatable_api import close_session, load_cached_tables, warm_up
+from seatable_events import run_seatable_subscriber
+from delivery_history import close_history
+from health import watchdog
 from telegram_api import router as chat_member
 
 # Инициализация логирования
 custom_logging.setup_logging()
+setup_tracing()
 logger = logging.getLogger(__name__)
 
 logger.info("Настройка логирования завершена")
 
 
+async def _timed(timings: dict[str, float], phase: str, awaitable):
+    """Выполняет этап запуска и запоминает его длительность"""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+
+# Фоновые службы (HTTP API, подписки на события SeaTable, SMTP-приемник): держим ссылки на задачи,
+# чтобы их ошибки попадали в лог, а при остановке бота задачи отменялись
+_services: set[asyncio.Task] = set()
+
+
+def _start_service(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _services.add(task)
+    task.add_done_callback(_service_done)
+    return task
+
+
+def _service_done(task: asyncio.Task):
+    _services.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Служба %s завершилась с ошибкой", task.get_name(), exc_info=task.exception())
+
+
+async def _stop_services():
+    tasks = list(_services)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _init_telegram(tenant: Tenant):
+    # Удаляем вебхук (на всякий случай)
+    await tenant.bot.delete_webhook(drop_pending_updates=True)
+
+    me = await tenant.bot.get_me()
+    logger.info("[%s] Telegram bot @%s запущен", tenant.name, me.username)
+
+
+async def _warm_seatable(tenant: Tenant):
+    with use_tenant(tenant):
+        refreshed = await warm_up()
+    logger.info("[%s] Из SeaTable обновлено таблиц: %s", tenant.name, refreshed)
+
+
 async def main():
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    diagnostics = setup_diagnostics(asyncio.get_running_loop())
+    tenants = load_tenants()
+
+    # Watchdog перезапускает зависшие IMAP-потоки и отменяет зависшие отправки
+    if Config.WATCHDOG_ENABLED:
+        watchdog.start()
+    # Бот готов к доставке, только когда Telegram, SeaTable и все ящики прогреты
+    watchdog.set_ready("startup", False)
+    watchdog.set_ready("telegram", False)
+
+    # HTTP API для приема отчетов напрямую, минуя почту (там же /health/live и /health/ready).
+    # Запускается первым, чтобы /health/ready отвечал 503 на время прогрева
+    if Config.HTTP_API_ENABLED:
+        _start_service(run_http_api(), "http-api")
+
+    # Заполняем кэш таблиц SeaTable из локальной копии, не дожидаясь ответа SeaTable
+    snapshot_started = time.perf_counter()
+    for tenant in tenants:
+        with use_tenant(tenant):
+            loaded_tables = load_cached_tables()
+        logger.info("[%s] Из локальной копии загружено таблиц SeaTable: %s", tenant.name, loaded_tables)
+    timings["snapshot"] = time.perf_counter() - snapshot_started
+
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(TenantMiddleware())  # обработчики выполняются в контексте тенанта бота
     dp.include_router(chat_member)  # роутер ловит события, когда бота добавляют в группу
     dp.include_router(handlers.router) # роутер для обработки действий пользователей (старт, авторизация)
 
-    # Удаляем вебхук (на всякий случай)
-    await bot.delete_webhook(drop_pending_updates=True)
-
-    me = await bot.get_me()
-    logger.info("Telegram bot @%s запущен", me.username)
-
-    accounts = [
-        {
-            "email": Config.IMAP_EMAIL_SR01,
-            "password": Config.IMAP_PASSWORD_SR01,
-            "imap": Config.IMAP_SERVER
-        },
-        {
-            "email": Config.IMAP_EMAIL_SR02,
-            "password": Config.IMAP_PASSWORD_SR02,
-            "imap": Config.IMAP_SERVER
-        },
-        {
-            "email": Config.IMAP_EMAIL_SR03,
-            "password": Config.IMAP_PASSWORD_SR03,
-            "imap": Config.IMAP_SERVER
-        },
-        {
-            "email": Config.IMAP_EMAIL_SR04,
-            "password": Config.IMAP_PASSWORD_SR04,
-            "imap": Config.IMAP_SERVER
-        },
-    ]
-
     loop = asyncio.get_running_loop()
 
-    # Запускаем IMAP‑слушателей
-    for account in accounts:
-        threading.Thread(target=imap_idle_listener, args=(account, loop), daemon=True).start()
+    # Запускаем IMAP‑слушателей сразу: входы в ящики идут параллельно друг с другом и с остальным запуском.
+    # Потоки наследуют контекст тенанта
+    mailboxes = []
+    for tenant in tenants:
+        with use_tenant(tenant):
+            for account in tenant.mailboxes:
+                threading.Thread(target=contextvars.copy_context().run, args=(imap_idle_listener, account, loop),
+                                 daemon=True).start()
+                mailboxes.append(imap_ready_name(account["email"]))
+
+    # Telegram, токен и таблицы SeaTable всех тенантов и входы в ящики — одновременно
+    _, _, not_logged_in = await asyncio.gather(
+        _timed(timings, "telegram", asyncio.gather(*(_init_telegram(tenant) for tenant in tenants))),
+        _timed(timings, "seatable", asyncio.gather(*(_warm_seatable(tenant) for tenant in tenants))),
+        _timed(timings, "imap", watchdog.wait_ready(mailboxes, Config.STARTUP_IMAP_TIMEOUT)),
+    )
+    watchdog.set_ready("telegram")
+    if not_logged_in:
+        logger.warning("За %s с не выполнен вход в ящики: %s", Config.STARTUP_IMAP_TIMEOUT, ", ".join(not_logged_in))
+
+    for tenant in tenants:
+        with use_tenant(tenant):
+            # Подписываемся на изменения конфигурационных таблиц SeaTable
+            _start_service(run_seatable_subscriber(), f"seatable-events:{tenant.name}")
+
+    # SMTP-приемник: письма Superset приходят прямо в бот, без IMAP
+    if Config.SMTP_RECEIVER_ENABLED:
+        _start_service(run_smtp_receiver(), "smtp-receiver")
+
+    # Выгрузка отчетов из Superset по расписанию через REST API
+    if Config.SUPERSET_PULL_ENABLED:
+        start_superset_schedules()
+
+    watchdog.set_ready("startup")
+    logger.info("Запуск завершен за %.2f с: %s", time.perf_counter() - started,
+                ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in timings.items()))
 
-    # Запускаем Telegram‑бота
-    await dp.start_polling(bot)
+    # Запускаем Telegram‑ботов всех тенантов в одном диспетчере
+    try:
+        await dp.start_polling(*[tenant.bot for tenant in tenants])
+    finally:
+        await _stop_services()
+        if diagnostics:
+            diagnostics.disable()
+        await close_session()
+        await close_history()
+        await close_superset_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,146 @@
+import time
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from tenants import current_tenant
+from seatable_api import set_recipient_inactive, update_chat_id
+
+logger = logging.getLogger(__name__)
+
+
+class RecipientInactiveError(Exception):
+    """Получатель помечен недоступным — отправка пропущена без обращения к Telegram."""
+
+
+class RecipientStore:
+    """Локальный список недоступных получателей (заблокировали бота, бот удален из группы, чат не найден)
+    и переездов групп в супергруппы. Хранится в SQLite, чтобы после перезапуска бот не отправлял
+    файлы в чаты, о которых уже знает, что они недоступны."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS inactive_recipients (
+                    chat_id TEXT PRIMARY KEY,
+                    reason TEXT NOT NULL,
+                    since REAL NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS chat_migrations (
+                    old_chat_id TEXT PRIMARY KEY,
+                    new_chat_id TEXT NOT NULL,
+                    migrated_at REAL NOT NULL
+                )
+            """)
+        self.inactive: dict[str, str] = {}
+        self.migrations: dict[str, str] = {}
+        with self._connect() as db:
+            self.inactive = dict(db.execute("SELECT chat_id, reason FROM inactive_recipients"))
+            self.migrations = dict(db.execute("SELECT old_chat_id, new_chat_id FROM chat_migrations"))
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def save_inactive(self, chat_id: str, reason: str):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO inactive_recipients (chat_id, reason, since) VALUES (?, ?, ?)",
+                       (chat_id, reason, time.time()))
+
+    def delete_inactive(self, chat_id: str):
+        with self._connect() as db:
+            db.execute("DELETE FROM inactive_recipients WHERE chat_id = ?", (chat_id,))
+
+    def save_migration(self, old_chat_id: str, new_chat_id: str):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO chat_migrations (old_chat_id, new_chat_id, migrated_at) VALUES (?, ?, ?)",
+                       (old_chat_id, new_chat_id, time.time()))
+
+
+# Списки недоступных получателей тенантов: путь -> хранилище (у каждого бота свои заблокировавшие его чаты)
+_stores: dict[str, RecipientStore] = {}
+
+
+def get_store() -> RecipientStore:
+    path = current_tenant().recipients_db_path
+    if path not in _stores:
+        _stores[path] = RecipientStore(path)
+    return _stores[path]
+
+
+def resolve_chat_id(chat_id: str) -> str:
+    """Возвращает актуальный id чата с учетом переезда группы в супергруппу."""
+    migrations = get_store().migrations
+    chat_id = str(chat_id)
+    seen = set()
+    while chat_id in migrations and chat_id not in seen:
+        seen.add(chat_id)
+        chat_id = migrations[chat_id]
+    return chat_id
+
+
+def is_inactive(chat_id: str) -> bool:
+    return str(chat_id) in get_store().inactive
+
+
+def filter_active(chat_ids: list[str]) -> list[str]:
+    """Заменяет id переехавших групп на новые, убирает недоступных получателей и повторы."""
+    active = []
+    for chat_id in chat_ids:
+        chat_id = resolve_chat_id(chat_id)
+        if is_inactive(chat_id):
+            logger.info(f"Получатель {chat_id} пропущен: {get_store().inactive[chat_id]}")
+            continue
+        if chat_id not in active:
+            active.append(chat_id)
+    return active
+
+
+def unreachable_reason(error: Exception) -> str | None:
+    """Если ошибка отправки означает, что получатель недоступен насовсем, возвращает причину."""
+    if isinstance(error, TelegramForbiddenError):
+        return error.message
+    if isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower():
+        return error.message
+    return None
+
+
+async def deactivate_recipient(chat_id: str, reason: str):
+    """Помечает получателя недоступным локально и в SeaTable (колонки inactive, inactive_reason)."""
+    store = get_store()
+    chat_id = str(chat_id)
+    if store.inactive.get(chat_id) == reason:
+        return
+    store.inactive[chat_id] = reason
+    await asyncio.to_thread(store.save_inactive, chat_id, reason)
+    logger.warning(f"Получатель {chat_id} помечен недоступным: {reason}")
+    await set_recipient_inactive(chat_id, True, reason)
+
+
+async def reactivate_recipient(chat_id: str):
+    """Снимает отметку о недоступности (например, бота снова добавили в группу или разблокировали)."""
+    store = get_store()
+    chat_id = str(chat_id)
+    if chat_id in store.inactive:
+        del store.inactive[chat_id]
+        await asyncio.to_thread(store.delete_inactive, chat_id)
+        logger.info(f"Получатель {chat_id} снова доступен")
+    # Отметка в SeaTable снимается, даже если локально ее нет: получателя могли пометить вручную
+    # или в другом процессе
+    await set_recipient_inactive(chat_id, False)
+
+
+async def migrate_recipient(old_chat_id: str, new_chat_id: str):
+    """Запоминает переезд группы в супергруппу и записывает новый id чата в SeaTable."""
+    store = get_store()
+    old_chat_id, new_chat_id = str(old_chat_id), str(new_chat_id)
+    store.migrations[old_chat_id] = new_chat_id
+    await asyncio.to_thread(store.save_migration, old_chat_id, new_chat_id)
+    logger.warning(f"Группа {old_chat_id} переехала в супергруппу {new_chat_id}")
+    await update_chat_id(old_chat_id, new_chat_id)
@@ -6,17 +6,112 @@ import logging
 from typing import List, Dict, Optional, Any
 
 from config import Config
-from utils import normalize_phone
+from utils import normalize_phone, Backoff, TokenBucket
+from seatable_snapshot import load_snapshot, save_table
+from tenants import Tenant, current_tenant, get_tenants, use_tenant
 
 logger = logging.getLogger(__name__)
 
-# Глобальный кэш токена
-_token_cache: Dict[str, Optional[Dict]] = {
-    "token_data": None,
-    "timestamp": 0
-}
+# Кэш токена: тенант -> {"token_data": ..., "timestamp": ...}
+_token_caches: Dict[str, Dict[str, Any]] = {}
 _TOKEN_TTL = 172800  # время жизни токена в секундах — 48 часов
 
+# Кэш строк конфигурационных таблиц (Users, Mailboxes, T_chats), у каждого тенанта свой:
+# тенант -> имя таблицы -> {"rows": [...], "timestamp": последнее чтение, "full_sync": последнее полное чтение}
+_rows_caches: Dict[str, Dict[str, Dict[str, Any]]] = {}
+# Фоновые обновления устаревших таблиц: (тенант, имя таблицы) -> задача
+_background_refreshes: Dict[tuple, asyncio.Task] = {}
+# Тенанты, у которых активна подписка на изменения SeaTable — кэш сбрасывается по событиям, а не по таймеру
+_live_updates: Dict[str, bool] = {}
+_ROWS_MAX_AGE = 3600  # страховочное время жизни кэша при активной подписке, в секундах
+
+# Общая сессия HTTP (пул соединений) для всех запросов к SeaTable
+_http: Dict[str, Optional[aiohttp.ClientSession]] = {"session": None}
+# Одинаковые GET-запросы, которые выполняются прямо сейчас: (url, params) -> задача
+_inflight_requests: Dict[tuple, asyncio.Task] = {}
+# Ограничение частоты запросов под квоту SeaTable (запросов в минуту). Квота считается по токену базы,
+# поэтому у каждого тенанта свой лимит: тенант -> лимитер
+_rate_limiters: Dict[str, TokenBucket] = {}
+# До какого момента (time.monotonic) запросы тенанта ждут после ответа 429: тенант -> момент
+_throttles: Dict[str, float] = {}
+
+
+def _token_cache() -> Dict[str, Any]:
+    return _token_caches.setdefault(current_tenant().name, {"token_data": None, "timestamp": 0})
+
+
+def _rows_cache() -> Dict[str, Dict[str, Any]]:
+    return _rows_caches.setdefault(current_tenant().name, {})
+
+
+def _rate_limiter() -> TokenBucket:
+    name = current_tenant().name
+    if name not in _rate_limiters:
+        _rate_limiters[name] = TokenBucket(Config.SEATABLE_RATE_LIMIT / 60, capacity=Config.SEATABLE_RATE_BURST)
+    return _rate_limiters[name]
+
+
+def _get_session() -> aiohttp.ClientSession:
+    session = _http["session"]
+    if session is None or session.closed:
+        session = aiohttp.ClientSession()
+        _http["session"] = session
+    return session
+
+
+async def close_session():
+    """Закрывает общую HTTP-сессию SeaTable (при остановке бота)."""
+    session = _http["session"]
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _retry_after(response: aiohttp.ClientResponse) -> float | None:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _request(method: str, url: str, **kwargs) -> tuple[int, Any]:
+    """Выполняет запрос к SeaTable в пределах квоты SEATABLE_RATE_LIMIT текущего тенанта.
+    На ответ 429 все запросы тенанта приостанавливаются на Retry-After (или растущую задержку),
+    после чего запрос повторяется — не больше SEATABLE_MAX_RETRIES раз.
+    Возвращает статус и тело ответа (разобранный JSON или текст)."""
+    tenant_name = current_tenant().name
+    backoff = Backoff(max_delay=60)
+    while True:
+        pause = _throttles.get(tenant_name, 0.0) - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await _rate_limiter().acquire()
+
+        async with _get_session().request(method, url, **kwargs) as response:
+            if response.status == 429 and backoff.attempt < Config.SEATABLE_MAX_RETRIES:
+                delay = backoff.next_delay()
+                delay = _retry_after(response) or delay
+                _throttles[tenant_name] = max(_throttles.get(tenant_name, 0.0), time.monotonic() + delay)
+                logger.warning(f"SeaTable ответил 429 на {method} {url}, повтор через {delay:.1f} с")
+                continue
+
+            if response.content_type == "application/json":
+                return response.status, await response.json()
+            return response.status, await response.text()
+
+
+async def _get(url: str, headers: Dict[str, str], params: Dict[str, str] | None = None) -> tuple[int, Any]:
+    """GET-запрос к SeaTable. Если такой же запрос уже выполняется, ждёт его ответа вместо нового запроса,
+    поэтому одновременно проснувшиеся ящики читают таблицу один раз."""
+    # В ключе и авторизация: у тенантов одинаковые адреса, но разные токены
+    key = (url, tuple(sorted((params or {}).items())), headers.get("authorization") or headers.get("Authorization"))
+    task = _inflight_requests.get(key)
+    if task is None:
+        task = asyncio.create_task(_request("GET", url, headers=headers, params=params))
+        _inflight_requests[key] = task
+        task.add_done_callback(lambda _: _inflight_requests.pop(key, None))
+    # shield: отмена одного из ожидающих не должна отменять запрос для остальных
+    return await asyncio.shield(task)
+
 
 async def get_base_token() -> Optional[Dict]:
     """
@@ -34,30 +129,33 @@ async def get_base_token() -> Optional[Dict]:
     }
     """
     now = time.time()
-    cached = _token_cache["token_data"]
-    cached_time = _token_cache["timestamp"]
+    token_cache = _token_cache()
+    cached = token_cache["token_data"]
+    cached_time = token_cache["timestamp"]
 
     if cached and (now - cached_time) < _TOKEN_TTL:
         return cached
 
-    url = f"{Config.SEATABLE_SERVER}/api/v2.1/dtable/app-access-token/"
+    tenant = current_tenant()
+    url = f"{tenant.seatable_server}/api/v2.1/dtable/app-access-token/"
     headers = {
         "accept": "application/json",
-        "authorization": f"Bearer {Config.SEATABLE_API_TOKEN}"
+        "authorization": f"Bearer {tenant.seatable_api_token}"
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                token_data = await response.json()
-                logger.debug("Base token successfully obtained and cached")
+        status, token_data = await _get(url, headers=headers)
+        if status != 200:
+            logger.error(f"API request failed: {status}, {token_data}")
+            return None
 
-                # Обновляем кэш
-                _token_cache["token_data"] = token_data
-                _token_cache["timestamp"] = now
+        logger.debug("Base token successfully obtained and cached")
 
-                return token_data
+        # Обновляем кэш
+        token_cache["token_data"] = token_data
+        token_cache["timestamp"] = now
+
+        return token_data
 
     except aiohttp.ClientError as e:
         logger.error(f"API request failed: {str(e)}")
@@ -67,55 +165,222 @@ async def get_base_token() -> Optional[Dict]:
     return None
 
 
+def _rows_url(token_data: Dict) -> str:
+    return f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
+
+
+def _auth_headers(token_data: Dict) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {token_data['access_token']}",
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+
+
+def set_live_updates(enabled: bool):
+    """Включает или выключает режим, в котором кэш таблиц обновляется по событиям SeaTable.
+    Без подписки кэш живёт не дольше SEATABLE_POLL_INTERVAL секунд."""
+    _live_updates[current_tenant().name] = enabled
+
+
+def invalidate_table(table_name: str | None = None):
+    """Помечает устаревшим кэш одной таблицы или, если имя не указано, всех таблиц.
+    Устаревшие строки остаются доступны на случай, если SeaTable не ответит."""
+    for name, cached in _rows_cache().items():
+        if table_name is None or name == table_name:
+            cached["timestamp"] = 0
+
+
+def cached_tables() -> list[str]:
+    """Имена конфигурационных таблиц, которые используются для маршрутизации."""
+    tenant = current_tenant()
+    return [tenant.users_table, tenant.mailboxes_table, tenant.chats_table]
+
+
+async def refresh_table(table_name: str) -> Optional[List[Dict]]:
+    """Перечитывает все строки таблицы из SeaTable и обновляет кэш. При ошибке возвращает None."""
+    token_data = await get_base_token()
+    if not token_data:
+        logger.error("Не удалось получить токен SeaTable")
+        return None
+
+    params = {"table_name": table_name}
+    try:
+        status, data = await _get(_rows_url(token_data), _auth_headers(token_data), params)
+        if status != 200:
+            logger.error(f"Ошибка получения таблицы {table_name}. Status: {status}, Response: {data}")
+            return None
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка запроса таблицы {table_name}: {str(e)}")
+        return None
+
+    rows = data.get("rows", [])
+    now = time.time()
+    _rows_cache()[table_name] = {"rows": rows, "timestamp": now, "full_sync": now}
+    logger.debug(f"Таблица {table_name} обновлена в кэше: {len(rows)} записей")
+    await save_table(table_name, rows, now, full=True)
+    return rows
+
+
+def _from_sql_row(row: Dict) -> Dict:
+    """Приводит строку из SQL API к виду, в котором строки отдает API списка строк:
+    связи с другими таблицами — список id строк, а не [{"row_id": ..., "display_value": ...}]."""
+    for key, value in row.items():
+        if isinstance(value, list) and value and all(isinstance(item, dict) and "row_id" in item for item in value):
+            row[key] = [item["row_id"] for item in value]
+    return row
+
+
+async def refresh_table_incremental(table_name: str) -> Optional[List[Dict]]:
+    """Дочитывает в кэш только строки, измененные после последнего известного _mtime.
+    Удаленные строки так не обнаруживаются, поэтому таблица периодически перечитывается полностью (sync_table)."""
+    cached = _rows_cache().get(table_name)
+    if not cached or not cached["rows"]:
+        return await refresh_table(table_name)
+
+    token_data = await get_base_token()
+    if not token_data:
+        logger.error("Не удалось получить токен SeaTable")
+        return None
+
+    since = max((row.get("_mtime") or "" for row in cached["rows"]), default="")
+    url = f"{token_data['dtable_db']}api/v1/query/{token_data['dtable_uuid']}/"
+    query = {"sql": f"SELECT * FROM `{table_name}` WHERE _mtime > '{since}' LIMIT 10000", "convert_keys": True}
+    try:
+        status, data = await _request("POST", url, headers=_auth_headers(token_data), json=query)
+        if status != 200 or not isinstance(data, dict) or not data.get("success", True):
+            logger.error(f"Ошибка инкрементального чтения таблицы {table_name}. Status: {status}, Response: {data}")
+            return None
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка запроса таблицы {table_name}: {str(e)}")
+        return None
+
+    changed = [_from_sql_row(row) for row in data.get("results", [])]
+    rows_by_id = {row.get("_id"): row for row in cached["rows"]}
+    for row in changed:
+        rows_by_id[row.get("_id")] = row
+
+    rows = list(rows_by_id.values())
+    now = time.time()
+    _rows_cache()[table_name] = {"rows": rows, "timestamp": now, "full_sync": cached.get("full_sync", 0)}
+    if changed:
+        logger.info(f"Таблица {table_name}: получено измененных строк — {len(changed)}")
+        await save_table(table_name, changed, now, full=False)
+    return rows
+
+
+async def sync_table(table_name: str) -> Optional[List[Dict]]:
+    """Обновляет кэш таблицы: инкрементально по _mtime, а раз в SEATABLE_FULL_SYNC_INTERVAL — полностью."""
+    cached = _rows_cache().get(table_name)
+    if not cached or time.time() - cached.get("full_sync", 0) > Config.SEATABLE_FULL_SYNC_INTERVAL:
+        return await refresh_table(table_name)
+    return await refresh_table_incremental(table_name)
+
+
+def _refresh_in_background(table_name: str):
+    key = (current_tenant().name, table_name)
+    task = _background_refreshes.get(key)
+    if task is None or task.done():
+        _background_refreshes[key] = asyncio.create_task(sync_table(table_name))
+
+
+async def get_table_rows(table_name: str) -> Optional[List[Dict]]:
+    """Возвращает строки таблицы из кэша. Если кэш устарел, сразу отдает имеющиеся строки
+    и обновляет таблицу в фоне, поэтому медленный или недоступный SeaTable не задерживает рассылку.
+    Из SeaTable с ожиданием читается только таблица, которой еще нет ни в кэше, ни в локальной копии."""
+    cached = _rows_cache().get(table_name)
+    if cached is None:
+        return await refresh_table(table_name)
+
+    ttl = _ROWS_MAX_AGE if _live_updates.get(current_tenant().name) else Config.SEATABLE_POLL_INTERVAL
+    if (time.time() - cached["timestamp"]) >= ttl:
+        _refresh_in_background(table_name)
+    return cached["rows"]
+
+
+def load_cached_tables() -> int:
+    """Заполняет кэш таблиц из локальной копии (при запуске). Возвращает число загруженных таблиц."""
+    tables = load_snapshot()
+    for table_name, cached in tables.items():
+        _rows_cache().setdefault(table_name, cached)
+    return len(tables)
+
+
+async def warm_up() -> int:
+    """Прогревает кэш при запуске: получает токен и перечитывает таблицы маршрутизации параллельно,
+    чтобы первый отчет после перезапуска не ждал SeaTable. Возвращает число обновленных таблиц."""
+    if not await get_base_token():
+        logger.error("Не удалось получить токен SeaTable при запуске")
+        return 0
+    results = await asyncio.gather(*(sync_table(table_name) for table_name in cached_tables()))
+    return sum(rows is not None for rows in results)
+
+
+async def _update_cached_row(table_name: str, row_id: str, values: Dict[str, Any]):
+    """Применяет к закэшированной строке изменения, только что записанные ботом в SeaTable,
+    и сохраняет строку в локальную копию — иначе после перезапуска до следующего чтения
+    бот видел бы старые значения (например, last_uid)."""
+    cached = _rows_cache().get(table_name)
+    if not cached:
+        return
+    for row in cached["rows"]:
+        if row.get("_id") == row_id:
+            row.update(values)
+            await save_table(table_name, [row], cached["timestamp"], full=False)
+            return
+
+
+async def get_table_names() -> Dict[str, str]:
+    """Возвращает соответствие внутренних id таблиц базы их названиям (по метаданным базы)."""
+    token_data = await get_base_token()
+    if not token_data:
+        logger.error("Не удалось получить токен SeaTable")
+        return {}
+
+    url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/metadata/"
+    try:
+        status, data = await _get(url, _auth_headers(token_data))
+        if status != 200:
+            logger.error(f"Ошибка получения метаданных базы: {status} - {data}")
+            return {}
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка запроса метаданных базы: {str(e)}")
+        return {}
+
+    return {table["_id"]: table["name"] for table in data.get("metadata", {}).get("tables", [])}
+
+
 async def check_id_telegram(id_telegram: str) -> bool:
     """
     Проверяет наличие telegram_id в таблице Users.
     Возвращает True если пользователь найден, False если нет.
     """
     try:
-        token_data = await get_base_token()
-        if not token_data:
-            logger.error("Не удалось получить токен SeaTable")
+        rows = await get_table_rows(current_tenant().users_table)
+        if rows is None:
             return False
 
-        base_url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
-        headers = {
-            "Authorization": f"Bearer {token_data['access_token']}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        params = {"table_name": Config.SEATABLE_USERS_TABLE_ID}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(base_url, headers=headers, params=params) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка запроса: {response.status}. Ответ: {error_text}")
-                    return False
-
-                data = await response.json()
-                """
-                Пример data:
-                {'rows': 
-                    [
-                        {'_id': 'HiQYOMv4SLSsSMF_EpGpOg', 
-                        '_mtime': '2025-07-31T11:52:03.380+00:00', 
-                        '_ctime': '2025-07-08T11:58:08.914+00:00', 
-                        'Name': 'usertest01_seller', 
-                        'phone': '+7981ХХХХХХХ', 
-                        'mailboxes': ['Rp5djUppTcqM1LQO_3x_gg', 'FrwMkbJJSfejzUb7a6RdoQ']
-                        },
-                    ]
-                """
-
-                # Ищем пользователя с совпадающим id_telegram
-                for row in data.get("rows", []):
-                    if str(row.get("id_telegram")) == str(id_telegram):
-                        logger.info(f"Найден пользователь с id_telegram: {id_telegram}")
-                        return True
-
-                logger.info(f"Пользователь с id_telegram {id_telegram} не найден")
-                return False
+        """
+        Пример строк:
+        [
+            {'_id': 'HiQYOMv4SLSsSMF_EpGpOg', 
+            '_mtime': '2025-07-31T11:52:03.380+00:00', 
+            '_ctime': '2025-07-08T11:58:08.914+00:00', 
+            'Name': 'usertest01_seller', 
+            'phone': '+7981ХХХХХХХ', 
+            'mailboxes': ['Rp5djUppTcqM1LQO_3x_gg', 'FrwMkbJJSfejzUb7a6RdoQ']
+            },
+        ]
+        """
+
+        # Ищем пользователя с совпадающим id_telegram
+        for row in rows:
+            if str(row.get("id_telegram")) == str(id_telegram):
+                logger.info(f"Найден пользователь с id_telegram: {id_telegram}")
+                return True
+
+        logger.info(f"Пользователь с id_telegram {id_telegram} не найден")
+        return False
 
     except Exception as e:
         logger.error(f"Ошибка при проверке пользователя: {str(e)}", exc_info=True)
@@ -144,65 +409,64 @@ async def register_id_telegram(phone: str, id_telegram: str) -> bool:
 
         # Получаем параметры
         params = {
-            "table_name": Config.SEATABLE_USERS_TABLE_ID,
+            "table_name": current_tenant().users_table,
             "convert_keys": "false"
         }
 
-        async with aiohttp.ClientSession() as session:
-            # Запрашиваем все строки
-            async with session.get(base_url, headers=headers, params=params) as resp:
-                if resp.status != 200:
-                    logger.error(f"Ошибка получения данных: {resp.status}")
-                    return False
-
-                data = await resp.json()
-                rows = data.get("rows", [])
-
-                for row in rows[:5]:
-                    raw_phone = str(row.get(phone_column, "N/A"))
-                    logger.debug(f"- Исходный: '{raw_phone}' | Нормализованный: '{normalize_phone(raw_phone)}'")
-
-                # Ищем точное совпадение
-                matched_row = None
-                for row in rows:
-                    if phone_column in row:
-                        # Нормализуем телефон из таблицы перед сравнением
-                        row_phone_normalized = normalize_phone(str(row[phone_column]))
-                        if row_phone_normalized == phone:
-                            matched_row = row
-                            break
-
-                if not matched_row:
-                    logger.error("Совпадений не найдено. Проверьте:")
-                    logger.error(
-                        f"- Номер {phone} в таблице: {[normalize_phone(str(r.get(phone_column, ''))) for r in rows if phone_column in r]}")
-                    logger.error(f"- Колонка телефон: {phone_column}")
-                    return False
-
-                row_id = matched_row.get("_id")
-                if not row_id:
-                    logger.error("У строки нет ID")
-                    return False
-
-                logger.info(f"Найдена строка пользователя для обновления (ID: {row_id})")
-
-                # Подготовка обновления
-                update_data = {
-                    "table_name": Config.SEATABLE_USERS_TABLE_ID,
-                    "row_id": row_id,
-                    "row": {
-                        id_telegram_column: str(id_telegram)
-                    }
-                }
-
-                # Отправка обновления
-                async with session.put(base_url, headers=headers, json=update_data) as resp:
-                    if resp.status != 200:
-                        logger.error(f"Ошибка обновления: {resp.status} - {await resp.text()}")
-                        return False
-
-                    logger.info(f"ID Telegram успешно добавлен для пользователя с телефоном {phone}")
-                    return True
+        # Запрашиваем все строки
+        status, data = await _get(base_url, headers, params)
+        if status != 200:
+            logger.error(f"Ошибка получения данных: {status}")
+            return False
+
+        rows = data.get("rows", [])
+
+        for row in rows[:5]:
+            raw_phone = str(row.get(phone_column, "N/A"))
+            logger.debug(f"- Исходный: '{raw_phone}' | Нормализованный: '{normalize_phone(raw_phone)}'")
+
+        # Ищем точное совпадение
+        matched_row = None
+        for row in rows:
+            if phone_column in row:
+                # Нормализуем телефон из таблицы перед сравнением
+                row_phone_normalized = normalize_phone(str(row[phone_column]))
+                if row_phone_normalized == phone:
+                    matched_row = row
+                    break
+
+        if not matched_row:
+            logger.error("Совпадений не найдено. Проверьте:")
+            logger.error(
+                f"- Номер {phone} в таблице: {[normalize_phone(str(r.get(phone_column, ''))) for r in rows if phone_column in r]}")
+            logger.error(f"- Колонка телефон: {phone_column}")
+            return False
+
+        row_id = matched_row.get("_id")
+        if not row_id:
+            logger.error("У строки нет ID")
+            return False
+
+        logger.info(f"Найдена строка пользователя для обновления (ID: {row_id})")
+
+        # Подготовка обновления
+        update_data = {
+            "table_name": current_tenant().users_table,
+            "row_id": row_id,
+            "row": {
+                id_telegram_column: str(id_telegram)
+            }
+        }
+
+        # Отправка обновления
+        status, response = await _request("PUT", base_url, headers=headers, json=update_data)
+        if status != 200:
+            logger.error(f"Ошибка обновления: {status} - {response}")
+            return False
+
+        logger.info(f"ID Telegram успешно добавлен для пользователя с телефоном {phone}")
+        await _update_cached_row(current_tenant().users_table, row_id, {id_telegram_column: str(id_telegram)})
+        return True
 
     except Exception as e:
         logger.error(f"Критическая ошибка: {str(e)}", exc_info=True)
@@ -212,78 +476,55 @@ async def register_id_telegram(phone: str, id_telegram: str) -> bool:
 async def get_users_to_send(email: str) -> list[str]:
     """Получает список id_telegram пользователей, подписанных на указанный email"""
     try:
-        token_data = await get_base_token()
-        if not token_data:
-            logger.error("Не удалось получить токен SeaTable")
+        # Поиск mailbox по email
+        mailboxes_rows = await get_table_rows(current_tenant().mailboxes_table)
+        if mailboxes_rows is None:
             return []
+        logger.info(f"Получено mailboxes: {len(mailboxes_rows)} записей")
 
-        base_url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
-        headers = {
-            "Authorization": f"Bearer {token_data['access_token']}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
+        target_mailbox = None
+        found_emails = []  # Для логирования всех email в таблице
 
-        # Поиск mailbox по email
-        mailboxes_params = {"table_name": Config.SEATABLE_MAILBOXES_TABLE_ID}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(base_url, headers=headers, params=mailboxes_params) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    logger.error(f"Ошибка получения mailboxes. Status: {resp.status}, Response: {error_text}")
-                    return []
-
-                mailboxes_data = await resp.json()
-                logger.info(f"Получено mailboxes: {len(mailboxes_data.get('rows', []))} записей")
-
-                target_mailbox = None
-                found_emails = []  # Для логирования всех email в таблице
-
-                for mailbox in mailboxes_data.get("rows", []):
-                    current_email = str(mailbox.get("email", ""))
-                    found_emails.append(current_email)
-
-                    if current_email == str(email):
-                        target_mailbox = mailbox
-                        logger.info(f"Найден mailbox: {mailbox}")
-                        break
-
-                if not target_mailbox:
-                    logger.error(f"Mailbox {email} не найден. Доступные email: {', '.join(found_emails)}")
-                    return []
-
-                # Получаем список пользователей из поля users
-                user_ids = target_mailbox.get("users", [])
-                logger.info(f"Найдены user_ids для {email}: {user_ids}")
-
-                if not user_ids:
-                    logger.error(f"Для ящика {email} поле users пустое или отсутствует")
-                    return []
-
-                # Получаем telegram_ids из таблицы users
-                users_params = {"table_name": Config.SEATABLE_USERS_TABLE_ID}
-
-                async with session.get(base_url, headers=headers, params=users_params) as resp:
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        logger.error(f"Ошибка получения users. Status: {resp.status}, Response: {error_text}")
-                        return []
-
-                    users_data = await resp.json()
-                    users_rows = users_data.get("rows", [])
-                    logger.info(f"Получено users: {len(users_rows)} записей")
-
-                    # Собираем id_telegram нужных пользователей
-                    valid_users = []
-
-                    for user in users_rows:
-                        id_seatable = user.get("_id")
-                        tg_id = user.get("id_telegram")
-                        if id_seatable in user_ids and tg_id:
-                            valid_users.append(str(tg_id))
-                    logger.info(f"Подходящие пользователи: {valid_users}")
-
-                    return valid_users
+        for mailbox in mailboxes_rows:
+            current_email = str(mailbox.get("email", ""))
+            found_emails.append(current_email)
+
+            if current_email == str(email):
+                target_mailbox = mailbox
+                logger.info(f"Найден mailbox: {mailbox}")
+                break
+
+        if not target_mailbox:
+            logger.error(f"Mailbox {email} не найден. Доступные email: {', '.join(found_emails)}")
+            return []
+
+        # Получаем список пользователей из поля users
+        user_ids = target_mailbox.get("users", [])
+        logger.info(f"Найдены user_ids для {email}: {user_ids}")
+
+        if not user_ids:
+            logger.error(f"Для ящика {email} поле users пустое или отсутствует")
+            return []
+
+        # Получаем telegram_ids из таблицы users
+        users_rows = await get_table_rows(current_tenant().users_table)
+        if users_rows is None:
+            return []
+        logger.info(f"Получено users: {len(users_rows)} записей")
+
+        # Собираем id_telegram нужных пользователей
+        valid_users = []
+
+        for user in users_rows:
+            id_seatable = user.get("_id")
+            tg_id = user.get("id_telegram")
+            if user.get("inactive"):
+                continue
+            if id_seatable in user_ids and tg_id:
+                valid_users.append(str(tg_id))
+        logger.info(f"Подходящие пользователи: {valid_users}")
+
+        return valid_users
 
     except Exception as e:
         logger.error(f"Критическая ошибка в get_users_idtg_to_send: {str(e)}", exc_info=True)
@@ -315,64 +556,63 @@ async def register_group(chat_id: int, chat_title: str) -> bool:
 
         # Получаем параметры
         params = {
-            "table_name": Config.SEATABLE_T_CHATS_TABLE_ID,
+            "table_name": current_tenant().chats_table,
             "convert_keys": "false"
         }
 
-        async with aiohttp.ClientSession() as session:
-            # Запрашиваем все строки
-            async with session.get(base_url, headers=headers, params=params) as resp:
-                if resp.status != 200:
-                    logger.error(f"Ошибка получения данных: {resp.status}")
-                    return False
-
-                data = await resp.json()
-                rows = data.get("rows", [])
-
-                # Ищем точное совпадение по названию группы
-                matched_row = None
-                for row in rows:
-                    if name_column in row and str(row[name_column]).strip() == chat_title.strip():
-                        matched_row = row
-                        break
-
-                if not matched_row:
-                    logger.error("Группа не найдена. Проверьте:")
-                    logger.error(f"- Название группы в Telegram: '{chat_title}'")
-                    logger.error(f"- Названия групп в таблице: {[str(r.get(name_column, '')) for r in rows if name_column in r]}")
-                    logger.error(f"- Колонка с названиями: {name_column}")
-                    return False
-
-                row_id = matched_row.get("_id")
-                if not row_id:
-                    logger.error("У строки нет ID")
-                    return False
-
-                # Проверяем блокировку
-                if lock_column in matched_row and matched_row[lock_column]:
-                    logger.error(f"Группа '{chat_title}' заблокирована для изменений")
-                    return False
-
-                logger.info(f"Найдена строка группы для обновления (ID: {row_id})")
-
-                # Подготовка обновления (ID чата + блокировка)
-                update_data = {
-                    "table_name": Config.SEATABLE_T_CHATS_TABLE_ID,
-                    "row_id": row_id,
-                    "row": {
-                        id_chat_column: str(chat_id),
-                        lock_column: True  # Блокируем после записи
-                    }
-                }
-
-                # Отправка обновления
-                async with session.put(base_url, headers=headers, json=update_data) as resp:
-                    if resp.status != 200:
-                        logger.error(f"Ошибка обновления: {resp.status} - {await resp.text()}")
-                        return False
-
-                    logger.info(f"ID чата {chat_id} успешно добавлен и группа '{chat_title}' заблокирована для перезаписи.")
-                    return True
+        # Запрашиваем все строки
+        status, data = await _get(base_url, headers, params)
+        if status != 200:
+            logger.error(f"Ошибка получения данных: {status}")
+            return False
+
+        rows = data.get("rows", [])
+
+        # Ищем точное совпадение по названию группы
+        matched_row = None
+        for row in rows:
+            if name_column in row and str(row[name_column]).strip() == chat_title.strip():
+                matched_row = row
+                break
+
+        if not matched_row:
+            logger.error("Группа не найдена. Проверьте:")
+            logger.error(f"- Название группы в Telegram: '{chat_title}'")
+            logger.error(f"- Названия групп в таблице: {[str(r.get(name_column, '')) for r in rows if name_column in r]}")
+            logger.error(f"- Колонка с названиями: {name_column}")
+            return False
+
+        row_id = matched_row.get("_id")
+        if not row_id:
+            logger.error("У строки нет ID")
+            return False
+
+        # Проверяем блокировку
+        if lock_column in matched_row and matched_row[lock_column]:
+            logger.error(f"Группа '{chat_title}' заблокирована для изменений")
+            return False
+
+        logger.info(f"Найдена строка группы для обновления (ID: {row_id})")
+
+        # Подготовка обновления (ID чата + блокировка)
+        update_data = {
+            "table_name": current_tenant().chats_table,
+            "row_id": row_id,
+            "row": {
+                id_chat_column: str(chat_id),
+                lock_column: True  # Блокируем после записи
+            }
+        }
+
+        # Отправка обновления
+        status, response = await _request("PUT", base_url, headers=headers, json=update_data)
+        if status != 200:
+            logger.error(f"Ошибка обновления: {status} - {response}")
+            return False
+
+        logger.info(f"ID чата {chat_id} успешно добавлен и группа '{chat_title}' заблокирована для перезаписи.")
+        await _update_cached_row(current_tenant().chats_table, row_id, update_data["row"])
+        return True
 
     except Exception as e:
         logger.error(f"Критическая ошибка при регистрации группы: {str(e)}", exc_info=True)
@@ -382,121 +622,179 @@ async def register_group(chat_id: int, chat_title: str) -> bool:
 async def get_chats_to_send(email: str) -> list[str]:
     """Получает список id_telegram групп (чатов), подписанных на указанный email"""
     try:
-        token_data = await get_base_token()
-        if not token_data:
-            logger.error("Не удалось получить токен SeaTable")
+        # Поиск чатов по email
+        mailboxes_rows = await get_table_rows(current_tenant().mailboxes_table)
+        if mailboxes_rows is None:
             return []
+        logger.info(f"Получено mailboxes: {len(mailboxes_rows)} записей")
 
-        base_url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
-        headers = {
-            "Authorization": f"Bearer {token_data['access_token']}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
+        target_t_chats = None
+        found_emails = []  # Для логирования всех email в таблице
 
-        # Поиск чатов по email
-        t_chats_params = {"table_name": Config.SEATABLE_MAILBOXES_TABLE_ID}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(base_url, headers=headers, params=t_chats_params) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    logger.error(f"Ошибка получения t_chats. Status: {resp.status}, Response: {error_text}")
-                    return []
-
-                t_chats_data = await resp.json()
-                logger.info(f"Получено t_chats: {len(t_chats_data.get('rows', []))} записей")
-
-                target_t_chats = None
-                found_emails = []  # Для логирования всех email в таблице
-
-                for t_chat in t_chats_data.get("rows", []):
-                    current_email = str(t_chat.get("email", ""))
-                    found_emails.append(current_email)
-
-                    if current_email == str(email):
-                        target_t_chats = t_chat
-                        logger.info(f"Найден чат: {t_chat}")
-                        break
-
-                if not target_t_chats:
-                    logger.error(f"Mailbox {email} не найден. Доступные email: {', '.join(found_emails)}")
-                    return []
-
-                # Получаем список чатов из поля
-                t_chats_ids = target_t_chats.get("t_chats", [])
-                logger.info(f"Найдены t_chats_ids для {email}: {t_chats_ids}")
-
-                if not t_chats_ids:
-                    logger.error(f"Для ящика {email} поле t_chats пустое или отсутствует")
-                    return []
-
-                # Получаем telegram_ids из таблицы t_chats
-                t_chats_params = {"table_name": Config.SEATABLE_T_CHATS_TABLE_ID}
-
-                async with session.get(base_url, headers=headers, params=t_chats_params) as resp:
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        logger.error(f"Ошибка получения t_chats. Status: {resp.status}, Response: {error_text}")
-                        return []
-
-                    t_chats_data = await resp.json()
-                    t_chats_rows = t_chats_data.get("rows", [])
-                    logger.info(f"Получено users: {len(t_chats_rows)} записей")
-
-                    # Собираем id_telegram нужных чатов
-                    valid_t_chats = []
-
-                    for t_chat in t_chats_rows:
-                        id_seatable = t_chat.get("_id")
-                        tg_id = t_chat.get("id_telegram_chat")
-                        if id_seatable in t_chats_ids and tg_id:
-                            valid_t_chats.append(str(tg_id))
-                    logger.info(f"Подходящие чаты для рассылки: {valid_t_chats}")
-
-                    return valid_t_chats
+        for t_chat in mailboxes_rows:
+            current_email = str(t_chat.get("email", ""))
+            found_emails.append(current_email)
+
+            if current_email == str(email):
+                target_t_chats = t_chat
+                logger.info(f"Найден чат: {t_chat}")
+                break
+
+        if not target_t_chats:
+            logger.error(f"Mailbox {email} не найден. Доступные email: {', '.join(found_emails)}")
+            return []
+
+        # Получаем список чатов из поля
+        t_chats_ids = target_t_chats.get("t_chats", [])
+        logger.info(f"Найдены t_chats_ids для {email}: {t_chats_ids}")
+
+        if not t_chats_ids:
+            logger.error(f"Для ящика {email} поле t_chats пустое или отсутствует")
+            return []
+
+        # Получаем telegram_ids из таблицы t_chats
+        t_chats_rows = await get_table_rows(current_tenant().chats_table)
+        if t_chats_rows is None:
+            return []
+        logger.info(f"Получено t_chats: {len(t_chats_rows)} записей")
+
+        # Собираем id_telegram нужных чатов
+        valid_t_chats = []
+
+        for t_chat in t_chats_rows:
+            id_seatable = t_chat.get("_id")
+            tg_id = t_chat.get("id_telegram_chat")
+            if t_chat.get("inactive"):
+                continue
+            if id_seatable in t_chats_ids and tg_id:
+                valid_t_chats.append(str(tg_id))
+        logger.info(f"Подходящие чаты для рассылки: {valid_t_chats}")
+
+        return valid_t_chats
 
     except Exception as e:
         logger.error(f"Критическая ошибка в get_chats_to_send: {str(e)}", exc_info=True)
         return []
 
 
-async def get_last_uid(email: str) -> str | None:
-    """Получает last_uid (id последнего обработанного письма) из таблицы Mailbox по email"""
+async def _update_row(table_name: str, row_id: str, values: Dict[str, Any]) -> bool:
+    """Записывает значения колонок в строку таблицы и применяет их к кэшу."""
+    token_data = await get_base_token()
+    if not token_data:
+        logger.error("Не удалось получить токен SeaTable")
+        return False
+
+    update_data = {"table_name": table_name, "row_id": row_id, "row": values}
+    status, response = await _request("PUT", _rows_url(token_data), headers=_auth_headers(token_data), json=update_data)
+    if status != 200:
+        logger.error(f"Ошибка обновления: {status} - {response}")
+        return False
+
+    await _update_cached_row(table_name, row_id, values)
+    return True
+
+
+async def set_recipient_inactive(id_telegram: str, inactive: bool, reason: str = "") -> bool:
+    """Отмечает пользователя (Users) и группу (T_chats) с указанным id_telegram недоступными для рассылки:
+    колонки inactive (флажок) и inactive_reason. Такие получатели пропускаются при рассылке.
+    Обновляются все подходящие строки обеих таблиц, включая повторяющиеся записи."""
     try:
-        # Получаем токен доступа
-        token_data = await get_base_token()
-        if not token_data:
-            logger.error("Не удалось получить токен SeaTable")
-            return None
+        found = False
+        success = True
+        for table_name, id_column in ((current_tenant().users_table, "id_telegram"),
+                                      (current_tenant().chats_table, "id_telegram_chat")):
+            for row in await get_table_rows(table_name) or []:
+                if str(row.get(id_column)) != str(id_telegram):
+                    continue
+                found = True
+                if bool(row.get("inactive")) == inactive and (row.get("inactive_reason") or "") == reason:
+                    continue  # отметка уже такая — не пишем в SeaTable лишний раз
+                if await _update_row(table_name, row["_id"], {"inactive": inactive, "inactive_reason": reason}):
+                    logger.info(f"Получатель {id_telegram} в таблице {table_name}: inactive={inactive}")
+                else:
+                    success = False
+
+        if not found:
+            logger.warning(f"Получатель {id_telegram} не найден в таблицах пользователей и групп")
+            return False
+        return success
 
-        # Формируем URL и заголовки
-        base_url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
-        headers = {
-            "Authorization": f"Bearer {token_data['access_token']}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        params = {"table_name": Config.SEATABLE_MAILBOXES_TABLE_ID}
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении статуса получателя: {str(e)}", exc_info=True)
+        return False
 
-        # Делаем запрос к API
-        async with aiohttp.ClientSession() as session:
-            async with session.get(base_url, headers=headers, params=params) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка запроса last_uid: {response.status}. Ответ: {error_text}")
-                    return None
 
-                data = await response.json()
+async def update_chat_id(old_chat_id: str, new_chat_id: str) -> bool:
+    """Записывает новый id_telegram_chat группе, которая переехала в супергруппу."""
+    try:
+        for row in await get_table_rows(current_tenant().chats_table) or []:
+            if str(row.get("id_telegram_chat")) == str(old_chat_id):
+                success = await _update_row(current_tenant().chats_table, row["_id"],
+                                            {"id_telegram_chat": str(new_chat_id)})
+                if success:
+                    logger.info(f"id_telegram_chat группы '{row.get('Name')}' изменен: {old_chat_id} -> {new_chat_id}")
+                return success
+
+        logger.warning(f"Группа с id_telegram_chat {old_chat_id} не найдена")
+        return False
+
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении id чата: {str(e)}", exc_info=True)
+        return False
 
-                # Ищем запись с нужным email
-                for row in data.get("rows", []):
-                    if str(row.get("email")) == str(email):
-                        last_uid = row.get("last_uid")
-                        logger.debug(f"Найден last_uid для {email}: {last_uid}")
-                        return last_uid if last_uid else None
 
-                logger.info(f"Почтовый ящик {email} не найден в таблице")
-                return None
+async def find_mailbox(email: str) -> str | None:
+    """Ищет ящик в таблице Mailboxes без учета регистра и возвращает email в том виде, как он записан в таблице"""
+    rows = await get_table_rows(current_tenant().mailboxes_table)
+    for row in rows or []:
+        current_email = str(row.get("email", ""))
+        if current_email.lower() == email.strip().lower():
+            return current_email
+    return None
+
+
+async def find_tenant_mailbox(email: str) -> tuple[Tenant, str] | None:
+    """Ищет ящик в таблицах Mailboxes всех тенантов. Возвращает тенанта и email ящика, как он записан в таблице."""
+    for tenant in get_tenants():
+        with use_tenant(tenant):
+            mailbox = await find_mailbox(email)
+        if mailbox:
+            return tenant, mailbox
+    return None
+
+
+async def get_mailbox_priority(email: str) -> float | None:
+    """Возвращает приоритет рассылки ящика из колонки priority таблицы Mailboxes (None, если не задан)"""
+    try:
+        rows = await get_table_rows(current_tenant().mailboxes_table)
+        for row in rows or []:
+            if str(row.get("email")) == str(email):
+                priority = row.get("priority")
+                return float(priority) if priority not in (None, "") else None
+        return None
+
+    except (TypeError, ValueError) as e:
+        logger.error(f"Некорректный приоритет ящика {email}: {str(e)}")
+        return None
+
+
+async def get_last_uid(email: str) -> str | None:
+    """Получает last_uid (id последнего обработанного письма) из таблицы Mailbox по email"""
+    try:
+        rows = await get_table_rows(current_tenant().mailboxes_table)
+        if rows is None:
+            logger.error("Ошибка запроса last_uid: таблица ящиков недоступна")
+            return None
+
+        # Ищем запись с нужным email
+        for row in rows:
+            if str(row.get("email")) == str(email):
+                last_uid = row.get("last_uid")
+                logger.debug(f"Найден last_uid для {email}: {last_uid}")
+                return last_uid if last_uid else None
+
+        logger.info(f"Почтовый ящик {email} не найден в таблице")
+        return None
 
     except Exception as e:
         logger.error(f"Ошибка при получении last_uid: {str(e)}", exc_info=True)
@@ -512,63 +810,48 @@ async def update_last_uid(email: str, uid: str) -> bool:
             logger.error("Не удалось получить токен SeaTable")
             return False
 
-        # Формируем URL и заголовки
-        base_url = f"{token_data['dtable_server']}api/v1/dtables/{token_data['dtable_uuid']}/rows/"
-        headers = {
-            "Authorization": f"Bearer {token_data['access_token']}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        params = {
-            "table_name": Config.SEATABLE_MAILBOXES_TABLE_ID,
-            "convert_keys": "false"
+        # Ищем запись с нужным email (id строки не меняется, поэтому достаточно кэша таблицы)
+        rows = await get_table_rows(current_tenant().mailboxes_table)
+        if rows is None:
+            logger.error("Ошибка получения данных: таблица ящиков недоступна")
+            return False
+
+        matched_row = None
+        for row in rows:
+            if str(row.get("email")) == str(email):
+                matched_row = row
+                break
+
+        if not matched_row:
+            logger.error(f"Почтовый ящик {email} не найден в таблице")
+            return False
+
+        row_id = matched_row.get("_id")
+        if not row_id:
+            logger.error("У найденной строки отсутствует _id")
+            return False
+
+        logger.debug(f"Найдена запись для обновления (ID: {row_id})")
+
+        # Подготавливаем данные для обновления
+        update_data = {
+            "table_name": current_tenant().mailboxes_table,
+            "row_id": row_id,
+            "row": {
+                "last_uid": str(uid)  # Обновляем только last_uid
+            }
         }
 
-        async with aiohttp.ClientSession() as session:
-            # Получаем все записи из таблицы
-            async with session.get(base_url, headers=headers, params=params) as resp:
-                if resp.status != 200:
-                    logger.error(f"Ошибка получения данных: {resp.status} - {await resp.text()}")
-                    return False
-
-                data = await resp.json()
-                rows = data.get("rows", [])
-
-                # Ищем запись с нужным email
-                matched_row = None
-                for row in rows:
-                    if str(row.get("email")) == str(email):
-                        matched_row = row
-                        break
-
-                if not matched_row:
-                    logger.error(f"Почтовый ящик {email} не найден в таблице")
-                    return False
-
-                row_id = matched_row.get("_id")
-                if not row_id:
-                    logger.error("У найденной строки отсутствует _id")
-                    return False
-
-                logger.debug(f"Найдена запись для обновления (ID: {row_id})")
-
-                # Подготавливаем данные для обновления
-                update_data = {
-                    "table_name": Config.SEATABLE_MAILBOXES_TABLE_ID,
-                    "row_id": row_id,
-                    "row": {
-                        "last_uid": str(uid)  # Обновляем только last_uid
-                    }
-                }
-
-                # Отправляем обновление
-                async with session.put(base_url, headers=headers, json=update_data) as resp:
-                    if resp.status != 200:
-                        logger.error(f"Ошибка обновления: {resp.status} - {await resp.text()}")
-                        return False
-
-                    logger.info(f"Успешно обновлен last_uid для {email}: {uid}")
-                    return True
+        # Отправляем обновление
+        status, response = await _request("PUT", _rows_url(token_data), headers=_auth_headers(token_data),
+                                          json=update_data)
+        if status != 200:
+            logger.error(f"Ошибка обновления: {status} - {response}")
+            return False
+
+        logger.info(f"Успешно обновлен last_uid для {email}: {uid}")
+        await _update_cached_row(current_tenant().mailboxes_table, row_id, update_data["row"])
+        return True
 
     except Exception as e:
         logger.error(f"Ошибка при обновлении last_uid: {str(e)}", exc_info=True)
@@ -0,0 +1,164 @@
+import json
+import asyncio
+import logging
+
+import socketio
+
+from config import Config
+from utils import Backoff
+from seatable_api import (get_base_token, get_table_names, cached_tables, refresh_table, refresh_table_incremental,
+                          sync_table, invalidate_table, set_live_updates)
+
+logger = logging.getLogger(__name__)
+
+# События socket.io сервера SeaTable
+JOIN_ROOM = "join-room"
+UPDATE_DTABLE = "update-dtable"
+
+# Через сколько секунд после последнего события перечитывать изменённые таблицы
+# (правка одной записи в интерфейсе SeaTable часто приходит несколькими операциями подряд)
+_REFRESH_DEBOUNCE = 1.0
+
+
+class SeaTableSubscriber:
+    """Подписка на изменения базы SeaTable в реальном времени (socket.io на dtable_socket).
+    Когда меняются строки таблиц Users, Mailboxes или T_chats, измененные строки дочитываются в кэш
+    seatable_api (после удаления строк таблица перечитывается полностью), поэтому правки администратора
+    попадают в маршрутизацию за секунды. Пока подписки нет, таблицы обновляются раз в SEATABLE_POLL_INTERVAL секунд."""
+
+    def __init__(self):
+        self._table_names: dict[str, str] = {}
+        self._pending_tables: set[str | None] = set()
+        # Таблицы, в которых удалялись строки — их нельзя обновить по _mtime
+        self._full_refresh_tables: set[str] = set()
+        self._refresh_task: asyncio.Task | None = None
+        self._connected = asyncio.Event()
+
+    async def run(self):
+        # Резервный опрос живет столько же, сколько подписка: иначе он переживет run() и будет опрашивать вечно
+        poller = asyncio.create_task(self._poll_while_disconnected())
+        try:
+            await self._subscribe()
+        finally:
+            poller.cancel()
+            if self._refresh_task is not None:
+                self._refresh_task.cancel()
+
+    async def _subscribe(self):
+        backoff = Backoff(max_delay=Config.SEATABLE_POLL_INTERVAL)
+        while True:
+            sio = socketio.AsyncClient(reconnection=False)
+            try:
+                token_data = await get_base_token()
+                if not token_data:
+                    raise RuntimeError("не удалось получить токен SeaTable")
+
+                self._register_handlers(sio, token_data)
+                self._table_names = await get_table_names()
+
+                url = f"{token_data['dtable_socket'].rstrip('/')}?dtable_uuid={token_data['dtable_uuid']}"
+                await sio.connect(url, socketio_path=Config.SEATABLE_SOCKET_PATH, transports=["websocket"])
+                backoff.reset()
+                await sio.wait()
+                logger.warning("Соединение с сервером событий SeaTable закрыто")
+
+            except Exception as e:
+                logger.error(f"Ошибка подписки на события SeaTable: {str(e)}")
+
+            finally:
+                self._set_connected(False)
+                if sio.connected:
+                    await sio.disconnect()
+
+            delay = backoff.next_delay()
+            logger.info(f"Повторное подключение к событиям SeaTable через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+    def _register_handlers(self, sio: socketio.AsyncClient, token_data: dict):
+        @sio.event
+        async def connect():
+            await sio.emit(JOIN_ROOM, (token_data["dtable_uuid"], token_data["access_token"]))
+            logger.info("Подписка на события SeaTable установлена")
+            self._set_connected(True)
+            # Пока подписки не было, изменения могли пройти мимо — перечитываем все таблицы
+            self._schedule_refresh(None)
+
+        @sio.event
+        async def disconnect():
+            self._set_connected(False)
+
+        @sio.on(UPDATE_DTABLE)
+        async def on_update_dtable(data):
+            self._on_operation(data)
+
+    def _set_connected(self, connected: bool):
+        set_live_updates(connected)
+        if connected:
+            self._connected.set()
+        else:
+            self._connected.clear()
+
+    def _on_operation(self, data):
+        """Разбирает операцию над базой и планирует перечитывание затронутой таблицы."""
+        try:
+            operation = json.loads(data) if isinstance(data, str) else data
+        except ValueError:
+            logger.warning(f"Не удалось разобрать событие SeaTable: {data!r}")
+            self._schedule_refresh(None)
+            return
+
+        table_id = operation.get("table_id") if isinstance(operation, dict) else None
+        op_type = str(operation.get("op_type", "")) if isinstance(operation, dict) else ""
+        table_name = self._table_names.get(table_id)
+        logger.debug(f"Событие SeaTable: {op_type}, таблица {table_name or table_id}")
+
+        if table_name is None:
+            # Неизвестная таблица (например, только что переименованная) — обновляем всё
+            self._schedule_refresh(None)
+        elif table_name in cached_tables():
+            if op_type.startswith("delete"):
+                self._full_refresh_tables.add(table_name)
+            self._schedule_refresh(table_name)
+
+    def _schedule_refresh(self, table_name: str | None):
+        """Сбрасывает кэш таблицы и перечитывает её после короткой паузы. None — все таблицы."""
+        invalidate_table(table_name)
+        self._pending_tables.add(table_name)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_pending())
+
+    async def _refresh_pending(self):
+        await asyncio.sleep(_REFRESH_DEBOUNCE)
+        pending, self._pending_tables = self._pending_tables, set()
+        if None in pending:
+            # При полном обновлении заодно перечитываем названия таблиц
+            self._table_names = await get_table_names() or self._table_names
+            pending = set(cached_tables())
+            # После переподключения или изменения неизвестной таблицы могли пропасть удаления строк
+            self._full_refresh_tables.update(pending)
+
+        full_refresh, self._full_refresh_tables = self._full_refresh_tables, set()
+        for table_name in pending:
+            if table_name in full_refresh:
+                rows = await refresh_table(table_name)
+            else:
+                rows = await refresh_table_incremental(table_name)
+            if rows is not None:
+                logger.info(f"Таблица {table_name} обновлена по событию SeaTable: {len(rows)} записей")
+
+    async def _poll_while_disconnected(self):
+        """Резервный режим: пока подписка не работает, периодически обновляем таблицы."""
+        while True:
+            await asyncio.sleep(Config.SEATABLE_POLL_INTERVAL)
+            if self._connected.is_set():
+                continue
+            for table_name in cached_tables():
+                await sync_table(table_name)
+
+
+async def run_seatable_subscriber():
+    """Запускает подписку на события SeaTable (если она включена в настройках)."""
+    if not Config.SEATABLE_EVENTS_ENABLED:
+        logger.info("Подписка на события SeaTable отключена, таблицы перечитываются по таймеру")
+        return
+    await SeaTableSubscriber().run()
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, List
+
+from tenants import current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+class SeaTableSnapshot:
+    """Локальная копия конфигурационных таблиц SeaTable в SQLite.
+    При запуске из неё мгновенно заполняется кэш seatable_api, а если SeaTable недоступен,
+    бот продолжает маршрутизировать отчеты по последним сохраненным данным."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS rows (
+                    table_name TEXT NOT NULL,
+                    row_id TEXT NOT NULL,
+                    mtime TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (table_name, row_id)
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS tables (
+                    table_name TEXT PRIMARY KEY,
+                    synced_at REAL NOT NULL,
+                    full_synced_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает сохраненные таблицы: имя -> {"rows": [...], "timestamp": ..., "full_sync": ...}"""
+        tables: Dict[str, Dict[str, Any]] = {}
+        with self._connect() as db:
+            for table_name, synced_at, full_synced_at in db.execute(
+                    "SELECT table_name, synced_at, full_synced_at FROM tables"):
+                tables[table_name] = {"rows": [], "timestamp": synced_at, "full_sync": full_synced_at}
+            for table_name, data in db.execute("SELECT table_name, data FROM rows ORDER BY rowid"):
+                if table_name in tables:
+                    tables[table_name]["rows"].append(json.loads(data))
+        return tables
+
+    def replace_table(self, table_name: str, rows: List[Dict], synced_at: float):
+        """Полностью заменяет сохраненную таблицу (после полного чтения из SeaTable)."""
+        with self._connect() as db:
+            db.execute("DELETE FROM rows WHERE table_name = ?", (table_name,))
+            db.executemany(
+                "INSERT INTO rows (table_name, row_id, mtime, data) VALUES (?, ?, ?, ?)",
+                [(table_name, row.get("_id"), row.get("_mtime"), json.dumps(row, ensure_ascii=False))
+                 for row in rows if row.get("_id")]
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO tables (table_name, synced_at, full_synced_at) VALUES (?, ?, ?)",
+                (table_name, synced_at, synced_at)
+            )
+
+    def upsert_rows(self, table_name: str, rows: List[Dict], synced_at: float):
+        """Сохраняет измененные строки (после инкрементального чтения по _mtime)."""
+        with self._connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO rows (table_name, row_id, mtime, data) VALUES (?, ?, ?, ?)",
+                [(table_name, row.get("_id"), row.get("_mtime"), json.dumps(row, ensure_ascii=False))
+                 for row in rows if row.get("_id")]
+            )
+            db.execute("UPDATE tables SET synced_at = ? WHERE table_name = ?", (synced_at, table_name))
+
+
+# Локальные копии таблиц тенантов: путь -> копия
+_snapshots: Dict[str, SeaTableSnapshot] = {}
+
+
+def get_snapshot() -> SeaTableSnapshot | None:
+    """Возвращает локальную копию таблиц текущего тенанта (None, если путь к ней не задан)."""
+    path = current_tenant().snapshot_path
+    if not path:
+        return None
+    if path not in _snapshots:
+        _snapshots[path] = SeaTableSnapshot(path)
+    return _snapshots[path]
+
+
+def load_snapshot() -> Dict[str, Dict[str, Any]]:
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return {}
+    try:
+        return snapshot.load()
+    except sqlite3.Error as e:
+        logger.error(f"Не удалось прочитать локальную копию таблиц SeaTable: {str(e)}")
+        return {}
+
+
+async def save_table(table_name: str, rows: List[Dict], synced_at: float, full: bool):
+    """Сохраняет таблицу в локальную копию в отдельном потоке, не блокируя цикл событий."""
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return
+    try:
+        if full:
+            await asyncio.to_thread(snapshot.replace_table, table_name, rows, synced_at)
+        else:
+            await asyncio.to_thread(snapshot.upsert_rows, table_name, rows, synced_at)
+    except sqlite3.Error as e:
+        logger.error(f"Не удалось сохранить таблицу {table_name} в локальную копию: {str(e)}")
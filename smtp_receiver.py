@@ -0,0 +1,112 @@
+import time
+import asyncio
+import logging
+import ipaddress
+from email import message_from_bytes
+
+from aiosmtpd.smtp import SMTP, Envelope, Session
+
+from config import Config
+from tracing import Span
+from email_handler import handle_email, schedule_delivery
+from tenants import use_tenant
+from seatable_api import find_tenant_mailbox
+
+logger = logging.getLogger(__name__)
+
+
+def _split(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class ReportHandler:
+    """Обработчик aiosmtpd: принимает письма Superset напрямую, без почтового сервера и IMAP.
+    Адрес RCPT TO должен быть ящиком из таблицы Mailboxes одного из тенантов — по нему выбираются
+    тенант и получатели рассылки. Письма принимаются только с адресов из SMTP_RECEIVER_ALLOWED_IPS
+    и, если список задан, только от отправителей из SMTP_RECEIVER_ALLOWED_SENDERS."""
+
+    def __init__(self, allowed_ips: str | None = None, allowed_senders: str | None = None):
+        self.allowed_networks = [ipaddress.ip_network(network, strict=False) for network in _split(
+            Config.SMTP_RECEIVER_ALLOWED_IPS if allowed_ips is None else allowed_ips)]
+        # Адреса целиком или домены вида @company.ru
+        self.allowed_senders = [sender.lower() for sender in _split(
+            Config.SMTP_RECEIVER_ALLOWED_SENDERS if allowed_senders is None else allowed_senders)]
+
+    def _client_allowed(self, session: Session) -> bool:
+        try:
+            address = ipaddress.ip_address(session.peer[0])
+        except (TypeError, ValueError, IndexError):
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def _sender_allowed(self, sender: str) -> bool:
+        if not self.allowed_senders:
+            return True
+        sender = sender.lower()
+        return any(sender == allowed or (allowed.startswith("@") and sender.endswith(allowed))
+                   for allowed in self.allowed_senders)
+
+    async def handle_MAIL(self, server: SMTP, session: Session, envelope: Envelope, address: str, mail_options):
+        if not self._client_allowed(session):
+            logger.warning(f"SMTP: отклонено письмо с адреса {session.peer[0]} — его нет в SMTP_RECEIVER_ALLOWED_IPS")
+            return "550 5.7.1 Client host rejected"
+        if not self._sender_allowed(address):
+            logger.warning(f"SMTP: отклонен отправитель {address} — его нет в SMTP_RECEIVER_ALLOWED_SENDERS")
+            return "550 5.7.1 Sender rejected"
+        envelope.mail_from = address
+        envelope.mail_options.extend(mail_options)
+        return "250 OK"
+
+    async def handle_RCPT(self, server: SMTP, session: Session, envelope: Envelope, address: str, rcpt_options):
+        found = await find_tenant_mailbox(address)
+        if not found:
+            logger.warning(f"SMTP: отклонен получатель {address} — ящика нет в таблице Mailboxes")
+            return "550 5.1.1 Mailbox not found"
+        envelope.rcpt_tos.append(found[1])
+        return "250 OK"
+
+    async def handle_DATA(self, server: SMTP, session: Session, envelope: Envelope):
+        received_ns = time.time_ns()
+        logger.info(f"SMTP: письмо от {envelope.mail_from} для {', '.join(envelope.rcpt_tos)} "
+                    f"({len(envelope.content)} байт)")
+
+        # Разбираем письмо до ответа, чтобы отправитель узнал о неразборчивом письме
+        try:
+            subject, attachments = await handle_email(message_from_bytes(envelope.content))
+        except Exception as e:
+            logger.error(f"SMTP: не удалось разобрать письмо от {envelope.mail_from}: {e}")
+            return "554 5.6.0 Message could not be parsed"
+        parsed_ns = time.time_ns()
+
+        if not attachments:
+            logger.info(f"SMTP: в письме «{subject}» вложений нет, рассылка не требуется.")
+            return "250 OK"
+
+        # Рассылка идет в фоне: ответ отправителю не ждет Telegram
+        for address in envelope.rcpt_tos:
+            found = await find_tenant_mailbox(address)
+            if not found:
+                continue
+            tenant, mailbox = found
+            trace = Span("report", start_ns=received_ns, mailbox=mailbox, tenant=tenant.name, source="smtp",
+                         subject=subject)
+            trace.child("handle_email", start_ns=received_ns, attachments=len(attachments),
+                        bytes=sum(len(content) for _, content in attachments)).end(end_ns=parsed_ns)
+            with use_tenant(tenant):
+                schedule_delivery(mailbox, subject, attachments, trace)
+
+        return "250 2.0.0 Message accepted for delivery"
+
+
+async def run_smtp_receiver():
+    """Запускает SMTP-приемник в текущем цикле событий"""
+    loop = asyncio.get_running_loop()
+    handler = ReportHandler()
+    server = await loop.create_server(
+        lambda: SMTP(handler, data_size_limit=Config.SMTP_RECEIVER_MAX_SIZE_MB * 1024 * 1024,
+                     enable_SMTPUTF8=True, ident="superset-telegram-bot"),
+        host=Config.SMTP_RECEIVER_HOST, port=Config.SMTP_RECEIVER_PORT,
+    )
+    logger.info(f"SMTP-приемник слушает {Config.SMTP_RECEIVER_HOST}:{Config.SMTP_RECEIVER_PORT}")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,266 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict
+
+import aiocron
+import aiohttp
+
+from config import Config
+from tracing import Span
+from tenants import current_tenant, get_tenant, get_tenants, use_tenant
+from email_handler import report_subject, schedule_delivery
+
+logger = logging.getLogger(__name__)
+
+_MOSCOW_TZ = timezone(timedelta(hours=3))
+
+# Форматы выгрузки: дашборд — PNG или PDF, график — только PNG
+_CONTENT_TYPES = {"png": "image/png", "pdf": "application/pdf"}
+
+
+@dataclass
+class ReportSchedule:
+    """Расписание выгрузки из Superset: что выгружать, когда и в какие ящики (по ним выбираются получатели)"""
+    cron: str
+    mailboxes: list[str]
+    dashboard: int | None = None
+    chart: int | None = None
+    format: str = "png"
+    subject: str = ""
+    # Состояние нативных фильтров дашборда (dataMask), как его сохраняет Superset
+    filters: Dict[str, Any] = field(default_factory=dict)
+    # Выгрузки с одинаковым дашбордом и фильтрами в пределах интервала (секунды) берутся из кэша
+    time_bucket: int = 0
+    tenant: str | None = None
+
+    @property
+    def cache_key(self) -> tuple:
+        # Номер интервала без его длины неоднозначен: у расписаний с разными time_bucket номера совпадают случайно
+        size = self.time_bucket or Config.SUPERSET_EXPORT_CACHE_TTL
+        return ("dashboard" if self.dashboard else "chart", self.dashboard or self.chart, self.format,
+                json.dumps(self.filters, sort_keys=True, ensure_ascii=False), size, int(time.time() // size))
+
+
+class SupersetClient:
+    """Клиент REST API Superset: вход по логину и паролю, запуск и скачивание выгрузок дашбордов и графиков.
+    Superset готовит снимок асинхронно, поэтому клиент запрашивает снимок и опрашивает его адрес, пока тот не будет готов."""
+
+    def __init__(self, base_url: str, username: str, password: str, provider: str = "db"):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.provider = provider
+        self._session: aiohttp.ClientSession | None = None
+        self._access_token: str | None = None
+        self._csrf_token: str | None = None
+        self._login_lock = asyncio.Lock()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # Cookie-сессия нужна для CSRF-токена
+            self._session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def login(self):
+        async with self._login_lock:
+            session = self._get_session()
+            payload = {"username": self.username, "password": self.password, "provider": self.provider, "refresh": True}
+            async with session.post(f"{self.base_url}/api/v1/security/login", json=payload) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Вход в Superset не удался: {response.status} {await response.text()}")
+                self._access_token = (await response.json())["access_token"]
+
+            async with session.get(f"{self.base_url}/api/v1/security/csrf_token/",
+                                   headers={"Authorization": f"Bearer {self._access_token}"}) as response:
+                self._csrf_token = (await response.json()).get("result") if response.status == 200 else None
+            logger.info(f"Выполнен вход в Superset {self.base_url}")
+
+    async def _request(self, method: str, path: str, **kwargs) -> tuple[int, str, bytes]:
+        """Запрос к API с токеном; при 401 входит заново и повторяет запрос один раз.
+        Возвращает статус, content-type и тело ответа."""
+        if self._access_token is None:
+            await self.login()
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self._access_token}", "Referer": self.base_url}
+            if self._csrf_token:
+                headers["X-CSRFToken"] = self._csrf_token
+            url = path if path.startswith("http") else f"{self.base_url}{path}"
+            async with self._get_session().request(method, url, headers=headers, **kwargs) as response:
+                if response.status == 401 and attempt == 0:
+                    await self.login()
+                    continue
+                return response.status, response.content_type, await response.read()
+
+    async def _wait_for_screenshot(self, image_url: str, params: Dict[str, str] | None = None) -> bytes:
+        deadline = time.monotonic() + Config.SUPERSET_SCREENSHOT_TIMEOUT
+        while True:
+            status, content_type, body = await self._request("GET", image_url, params=params)
+            if status == 200 and not content_type.startswith("application/json"):
+                return body
+            # 202 или 404 — снимок еще готовится
+            if status not in (200, 202, 404):
+                raise RuntimeError(f"Superset вернул {status} на {image_url}: {body[:500]!r}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Снимок {image_url} не готов за {Config.SUPERSET_SCREENSHOT_TIMEOUT} с")
+            await asyncio.sleep(Config.SUPERSET_POLL_INTERVAL)
+
+    async def export_dashboard(self, dashboard_id: int, export_format: str = "png",
+                               filters: Dict[str, Any] | None = None) -> bytes:
+        """Снимок дашборда в PNG или PDF с заданным состоянием нативных фильтров"""
+        state = {"dataMask": filters or {}, "activeTabs": [], "anchor": "", "urlParams": []}
+        status, _, body = await self._request("POST", f"/api/v1/dashboard/{dashboard_id}/cache_dashboard_screenshot/",
+                                              json=state)
+        if status not in (200, 202):
+            raise RuntimeError(f"Superset не принял выгрузку дашборда {dashboard_id}: {status} {body[:500]!r}")
+        data = json.loads(body)
+        image_url = data.get("image_url") or f"/api/v1/dashboard/{dashboard_id}/screenshot/{data['cache_key']}/"
+        return await self._wait_for_screenshot(image_url, params={"download_format": export_format})
+
+    async def export_chart(self, chart_id: int) -> bytes:
+        """Снимок графика в PNG"""
+        status, _, body = await self._request("GET", f"/api/v1/chart/{chart_id}/cache_screenshot/")
+        if status not in (200, 202):
+            raise RuntimeError(f"Superset не принял выгрузку графика {chart_id}: {status} {body[:500]!r}")
+        data = json.loads(body)
+        image_url = data.get("image_url") or f"/api/v1/chart/{chart_id}/screenshot/{data['cache_key']}/"
+        return await self._wait_for_screenshot(image_url)
+
+
+_client: Dict[str, SupersetClient | None] = {"instance": None}
+
+# Готовые выгрузки: ключ (дашборд/график, формат, фильтры, длина и номер интервала) -> (время, содержимое)
+_export_cache: Dict[tuple, tuple[float, bytes]] = {}
+# Выгрузки, которые готовятся прямо сейчас: ключ -> задача
+_inflight_exports: Dict[tuple, asyncio.Task] = {}
+
+
+def get_client() -> SupersetClient:
+    if _client["instance"] is None:
+        _client["instance"] = SupersetClient(Config.SUPERSET_URL, Config.SUPERSET_USERNAME,
+                                             Config.SUPERSET_PASSWORD, Config.SUPERSET_PROVIDER)
+    return _client["instance"]
+
+
+async def close_client():
+    if _client["instance"] is not None:
+        await _client["instance"].close()
+
+
+async def _export(schedule: ReportSchedule) -> bytes:
+    client = get_client()
+    if schedule.dashboard:
+        return await client.export_dashboard(schedule.dashboard, schedule.format, schedule.filters)
+    return await client.export_chart(schedule.chart)
+
+
+async def get_export(schedule: ReportSchedule) -> bytes:
+    """Выгрузка для расписания. Расписания с тем же дашбордом, фильтрами и интервалом получают одну выгрузку:
+    готовая берется из кэша, а если она еще готовится — ожидается та же задача."""
+    key = schedule.cache_key
+    now = time.time()
+    for cached_key in [k for k, (created, _) in _export_cache.items() if now - created > Config.SUPERSET_EXPORT_CACHE_TTL]:
+        del _export_cache[cached_key]
+
+    if key in _export_cache:
+        logger.info(f"Выгрузка Superset {key[:3]} взята из кэша")
+        return _export_cache[key][1]
+
+    task = _inflight_exports.get(key)
+    if task is None:
+        task = asyncio.create_task(_export(schedule))
+        _inflight_exports[key] = task
+        task.add_done_callback(lambda _: _inflight_exports.pop(key, None))
+    # shield: отмена одного из ожидающих не должна отменять выгрузку для остальных
+    content = await asyncio.shield(task)
+    _export_cache[key] = (time.time(), content)
+    return content
+
+
+async def run_schedule(schedule: ReportSchedule):
+    """Выгружает отчет из Superset и рассылает его получателям каждого ящика расписания"""
+    tenant = get_tenant(schedule.tenant) if schedule.tenant else current_tenant()
+    name = f"dashboard {schedule.dashboard}" if schedule.dashboard else f"chart {schedule.chart}"
+    started_ns = time.time_ns()
+    try:
+        content = await get_export(schedule)
+    except Exception as e:
+        logger.error(f"Не удалось выгрузить {name} из Superset: {e}", exc_info=True)
+        return
+    finished_ns = time.time_ns()
+
+    now = datetime.now(_MOSCOW_TZ)
+    subject = report_subject(schedule.subject, now.strftime('%d.%m.%Y %H:%M'))
+    base_name = schedule.subject.strip() or name.replace(" ", "_")
+    filename = f"{base_name} {now.strftime('%d.%m.%Y %H_%M')}.{schedule.format}"
+
+    with use_tenant(tenant):
+        for mailbox in schedule.mailboxes:
+            trace = Span("report", start_ns=started_ns, mailbox=mailbox, tenant=tenant.name, source="superset",
+                         subject=subject)
+            trace.child("superset.export", start_ns=started_ns, report=name, format=schedule.format,
+                        bytes=len(content)).end(end_ns=finished_ns)
+            schedule_delivery(mailbox, subject, [(filename, content)], trace)
+
+
+def load_schedules() -> list[ReportSchedule]:
+    """Расписания из SUPERSET_SCHEDULES_FILE (JSON-список)"""
+    with open(Config.SUPERSET_SCHEDULES_FILE, encoding="utf-8") as f:
+        schedules = [ReportSchedule(**item) for item in json.load(f)]
+    for schedule in schedules:
+        if bool(schedule.dashboard) == bool(schedule.chart):
+            raise ValueError(f"В расписании {schedule.cron} нужно указать либо dashboard, либо chart")
+        if schedule.format not in _CONTENT_TYPES or (schedule.chart and schedule.format != "png"):
+            raise ValueError(f"Неподдерживаемый формат выгрузки {schedule.format} в расписании {schedule.cron}")
+        if schedule.tenant:
+            get_tenant(schedule.tenant)
+        elif len(get_tenants()) > 1:
+            # Cron запускает выгрузку вне контекста тенанта — без явного тенанта ящики не найти
+            raise ValueError(f"В расписании {schedule.cron} нужно указать tenant: тенантов несколько")
+    return schedules
+
+
+def start_superset_schedules() -> list[aiocron.Cron]:
+    """Запускает выгрузки из Superset по расписаниям (время — московское)"""
+    schedules = load_schedules()
+    crons = [aiocron.crontab(schedule.cron, func=run_schedule, args=(schedule,), start=True, tz=_MOSCOW_TZ)
+             for schedule in schedules]
+    logger.info(f"Запущено расписаний выгрузки из Superset: {len(crons)}")
+    return crons
+
+
+def main():
+    """Разовая выгрузка в файл — для проверки доступа к Superset (или его заглушке) без рассылки"""
+    parser = argparse.ArgumentParser(prog="python -m superset_api", description="Выгрузка отчета из Superset")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--dashboard", type=int)
+    target.add_argument("--chart", type=int)
+    parser.add_argument("--format", choices=sorted(_CONTENT_TYPES), default="png")
+    parser.add_argument("--filters", default="{}", help="состояние нативных фильтров дашборда (dataMask), JSON")
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    async def run():
+        schedule = ReportSchedule(cron="", mailboxes=[], dashboard=args.dashboard, chart=args.chart,
+                                  format=args.format, filters=json.loads(args.filters))
+        try:
+            content = await _export(schedule)
+        finally:
+            await close_client()
+        with open(args.output, "wb") as f:
+            f.write(content)
+        print(f"{args.output}: {len(content)} байт")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
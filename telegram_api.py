@@ -3,6 +3,7 @@ from aiogram.types import ChatMemberUpdated
 import logging
 
 from seatable_api import register_group
+from recipients import deactivate_recipient, reactivate_recipient
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -11,9 +12,22 @@ logger = logging.getLogger(__name__)
 async def on_my_chat_member_updated(event: ChatMemberUpdated):
     """Отслеживает, как меняется статус бота — в какую группу его добавляют, становится там участником
     или администратором, или покидает группу. Если бот становится администратором в группе, то вызывается
-    функция регистрации группы. Остальные изменения статусов игнорируются."""
+    функция регистрации группы. Если бота удалили или заблокировали, получатель помечается недоступным,
+    а когда бота возвращают — снова доступным."""
     logger.info(f"Получено событие my_chat_member: {event.model_dump()}")
 
+    # Бота удалили из группы или заблокировали в личном чате — больше не отправляем туда отчеты,
+    # снова добавили или разблокировали — возобновляем рассылку
+    if event.new_chat_member.user.id == event.bot.id:
+        new_status = event.new_chat_member.status
+        try:
+            if new_status in ("kicked", "left"):
+                await deactivate_recipient(event.chat.id, f"статус бота в чате: {new_status}")
+            elif new_status in ("member", "administrator", "creator"):
+                await reactivate_recipient(event.chat.id)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении статуса получателя: {str(e)}", exc_info=True)
+
     if (event.new_chat_member.status in ("administrator", "creator") and
             event.new_chat_member.user.id == event.bot.id):
 
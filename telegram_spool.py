@@ -0,0 +1,72 @@
+import time
+import uuid
+import shutil
+import logging
+from pathlib import Path, PurePosixPath
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Когда последний раз удалялись забытые файлы (после падения процесса посреди рассылки)
+_last_cleanup = {"at": 0.0}
+
+
+def spool_enabled() -> bool:
+    """Файлы передаются локальному серверу Bot API путем на диске, а не телом запроса"""
+    return bool(Config.TELEGRAM_API_SERVER)
+
+
+def _safe_filename(filename: str) -> str:
+    # Имя файла в Telegram берется из пути, поэтому оно сохраняется, но без каталогов.
+    # Путь передается в file:// без кодирования, поэтому % заменяется
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1].replace("%", "_").strip()
+    return name or "report"
+
+
+def create_spool(filename: str) -> Path:
+    """Путь для нового файла в TELEGRAM_SPOOL_DIR, в отдельном каталоге на каждое вложение"""
+    _cleanup_stale()
+    directory = Path(Config.TELEGRAM_SPOOL_DIR) / uuid.uuid4().hex
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / _safe_filename(filename)
+
+
+def write_spool(filename: str, content: bytes) -> Path:
+    """Записывает вложение в TELEGRAM_SPOOL_DIR.
+    Вызывается из потока: запись больших файлов не должна блокировать цикл событий."""
+    path = create_spool(filename)
+    path.write_bytes(content)
+    return path
+
+
+def remove_spool(path: Path):
+    shutil.rmtree(path.parent, ignore_errors=True)
+
+
+def local_uri(path: Path) -> str:
+    """Адрес файла для сервера Bot API: file:// с путем, каким его видит сервер
+    (TELEGRAM_SPOOL_SERVER_DIR, если каталог смонтирован у сервера по другому пути)."""
+    path = path.resolve()
+    if Config.TELEGRAM_SPOOL_SERVER_DIR:
+        relative = path.relative_to(Path(Config.TELEGRAM_SPOOL_DIR).resolve())
+        path = PurePosixPath(Config.TELEGRAM_SPOOL_SERVER_DIR, *relative.parts)
+    return f"file://{path.as_posix()}"
+
+
+def _cleanup_stale():
+    """Удаляет файлы, оставшиеся от прерванных рассылок, — не чаще раза в минуту"""
+    now = time.time()
+    if now - _last_cleanup["at"] < 60:
+        return
+    _last_cleanup["at"] = now
+    spool_dir = Path(Config.TELEGRAM_SPOOL_DIR)
+    if not spool_dir.is_dir():
+        return
+    for directory in spool_dir.iterdir():
+        try:
+            if now - directory.stat().st_mtime > Config.TELEGRAM_SPOOL_TTL:
+                shutil.rmtree(directory, ignore_errors=True)
+                logger.info(f"Удален забытый файл отправки {directory}")
+        except OSError:
+            continue
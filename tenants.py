@@ -0,0 +1,162 @@
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+
+from bot import create_bot, default_bot
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Tenant:
+    """Подразделение со своим ботом, своей базой SeaTable и своими почтовыми ящиками.
+    Все тенанты работают в одном процессе: общие цикл событий, пулы HTTP-соединений и планировщик отправок,
+    а кэши SeaTable, локальная копия таблиц и список недоступных получателей у каждого свои."""
+    name: str
+    bot_token: str
+    seatable_server: str
+    seatable_api_token: str
+    users_table: str
+    mailboxes_table: str
+    chats_table: str
+    # Ящики для IMAP: [{"email": ..., "password": ..., "imap": ...}]
+    mailboxes: list[dict] = field(default_factory=list)
+    snapshot_path: str = ""
+    recipients_db_path: str = ""
+    bot: Bot | None = field(default=None, repr=False)
+
+
+_tenants: dict[str, Tenant] = {}
+_current_tenant: ContextVar[Tenant | None] = ContextVar("current_tenant", default=None)
+
+
+def _tenant_path(path: str, name: str) -> str:
+    """Путь к файлу тенанта рядом с файлом по умолчанию: data/recipients.sqlite3 -> data/recipients.sales.sqlite3"""
+    if not path:
+        return ""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}.{name}{path.suffix}"))
+
+
+def _default_tenant() -> Tenant:
+    """Тенант из переменных окружения — так бот работает, если TENANTS_FILE не задан."""
+    mailboxes = [
+        {"email": email, "password": password, "imap": Config.IMAP_SERVER}
+        for email, password in (
+            (Config.IMAP_EMAIL_SR01, Config.IMAP_PASSWORD_SR01),
+            (Config.IMAP_EMAIL_SR02, Config.IMAP_PASSWORD_SR02),
+            (Config.IMAP_EMAIL_SR03, Config.IMAP_PASSWORD_SR03),
+            (Config.IMAP_EMAIL_SR04, Config.IMAP_PASSWORD_SR04),
+        )
+        if email
+    ]
+    return Tenant(
+        name="default",
+        bot_token=Config.BOT_TOKEN,
+        seatable_server=Config.SEATABLE_SERVER,
+        seatable_api_token=Config.SEATABLE_API_TOKEN,
+        users_table=Config.SEATABLE_USERS_TABLE_ID,
+        mailboxes_table=Config.SEATABLE_MAILBOXES_TABLE_ID,
+        chats_table=Config.SEATABLE_T_CHATS_TABLE_ID,
+        mailboxes=mailboxes,
+        snapshot_path=Config.SEATABLE_SNAPSHOT_PATH,
+        recipients_db_path=Config.RECIPIENTS_DB_PATH,
+    )
+
+
+def _tenant_from_json(data: dict) -> Tenant:
+    """Тенант из описания в TENANTS_FILE. Не указанные параметры SeaTable и IMAP берутся из окружения."""
+    name = data["name"]
+    imap_server = data.get("imap_server", Config.IMAP_SERVER)
+    return Tenant(
+        name=name,
+        bot_token=data["bot_token"],
+        seatable_server=data.get("seatable_server", Config.SEATABLE_SERVER),
+        seatable_api_token=data["seatable_api_token"],
+        users_table=data.get("users_table", Config.SEATABLE_USERS_TABLE_ID),
+        mailboxes_table=data.get("mailboxes_table", Config.SEATABLE_MAILBOXES_TABLE_ID),
+        chats_table=data.get("chats_table", Config.SEATABLE_T_CHATS_TABLE_ID),
+        mailboxes=[{"imap": imap_server, **mailbox} for mailbox in data.get("mailboxes", [])],
+        snapshot_path=data.get("snapshot_path", _tenant_path(Config.SEATABLE_SNAPSHOT_PATH, name)),
+        recipients_db_path=data.get("recipients_db_path", _tenant_path(Config.RECIPIENTS_DB_PATH, name)),
+    )
+
+
+def load_tenants() -> list[Tenant]:
+    """Загружает тенантов из TENANTS_FILE (JSON-список) или, если файл не задан, один тенант из окружения.
+    Ботам тенантов выдается общая HTTP-сессия Telegram."""
+    if _tenants:
+        return list(_tenants.values())
+
+    if Config.TENANTS_FILE:
+        with open(Config.TENANTS_FILE, encoding="utf-8") as f:
+            tenants = [_tenant_from_json(item) for item in json.load(f)]
+    else:
+        tenants = [_default_tenant()]
+
+    for tenant in tenants:
+        if tenant.name in _tenants:
+            raise ValueError(f"Тенант {tenant.name} описан в {Config.TENANTS_FILE} несколько раз")
+        tenant.bot = default_bot() if tenant.bot_token == Config.BOT_TOKEN else create_bot(tenant.bot_token)
+        _tenants[tenant.name] = tenant
+
+    logger.info(f"Загружено тенантов: {len(tenants)} ({', '.join(_tenants)})")
+    return tenants
+
+
+def get_tenants() -> list[Tenant]:
+    return load_tenants()
+
+
+def get_tenant(name: str) -> Tenant:
+    for tenant in load_tenants():
+        if tenant.name == name:
+            return tenant
+    raise LookupError(f"Тенант {name} не найден")
+
+
+def current_tenant() -> Tenant:
+    """Тенант, в контексте которого выполняется код. Вне контекста — единственный тенант;
+    если тенантов несколько, выбрать за вызывающего нельзя, и это ошибка."""
+    tenant = _current_tenant.get()
+    if tenant is not None:
+        return tenant
+    tenants = load_tenants()
+    if len(tenants) > 1:
+        raise RuntimeError("Вызов вне контекста тенанта (use_tenant), а тенантов несколько")
+    return tenants[0]
+
+
+@contextmanager
+def use_tenant(tenant: Tenant):
+    """Выполняет блок в контексте тенанта. Задачи и потоки, запущенные внутри через
+    asyncio.create_task или contextvars.copy_context(), наследуют этот контекст."""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_for_bot(bot: Bot) -> Tenant:
+    for tenant in load_tenants():
+        if tenant.bot_token == bot.token:
+            return tenant
+    raise LookupError(f"Нет тенанта для бота {bot.id}")
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Выполняет обработчики апдейта в контексте тенанта, которому принадлежит бот"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        with use_tenant(tenant_for_bot(data["bot"])):
+            return await handler(event, data)
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Настройки бота читаются при импорте config, поэтому окружение задается до импорта модулей бота
+_DATA_DIR = Path(tempfile.mkdtemp(prefix="sset-bot-tests-"))
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "TENANTS_FILE": "",
+    "TELEGRAM_API_SERVER": "",
+    "SEATABLE_SERVER": "http://127.0.0.1:9",
+    "SEATABLE_API_TOKEN": "api-token",
+    "SEATABLE_USERS_TABLE_ID": "Users",
+    "SEATABLE_MAILBOXES_TABLE_ID": "Mailboxes",
+    "SEATABLE_T_CHATS_TABLE_ID": "T_chats",
+    "SEATABLE_SNAPSHOT_PATH": str(_DATA_DIR / "seatable_snapshot.sqlite3"),
+    "RECIPIENTS_DB_PATH": str(_DATA_DIR / "recipients.sqlite3"),
+    "TELEGRAM_SPOOL_DIR": str(_DATA_DIR / "telegram_spool"),
+    "DELIVERY_HISTORY_URL": "",
+    "TRACING_ENABLED": "false",
+    "WATCHDOG_ENABLED": "false",
+})
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def seatable_state(monkeypatch):
+    """Чистые кэши seatable_api для теста: каждый тест работает в своем цикле событий"""
+    import seatable_api
+    from config import Config
+
+    monkeypatch.setattr(Config, "SEATABLE_RATE_LIMIT", 60_000)
+    monkeypatch.setattr(Config, "SEATABLE_RATE_BURST", 1000)
+    for cache in (seatable_api._token_caches, seatable_api._rows_caches, seatable_api._background_refreshes,
+                  seatable_api._live_updates, seatable_api._inflight_requests, seatable_api._rate_limiters,
+                  seatable_api._throttles):
+        cache.clear()
+    seatable_api._http["session"] = None
+    yield seatable_api
+    seatable_api._http["session"] = None
@@ -0,0 +1,62 @@
+import asyncio
+from pathlib import Path
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+
+class FakeBotAPI:
+    """Заглушка сервера Bot API для sendDocument. Для каждой отправки запоминает, как пришел файл:
+    телом multipart (публичный API) или путем file:// (локальный сервер) — тогда файл читается с диска,
+    как это делает telegram-bot-api --local."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.documents: list[dict] = []
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/sendDocument", self._send_document)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def __aenter__(self) -> "FakeBotAPI":
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    def bot(self, token: str, local: bool) -> Bot:
+        return Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(self.url, is_local=local)))
+
+    async def _send_document(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        document = form["document"]
+        if isinstance(document, str) and document.startswith("attach://"):
+            # Файл телом запроса: поле document ссылается на часть multipart
+            document = form[document.removeprefix("attach://")]
+        if isinstance(document, str):
+            if not document.startswith("file://"):
+                return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: wrong file"},
+                                         status=400)
+            path = Path(document.removeprefix("file://"))
+            await asyncio.sleep(self.delay)
+            # Сервер читает файл, когда дошел до отправки: к этому времени он должен еще лежать на диске
+            content = path.read_bytes() if path.exists() else None
+            self.documents.append({"chat_id": form["chat_id"], "path": str(path), "filename": path.name,
+                                   "content": content})
+        else:
+            await asyncio.sleep(self.delay)
+            self.documents.append({"chat_id": form["chat_id"], "path": None, "filename": document.filename,
+                                   "content": document.file.read()})
+        chat_id = int(form["chat_id"])
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(self.documents), "date": 0,
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group", "title": "Отчеты"},
+        }})
@@ -0,0 +1,148 @@
+import re
+import json
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import socketio
+from aiohttp import web
+
+DTABLE_UUID = "0d2c6c9a-6bc6-4f9e-9a8e-1c9d8e0f0001"
+ACCESS_TOKEN = "base-access-token"
+
+
+def mtime(offset_s: float = 0) -> str:
+    moment = datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=offset_s)
+    return moment.isoformat(timespec="milliseconds")
+
+
+class FakeSeaTable:
+    """Заглушка SeaTable для тестов: токен базы, метаданные, строки таблиц, SQL-запросы по _mtime
+    и сервер событий socket.io, который рассылает update-dtable подключенным клиентам."""
+
+    def __init__(self, tables: dict[str, list[dict]], api_token: str = "api-token"):
+        self.tables = tables
+        self.table_ids = {name: f"tbl{i}" for i, name in enumerate(tables)}
+        self.api_token = api_token
+        self.requests: Counter[str] = Counter()
+        # Если False, новые подключения к серверу событий отклоняются
+        self.accept_connections = True
+        self.joined: set[str] = set()
+        # Задержка ответа на чтение строк — чтобы одновременные запросы успели пересечься
+        self.rows_delay = 0.0
+        # Сколько следующих чтений строк отклонить с 429 и каким Retry-After
+        self.rate_limited = 0
+        self.retry_after = 1.0
+        self.rows_times: list[float] = []
+        self._clock = 0
+
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application()
+        self.sio.attach(self.app, socketio_path="dtable-server/socket.io")
+        self.app.router.add_get("/api/v2.1/dtable/app-access-token/", self._token)
+        self.app.router.add_get(f"/dtable-server/api/v1/dtables/{DTABLE_UUID}/metadata/", self._metadata)
+        self.app.router.add_get(f"/dtable-server/api/v1/dtables/{DTABLE_UUID}/rows/", self._rows)
+        self.app.router.add_put(f"/dtable-server/api/v1/dtables/{DTABLE_UUID}/rows/", self._update)
+        self.app.router.add_post(f"/dtable-db/api/v1/query/{DTABLE_UUID}/", self._query)
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.sio.on("join-room", self._on_join)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def __aenter__(self) -> "FakeSeaTable":
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    def _authorized(self, request: web.Request, token: str) -> bool:
+        return request.headers.get("Authorization", "").lower() == f"bearer {token}".lower()
+
+    async def _token(self, request: web.Request):
+        self.requests["token"] += 1
+        if not self._authorized(request, self.api_token):
+            return web.json_response({"error_msg": "Permission denied."}, status=403)
+        return web.json_response({
+            "app_name": "app_bot", "access_token": ACCESS_TOKEN, "dtable_uuid": DTABLE_UUID,
+            "dtable_server": f"{self.url}/dtable-server/", "dtable_socket": self.url,
+            "dtable_db": f"{self.url}/dtable-db/", "workspace_id": 1, "dtable_name": "test",
+        })
+
+    async def _metadata(self, request: web.Request):
+        self.requests["metadata"] += 1
+        tables = [{"_id": table_id, "name": name} for name, table_id in self.table_ids.items()]
+        return web.json_response({"metadata": {"tables": tables}})
+
+    async def _rows(self, request: web.Request):
+        self.requests["rows"] += 1
+        self.rows_times.append(asyncio.get_running_loop().time())
+        if not self._authorized(request, ACCESS_TOKEN):
+            return web.json_response({"error_msg": "Permission denied."}, status=403)
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return web.json_response({"detail": "Request was throttled."}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        await asyncio.sleep(self.rows_delay)
+        return web.json_response({"rows": self.tables.get(request.query["table_name"], [])})
+
+    async def _update(self, request: web.Request):
+        self.requests["update"] += 1
+        data = await request.json()
+        self.update_row(data["table_name"], data["row_id"], **data["row"])
+        return web.json_response({"success": True})
+
+    async def _query(self, request: web.Request):
+        self.requests["query"] += 1
+        sql = (await request.json())["sql"]
+        match = re.search(r"FROM `([^`]+)` WHERE _mtime > '([^']*)'", sql)
+        table_name, since = match.groups()
+        results = [row for row in self.tables.get(table_name, []) if (row.get("_mtime") or "") > since]
+        return web.json_response({"success": True, "results": results})
+
+    async def _on_connect(self, sid, environ, auth=None):
+        if not self.accept_connections:
+            return False
+
+    async def _on_disconnect(self, sid, *args):
+        self.joined.discard(sid)
+
+    async def _on_join(self, sid, dtable_uuid, access_token):
+        if dtable_uuid == DTABLE_UUID and access_token == ACCESS_TOKEN:
+            self.joined.add(sid)
+
+    def update_row(self, table_name: str, row_id: str, **values):
+        """Меняет строку так, как ее изменил бы администратор в интерфейсе SeaTable (с новым _mtime)"""
+        self._clock += 1
+        for row in self.tables[table_name]:
+            if row["_id"] == row_id:
+                row.update(values, _mtime=mtime(self._clock))
+
+    def delete_row(self, table_name: str, row_id: str):
+        self.tables[table_name] = [row for row in self.tables[table_name] if row["_id"] != row_id]
+
+    async def emit_update(self, table_name: str, op_type: str = "modify_row"):
+        operation = {"op_type": op_type, "table_id": self.table_ids[table_name], "row_id": "any"}
+        await self.sio.emit("update-dtable", json.dumps(operation))
+
+    async def disconnect_clients(self):
+        for sid in list(self.joined):
+            await self.sio.disconnect(sid)
+
+    async def wait_joined(self, timeout: float = 5.0):
+        await wait_for(lambda: self.joined, timeout)
+
+
+async def wait_for(condition, timeout: float = 5.0, interval: float = 0.02):
+    """Ждет, пока condition() не станет истинным; по истечении timeout — AssertionError"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("условие не выполнилось за отведенное время")
+        await asyncio.sleep(interval)
@@ -0,0 +1,101 @@
+import asyncio
+from collections import Counter
+
+from aiohttp import web
+
+PNG = b"\x89PNG\r\n\x1a\nfake-png"
+PDF = b"%PDF-1.4 fake-pdf"
+
+
+class FakeSuperset:
+    """Заглушка REST API Superset для тестов: вход, CSRF-токен и асинхронные снимки дашбордов и графиков.
+    Снимок отдается со статусом 202, пока его не опросят ready_after раз, затем — 200 с файлом."""
+
+    def __init__(self, ready_after: int = 1, screenshot_delay: float = 0.0):
+        self.ready_after = ready_after
+        # Задержка ответа на запуск снимка — чтобы одновременные выгрузки успели пересечься
+        self.screenshot_delay = screenshot_delay
+        self.requests: Counter[str] = Counter()
+        self.dashboard_states: list[dict] = []
+        self._tokens: set[str] = set()
+        self._polls: Counter[str] = Counter()
+
+        self.app = web.Application()
+        self.app.router.add_post("/api/v1/security/login", self._login)
+        self.app.router.add_get("/api/v1/security/csrf_token/", self._csrf_token)
+        self.app.router.add_post("/api/v1/dashboard/{id}/cache_dashboard_screenshot/", self._cache_dashboard)
+        self.app.router.add_get("/api/v1/dashboard/{id}/screenshot/{key}/", self._screenshot)
+        self.app.router.add_get("/api/v1/chart/{id}/cache_screenshot/", self._cache_chart)
+        self.app.router.add_get("/api/v1/chart/{id}/screenshot/{key}/", self._screenshot)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def __aenter__(self) -> "FakeSuperset":
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    def expire_tokens(self):
+        """Все выданные токены доступа становятся недействительными — следующий запрос получит 401"""
+        self._tokens.clear()
+
+    def _authorized(self, request: web.Request) -> bool:
+        return request.headers.get("Authorization", "").removeprefix("Bearer ") in self._tokens
+
+    async def _login(self, request: web.Request) -> web.Response:
+        self.requests["login"] += 1
+        body = await request.json()
+        if (body.get("username"), body.get("password")) != ("admin", "secret"):
+            return web.json_response({"message": "Not authorized"}, status=401)
+        token = f"access-{self.requests['login']}"
+        self._tokens.add(token)
+        return web.json_response({"access_token": token, "refresh_token": "refresh"})
+
+    async def _csrf_token(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({"msg": "Token has expired"}, status=401)
+        return web.json_response({"result": "csrf-token"})
+
+    async def _cache_dashboard(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({"msg": "Token has expired"}, status=401)
+        if request.headers.get("X-CSRFToken") != "csrf-token":
+            return web.json_response({"errors": ["CSRF token missing"]}, status=400)
+        self.requests["dashboard"] += 1
+        self.dashboard_states.append(await request.json())
+        await asyncio.sleep(self.screenshot_delay)
+        dashboard_id = request.match_info["id"]
+        key = f"dashboard-{dashboard_id}-{self.requests['dashboard']}"
+        return web.json_response({"cache_key": key, "dashboard_url": f"{self.url}/superset/dashboard/{dashboard_id}/",
+                                  "image_url": f"{self.url}/api/v1/dashboard/{dashboard_id}/screenshot/{key}/"},
+                                 status=202)
+
+    async def _cache_chart(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({"msg": "Token has expired"}, status=401)
+        self.requests["chart"] += 1
+        await asyncio.sleep(self.screenshot_delay)
+        chart_id = request.match_info["id"]
+        key = f"chart-{chart_id}-{self.requests['chart']}"
+        # Без image_url: клиент строит адрес снимка по cache_key
+        return web.json_response({"cache_key": key, "chart_url": f"{self.url}/explore/?slice_id={chart_id}"},
+                                 status=202)
+
+    async def _screenshot(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({"msg": "Token has expired"}, status=401)
+        self.requests["poll"] += 1
+        key = request.match_info["key"]
+        self._polls[key] += 1
+        if self._polls[key] <= self.ready_after:
+            return web.json_response({"message": "OK"}, status=202)
+        if request.query.get("download_format") == "pdf":
+            return web.Response(body=PDF, content_type="application/pdf")
+        return web.Response(body=PNG, content_type="image/png")
@@ -0,0 +1,71 @@
+"""Ответы UID FETCH в том виде, в каком их возвращает imaplib: литерал {n} приходит кортежем
+(строка до литерала включительно, данные литерала), остаток строки — следующим элементом."""
+
+HEADER = (b'From: reports@example.com\r\n'
+          b'Subject: =?utf-8?B?0J7RgtGH0LXRgiDQv9C+INC/0YDQvtC00LDQttCw0Lw=?=\r\n'
+          b'Content-Type: multipart/mixed; boundary="mix"\r\n\r\n')
+
+
+def literal(head: bytes, data: bytes) -> tuple[bytes, bytes]:
+    return head + b'{%d}' % len(data), data
+
+
+# multipart/mixed: alternative (text + html) и related (PDF с именем, PNG без параметров и без имени)
+NESTED_STRUCTURE = (
+    b'((("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 12 1 NIL NIL NIL NIL)'
+    b'("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 30 1 NIL NIL NIL NIL) "alternative" ("boundary" "alt") NIL NIL NIL)'
+    b'(("application" "pdf" ("name" "report.pdf") NIL NIL "base64" 4000 NIL ("attachment" ("filename" "report.pdf")) NIL NIL)'
+    b'("image" "png" NIL NIL NIL "base64" 2000 NIL ("inline" NIL) NIL NIL) "related" ("boundary" "rel") NIL NIL NIL)'
+    b' "mixed" ("boundary" "mix") NIL NIL NIL)'
+)
+NESTED = [
+    literal(b'1 (UID 101 RFC822.SIZE 6512 BODYSTRUCTURE ' + NESTED_STRUCTURE + b' BODY[HEADER] ', HEADER),
+    b')',
+]
+
+# Имена по RFC 2231: закодированное filename*, продолжение filename*0* и xlsx, который не рассылается
+RFC2231 = [
+    literal(b'2 (UID 102 RFC822.SIZE 9000 BODYSTRUCTURE ('
+            b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 5 1 NIL NIL NIL NIL)'
+            b'("application" "octet-stream" NIL NIL NIL "base64" 100 NIL'
+            b' ("attachment" ("filename*" "utf-8\'\'%D0%9E%D1%82%D1%87%D0%B5%D1%82.pdf")) NIL NIL)'
+            b'("application" "octet-stream" NIL NIL NIL "base64" 100 NIL'
+            b' ("attachment" ("filename*0*" "utf-8\'\'%D0%9E%D1%82" "filename*1*" "%D1%87%D0%B5%D1%82.png")) NIL NIL)'
+            b'("application" "vnd.ms-excel" NIL NIL NIL "base64" 100 NIL'
+            b' ("attachment" ("filename*" "utf-8\'\'%D0%94%D0%B0%D0%BD%D0%BD%D1%8B%D0%B5.xlsx")) NIL NIL)'
+            b' "mixed" ("boundary" "mix") NIL NIL NIL) BODY[HEADER] ', HEADER),
+    b')',
+]
+
+# Имя файла с не-ASCII символами сервер прислал литералом внутри BODYSTRUCTURE
+LITERAL_NAME = [
+    literal(b'3 (UID 103 RFC822.SIZE 3000 BODYSTRUCTURE (("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 5 1 NIL NIL NIL NIL)'
+            b'("application" "pdf" ("name" ', 'Отчет за "май".pdf'.encode()),
+    literal(b') NIL NIL "base64" 2000 NIL NIL NIL NIL) "mixed" ("boundary" "mix") NIL NIL NIL) BODY[HEADER] ', HEADER),
+    b')',
+]
+
+# Письмо без отчетов: только текст и xlsx
+NO_REPORTS = [
+    literal(b'4 (UID 104 RFC822.SIZE 1500 BODYSTRUCTURE (("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 5 1 NIL NIL NIL NIL)'
+            b'("application" "vnd.openxmlformats-officedocument.spreadsheetml.sheet" ("name" "report.xlsx") NIL NIL "base64" 800 NIL'
+            b' ("attachment" ("filename" "report.xlsx")) NIL NIL) "mixed" ("boundary" "mix") NIL NIL NIL) BODY[HEADER] ', HEADER),
+    b')',
+]
+
+PDF_MIME = b'Content-Type: application/pdf; name="report.pdf"\r\nContent-Transfer-Encoding: base64\r\n\r\n'
+PDF_BODY = b'JVBERi0xLjQKJcfsj6IK\r\n'
+
+# Ответ на выборку части 2.1 письма NESTED
+NESTED_PARTS = [
+    literal(b'1 (UID 101 BODY[2.1.MIME] ', PDF_MIME),
+    literal(b' BODY[2.1] ', PDF_BODY),
+    b')',
+]
+
+# Письмо не multipart: само тело — PDF
+SINGLE_PART = [
+    literal(b'5 (UID 105 RFC822.SIZE 500 BODYSTRUCTURE ("application" "pdf" ("name" "report.pdf") NIL NIL "base64" 400'
+            b' NIL NIL NIL NIL) BODY[HEADER] ', b'Subject: report\r\nContent-Type: application/pdf\r\n\r\n'),
+    b')',
+]
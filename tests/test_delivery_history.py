@@ -0,0 +1,102 @@
+import sys
+import sqlite3
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import delivery_history
+from config import Config
+from delivery_history import DeliveryHistory
+from fake_seatable import wait_for
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    """Временная база истории; пачки по три записи, сброс по таймеру не успевает сработать в тесте"""
+    monkeypatch.setattr(Config, "DELIVERY_HISTORY_BATCH", 3)
+    monkeypatch.setattr(Config, "DELIVERY_HISTORY_FLUSH_INTERVAL", 60)
+    return tmp_path / "history.sqlite3"
+
+
+def _url(path) -> str:
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def _row(chat_id: str, outcome: str = "sent", latency_ms: int | None = 1000, error: str | None = None, **row) -> dict:
+    """Запись со всеми колонками, как ее передает планировщик"""
+    return {"tenant": "default", "mailbox": "sr01@company.ru", "uid": "101", "trace_id": None,
+            "subject": "Продажи 19.10.2026 09:00", "chat_id": chat_id, "filename": "report.pdf", "bytes": 1024,
+            "queue_wait_ms": 100, "latency_ms": latency_ms, "outcome": outcome, "error": error, **row}
+
+
+def _stored(path) -> list[str]:
+    with sqlite3.connect(path) as db:
+        # Таблица создается при первом сбросе
+        if not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'deliveries'").fetchone():
+            return []
+        return [chat_id for chat_id, in db.execute("SELECT chat_id FROM deliveries ORDER BY id")]
+
+
+def test_records_are_written_in_batches(database):
+    async def scenario():
+        history = DeliveryHistory(_url(database))
+        history.record(**_row("1"))
+        history.record(**_row("2"))
+        await asyncio.sleep(0.1)
+        # Пачка еще не набралась — в базу ничего не записано
+        assert _stored(database) == []
+
+        history.record(**_row("3"))
+        await wait_for(lambda: _stored(database) == ["1", "2", "3"])
+        await history.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_flushes_buffer_and_waits_for_writer(database):
+    async def scenario():
+        history = DeliveryHistory(_url(database))
+        for chat_id in ("1", "2", "3"):
+            history.record(**_row(chat_id))
+        # Писатель забрал пачку из буфера и пишет ее — в этот момент бот останавливается
+        await wait_for(lambda: not history._buffer, interval=0)
+        history.record(**_row("4"))
+        await history.close()
+
+    asyncio.run(scenario())
+
+    assert _stored(database) == ["1", "2", "3", "4"]
+
+
+def test_cli_lookup_and_stats(database, monkeypatch, capsys):
+    async def fill():
+        history = DeliveryHistory(_url(database))
+        attempted_at = datetime(2026, 10, 19, 6, 0, tzinfo=timezone.utc)
+        history.record(**_row("-1001", attempted_at=attempted_at))
+        history.record(**_row("-1001", outcome="failed", latency_ms=None, error="Bad Request: chat not found",
+                              attempted_at=attempted_at))
+        history.record(**_row("1002", latency_ms=3000, attempted_at=attempted_at))
+        await history.close()
+
+    asyncio.run(fill())
+
+    monkeypatch.setattr(sys, "argv", ["delivery_history", "--url", _url(database),
+                                      "lookup", "--chat", "-1001", "--since", "2026-10-19"])
+    delivery_history.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert all(line.startswith("19.10.2026 09:00:00") and "-1001" in line for line in lines)
+    assert any("ошибка: Bad Request: chat not found" in line for line in lines)
+
+    monkeypatch.setattr(sys, "argv", ["delivery_history", "--url", _url(database), "stats", "--by", "chat"])
+    delivery_history.main()
+    header, *rows = capsys.readouterr().out.splitlines()
+    stats = {row.split()[0]: row.split()[1:] for row in rows}
+    # Попыток, отправлено и средняя задержка успешных отправок
+    assert (stats["-1001"][:2], stats["-1001"][4]) == (["2", "1"], "1.0с")
+    assert (stats["1002"][:2], stats["1002"][4]) == (["1", "1"], "3.0с")
+
+    monkeypatch.setattr(sys, "argv", ["delivery_history", "--url", _url(database), "lookup", "--chat", "42"])
+    delivery_history.main()
+    assert capsys.readouterr().out.strip() == "Записей не найдено"
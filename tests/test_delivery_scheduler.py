@@ -0,0 +1,105 @@
+import asyncio
+
+import delivery_scheduler as scheduler_module
+from delivery_scheduler import DeliveryScheduler
+from config import Config
+from tenants import current_tenant
+from fake_bot_api import FakeBotAPI
+
+
+class StubBot:
+    """Бот, который «отправляет» документ за delay секунд и запоминает отправки"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.sent: list[tuple[str, object]] = []
+
+    async def send_document(self, chat_id, document, caption=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent.append((chat_id, document))
+
+
+def test_cancelled_waiter_does_not_kill_worker(monkeypatch):
+    bot = StubBot()
+    monkeypatch.setattr(current_tenant(), "bot", bot)
+    recorded = []
+    monkeypatch.setattr(scheduler_module, "record_delivery", lambda **row: recorded.append(row))
+
+    async def scenario():
+        scheduler = DeliveryScheduler()
+        cancelled = scheduler.submit("sr01@example.com", "1001", "report.pdf", b"%PDF", "Отчет")
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0.1)
+
+        assert all(not worker.done() for worker in scheduler._workers)
+        assert [row["outcome"] for row in recorded] == ["sent"]
+        assert not scheduler._busy_chats
+
+        # Следующие отправки идут как обычно
+        await asyncio.wait_for(scheduler.submit("sr01@example.com", "1002", "report.pdf", b"%PDF", None), 5)
+        assert [chat_id for chat_id, _ in bot.sent] == ["1001", "1002"]
+        for worker in scheduler._workers:
+            worker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_failed_send_with_cancelled_waiter(monkeypatch):
+    class FailingBot(StubBot):
+        async def send_document(self, chat_id, document, caption=None, **kwargs):
+            await asyncio.sleep(self.delay)
+            raise RuntimeError("сеть недоступна")
+
+    monkeypatch.setattr(current_tenant(), "bot", FailingBot())
+    recorded = []
+    monkeypatch.setattr(scheduler_module, "record_delivery", lambda **row: recorded.append(row))
+
+    async def scenario():
+        scheduler = DeliveryScheduler()
+        future = scheduler.submit("sr01@example.com", "1001", "report.pdf", b"%PDF", None)
+        await asyncio.sleep(0.01)
+        future.cancel()
+        await asyncio.sleep(0.1)
+
+        assert all(not worker.done() for worker in scheduler._workers)
+        assert [row["outcome"] for row in recorded] == ["failed"]
+        assert "1001" in {chat_id for _, chat_id in scheduler._chat_ready_at}
+        for worker in scheduler._workers:
+            worker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_priority_report_overtakes_bulk_fan_out(monkeypatch):
+    monkeypatch.setattr(Config, "TELEGRAM_SEND_CONCURRENCY", 2)
+    monkeypatch.setattr(Config, "TELEGRAM_RATE_LIMIT", 1000)
+    monkeypatch.setattr(scheduler_module, "record_delivery", lambda **row: None)
+
+    async def scenario():
+        async with FakeBotAPI(delay=0.02) as fake:
+            monkeypatch.setattr(current_tenant(), "bot", fake.bot(Config.BOT_TOKEN, local=False))
+            scheduler = DeliveryScheduler()
+            # Массовая рассылка на 30 чатов с обычным приоритетом
+            bulk = [scheduler.submit("bulk@company.ru", str(1000 + i), "bulk.pdf", b"%PDF bulk", None)
+                    for i in range(30)]
+            await asyncio.sleep(0.05)
+            # Когда часть массовой рассылки уже ушла, одновременно приходят обычный отчет нескольким чатам
+            # и срочный отчет другого ящика
+            regular = [scheduler.submit("regular@company.ru", str(3000 + i), "regular.pdf", b"%PDF regular", None)
+                       for i in range(3)]
+            urgent = scheduler.submit("urgent@company.ru", "2000", "urgent.pdf", b"%PDF urgent", None, priority=10)
+            await asyncio.wait_for(asyncio.gather(urgent, *regular, *bulk), 10)
+            for worker in scheduler._workers:
+                worker.cancel()
+            await current_tenant().bot.session.close()
+            return [document["filename"] for document in fake.documents]
+
+    order = asyncio.run(scenario())
+
+    urgent_position = order.index("urgent.pdf")
+    # До срочного отчета уходят только отправки, уже начатые или отправленные к моменту его постановки
+    assert urgent_position <= 6
+    assert order.count("bulk.pdf") == 30 and urgent_position < len(order) - 20
+    # Срочный отчет обгоняет и обычный, поставленный одновременно с ним
+    assert urgent_position < min(i for i, filename in enumerate(order) if filename == "regular.pdf")
@@ -0,0 +1,38 @@
+import os
+import signal
+import asyncio
+import threading
+import tracemalloc
+
+import diagnostics
+from config import Config
+from fake_seatable import wait_for
+
+
+def test_signals_and_sampler_start_and_stop(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "DIAGNOSTICS_ENABLED", True)
+    monkeypatch.setattr(Config, "DIAGNOSTICS_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "DIAGNOSTICS_SAMPLE_INTERVAL", 0.05)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        diag = diagnostics.setup_diagnostics(loop)
+        assert loop.get_debug() and tracemalloc.is_tracing()
+
+        await wait_for(lambda: "Периодический срез" in (tmp_path / "samples.log").read_text(encoding="utf-8"))
+
+        # SIGUSR1 — снимок памяти, два SIGUSR2 — профиль между ними
+        os.kill(os.getpid(), signal.SIGUSR1)
+        await wait_for(lambda: list(tmp_path.glob("tracemalloc-*.snapshot")))
+        os.kill(os.getpid(), signal.SIGUSR2)
+        await wait_for(lambda: diag._profiler is not None)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        await wait_for(lambda: list(tmp_path.glob("profile-*.txt")))
+
+        diag.disable()
+        assert not any(thread.name == "diagnostics-sampler" for thread in threading.enumerate())
+        assert not loop.remove_signal_handler(signal.SIGUSR1)
+        assert not loop.remove_signal_handler(signal.SIGUSR2)
+        assert not loop.get_debug() and not tracemalloc.is_tracing()
+
+    asyncio.run(scenario())
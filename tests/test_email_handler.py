@@ -0,0 +1,126 @@
+import re
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+import email_handler
+from config import Config
+from email_handler import DELIVERED_KEYWORD
+
+OLD = date(2020, 1, 1)
+
+
+class FakeMailbox:
+    """Ящик на IMAP-сервере: письма с датами и ключевыми словами, поиск по KEYWORD и BEFORE"""
+
+    def __init__(self, messages: dict[str, date]):
+        self.dates = dict(messages)
+        self.keywords: dict[str, set[str]] = {uid: set() for uid in messages}
+        self.deleted: list[str] = []
+        self.moved: list[str] = []
+        self.folder = self
+        # Соединение оборвано: запросы падают с ошибкой
+        self.broken = False
+
+    def uids(self, criteria):
+        criteria = str(criteria)
+        keyword = re.search(r"KEYWORD ([^\s)]+)", criteria)
+        before = re.search(r"BEFORE ([^\s)]+)", criteria)
+        found = []
+        for uid, sent in self.dates.items():
+            if keyword and keyword.group(1) not in self.keywords[uid]:
+                continue
+            if before and sent >= datetime.strptime(before.group(1), "%d-%b-%Y").date():
+                continue
+            found.append(uid)
+        return found
+
+    def flag(self, uids, flag_set, value, chunks=None):
+        if self.broken:
+            raise ConnectionError("connection reset")
+        for uid in uids:
+            if uid in self.keywords:
+                self.keywords[uid].add(flag_set)
+
+    def delete(self, uids, chunks=None):
+        self._remove(uids, self.deleted)
+
+    def move(self, uids, folder, chunks=None):
+        self._remove(uids, self.moved)
+
+    def _remove(self, uids, into):
+        into.extend(uids)
+        for uid in uids:
+            del self.dates[uid], self.keywords[uid]
+
+    def exists(self, folder):
+        return True
+
+
+@pytest.fixture
+def fetchers(monkeypatch):
+    """Создает выборщики ящика reports@example.com, работающие с одним и тем же FakeMailbox"""
+    loop = asyncio.new_event_loop()
+
+    def create(mailbox: FakeMailbox) -> email_handler.MailboxFetcher:
+        fetcher = email_handler.MailboxFetcher({"email": "reports@example.com"}, loop)
+        monkeypatch.setattr(fetcher, "_connection", lambda: mailbox)
+        return fetcher
+
+    yield create
+    loop.close()
+
+
+def test_expunge_keeps_undelivered_messages(monkeypatch, fetchers):
+    monkeypatch.setattr(Config, "IMAP_ARCHIVE_MODE", "expunge")
+    # 10 и 11 доставлены, 12 — рассылка не удалась (last_uid все равно сдвинулся), 5 — не отчет,
+    # 13 доставлено, но еще не вышло за срок хранения
+    mailbox = FakeMailbox({"5": OLD, "10": OLD, "11": OLD, "12": OLD, "13": date.today()})
+    fetcher = fetchers(mailbox)
+    for uid in (10, 11, 13):
+        fetcher.mark_processed(uid)
+
+    fetcher._flag_delivered()
+    fetcher._expunge_expired()
+
+    assert mailbox.deleted == ["10", "11"]
+    assert list(mailbox.dates) == ["5", "12", "13"]
+    assert mailbox.keywords["13"] == {DELIVERED_KEYWORD}
+
+
+@pytest.mark.parametrize("mode", ["expunge", "move"])
+def test_delivery_confirmations_survive_restart(monkeypatch, fetchers, mode):
+    monkeypatch.setattr(Config, "IMAP_ARCHIVE_MODE", mode)
+    mailbox = FakeMailbox({"10": OLD, "11": OLD, "12": OLD})
+    fetcher = fetchers(mailbox)
+    fetcher.mark_processed(10)
+    fetcher.mark_processed(11)
+    fetcher._flag_delivered()
+
+    # Перезапуск бота до прохода архивации: новый выборщик ничего не знает о доставках в памяти
+    restarted = fetchers(mailbox)
+    assert restarted._processed_uids == []
+    restarted._last_archived -= Config.IMAP_ARCHIVE_INTERVAL
+    restarted._archive()
+
+    archived = mailbox.deleted if mode == "expunge" else mailbox.moved
+    assert archived == ["10", "11"]
+    assert list(mailbox.dates) == ["12"]
+
+
+def test_failed_flagging_is_retried(monkeypatch, fetchers):
+    monkeypatch.setattr(Config, "IMAP_ARCHIVE_MODE", "move")
+    mailbox = FakeMailbox({"10": OLD})
+    fetcher = fetchers(mailbox)
+    fetcher.mark_processed(10)
+
+    mailbox.broken = True
+    with pytest.raises(ConnectionError):
+        fetcher._flag_delivered()
+    assert fetcher._processed_uids == ["10"]
+
+    mailbox.broken = False
+    fetcher._flag_delivered()
+    assert mailbox.keywords["10"] == {DELIVERED_KEYWORD}
+    assert fetcher._processed_uids == []
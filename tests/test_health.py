@@ -0,0 +1,55 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+import email_handler
+from config import Config
+from health import Watchdog
+
+
+def test_liveness_without_running_watchdog(monkeypatch):
+    watchdog = Watchdog()
+    # С WATCHDOG_ENABLED=false тики не идут, но бот жив
+    monkeypatch.setattr(watchdog, "_last_tick", time.monotonic() - Config.WATCHDOG_INTERVAL * 10)
+
+    assert watchdog.liveness() == {"alive": True, "watchdog_lag_s": None, "stuck": []}
+
+
+def test_liveness_reports_stalled_watchdog():
+    watchdog = Watchdog()
+
+    async def scenario():
+        watchdog.start()
+        await asyncio.sleep(0)
+        watchdog._last_tick = time.monotonic() - Config.WATCHDOG_INTERVAL * 10
+        state = watchdog.liveness()
+        watchdog._task.cancel()
+        return state
+
+    assert asyncio.run(scenario())["alive"] is False
+
+
+def test_call_in_loop_cancels_coroutine_on_timeout(monkeypatch):
+    monkeypatch.setattr(Config, "WATCHDOG_CALL_TIMEOUT", 0.1)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    cancelled = threading.Event()
+
+    async def stalled_call():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        with pytest.raises(TimeoutError):
+            email_handler._call_in_loop(stalled_call(), loop)
+        assert cancelled.wait(5)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
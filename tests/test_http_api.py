@@ -0,0 +1,114 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+
+import http_api
+from config import Config
+from tenants import current_tenant
+
+HEADERS = {"Authorization": "Bearer secret"}
+
+
+def _setup(monkeypatch, local: bool = False):
+    monkeypatch.setattr(Config, "HTTP_API_TOKEN", "secret")
+    monkeypatch.setattr(Config, "HTTP_API_MAX_UPLOAD_MB", 1)
+    monkeypatch.setattr(Config, "HTTP_API_MAX_REQUEST_MB", 3)
+    monkeypatch.setattr(Config, "TELEGRAM_API_SERVER", "http://127.0.0.1:8081" if local else "")
+
+    async def find_tenant_mailbox(mailbox):
+        return (current_tenant(), mailbox) if mailbox == "box01@mail.ru" else None
+
+    scheduled = []
+    monkeypatch.setattr(http_api, "find_tenant_mailbox", find_tenant_mailbox)
+    monkeypatch.setattr(http_api, "schedule_delivery",
+                        lambda mailbox, subject, attachments, trace: scheduled.append((mailbox, attachments)))
+    return scheduled
+
+
+def _post(files, data=None, headers=HEADERS):
+    async def scenario():
+        transport = httpx.ASGITransport(app=http_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            return await client.post("/reports", headers=headers, files=files,
+                                     data=data or {"mailbox": "box01@mail.ru", "subject": "Продажи"})
+    return asyncio.run(scenario())
+
+
+def _spool_entries() -> set[Path]:
+    spool_dir = Path(Config.TELEGRAM_SPOOL_DIR)
+    return set(spool_dir.iterdir()) if spool_dir.is_dir() else set()
+
+
+def test_upload_is_kept_in_memory_for_public_api(monkeypatch):
+    scheduled = _setup(monkeypatch)
+
+    response = _post([("files", ("Отчет.pdf", b"%PDF-1.4 report", "application/pdf")),
+                      ("files", ("notes.txt", b"text", "text/plain"))])
+
+    assert response.status_code == 202
+    assert response.json()["files"] == ["Отчет.pdf"]
+    assert scheduled == [("box01@mail.ru", [("Отчет.pdf", b"%PDF-1.4 report")])]
+
+
+def test_upload_is_spooled_for_local_api(monkeypatch):
+    scheduled = _setup(monkeypatch, local=True)
+    content = b"\x89PNG" + b"x" * 300_000
+
+    response = _post([("files", ("chart.png", content, "image/png"))])
+
+    assert response.status_code == 202
+    [(mailbox, [(filename, path)])] = scheduled
+    assert filename == "chart.png"
+    # Дальше по рассылке передается путь в TELEGRAM_SPOOL_DIR, а не содержимое
+    assert isinstance(path, Path) and path.parent.parent == Path(Config.TELEGRAM_SPOOL_DIR)
+    assert path.read_bytes() == content
+    http_api.remove_spool(path)
+
+
+def test_oversized_file_is_rejected_while_streaming(monkeypatch):
+    scheduled = _setup(monkeypatch, local=True)
+    before = _spool_entries()
+
+    response = _post([("files", ("small.pdf", b"%PDF", "application/pdf")),
+                      ("files", ("big.pdf", b"x" * (1024 * 1024 + 1), "application/pdf"))])
+
+    assert response.status_code == 413
+    assert scheduled == []
+    # Уже записанные файлы удаляются вместе с отклоненным запросом
+    assert _spool_entries() == before
+
+
+def test_unknown_mailbox_removes_spooled_files(monkeypatch):
+    _setup(monkeypatch, local=True)
+    before = _spool_entries()
+
+    response = _post([("files", ("report.pdf", b"%PDF", "application/pdf"))], data={"mailbox": "nobody@mail.ru"})
+
+    assert response.status_code == 404
+    assert _spool_entries() == before
+
+
+def test_large_content_length_is_rejected_before_reading(monkeypatch):
+    _setup(monkeypatch)
+    received = []
+    sent = []
+
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/reports", "raw_path": b"/reports", "query_string": b"", "root_path": "",
+        "headers": [(b"authorization", b"Bearer secret"), (b"content-type", b"multipart/form-data; boundary=x"),
+                    (b"content-length", str(4 * 1024 * 1024).encode())],
+        "client": ("127.0.0.1", 1), "server": ("bot", 80),
+    }
+    asyncio.run(http_api.app(scope, receive, send))
+
+    assert sent[0]["status"] == 413
+    assert received == []
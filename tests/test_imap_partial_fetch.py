@@ -0,0 +1,110 @@
+import imap_partial_fetch
+from imap_partial_fetch import _Literal, _parse, _parse_fetch_response, _report_sections, _tokens
+import imap_responses
+
+
+class FakeClient:
+    """imaplib-клиент, который отвечает заранее записанными ответами и запоминает запросы"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.commands = []
+
+    def uid(self, command, uid_set, items):
+        self.commands.append((command, uid_set, items))
+        response = self.responses.pop(0)
+        # Ответ с другим статусом задается кортежем (статус, данные)
+        return response if isinstance(response, tuple) else ('OK', response)
+
+
+class FakeMailBox:
+    def __init__(self, responses, messages=()):
+        self.client = FakeClient(responses)
+        # Письма для обычной выборки целиком (MailBox.fetch)
+        self.messages = list(messages)
+        self.fetched = []
+
+    def fetch(self, criteria, mark_seen=True):
+        self.fetched.append((str(criteria), mark_seen))
+        return iter(self.messages)
+
+
+def test_tokens_keep_literals_and_quoted_strings():
+    tokens = _tokens([(b'1 (UID 7 BODY[HEADER] {3}', b'NIL'), b' X "a \\"b\\" c")'])
+
+    assert tokens == [b'1', b'(', b'UID', b'7', b'BODY[HEADER]', b'NIL', b'X', b'"a \\"b\\" c"', b')']
+    assert isinstance(tokens[5], _Literal)
+
+
+def test_parse_nil_literal_and_escapes():
+    tokens = _tokens([(b'(NIL nil {3}', b'NIL'), b' "a \\"b\\"" () ATOM)'])
+    value, pos = _parse(tokens)
+
+    # NIL атомом — None, а литерал с текстом NIL — строка
+    assert value == [None, None, b'NIL', b'a "b"', [], b'ATOM']
+    assert pos == len(tokens)
+
+
+def test_parse_nested_bodystructure():
+    fields = _parse_fetch_response(imap_responses.NESTED)[101]
+
+    assert fields[b'RFC822.SIZE'] == b'6512'
+    assert fields[b'BODY[HEADER]'] == imap_responses.HEADER
+    structure = fields[b'BODYSTRUCTURE']
+    alternative, related = structure[0], structure[1]
+    assert alternative[2] == b'alternative'
+    assert related[0][:3] == [b'application', b'pdf', [b'name', b'report.pdf']]
+    # PNG без параметров: NIL вместо списка
+    assert related[1][2] is None
+    assert _report_sections(structure) == ['2.1']
+
+
+def test_rfc2231_filenames():
+    structure = _parse_fetch_response(imap_responses.RFC2231)[102][b'BODYSTRUCTURE']
+
+    # filename* раскодируется, продолжение filename*0* берется на всякий случай, xlsx пропускается
+    assert _report_sections(structure) == ['2', '3']
+    assert imap_partial_fetch._decoded_filename(imap_partial_fetch._params(structure[1][8][1])) == 'Отчет.pdf'
+
+
+def test_literal_inside_bodystructure():
+    fields = _parse_fetch_response(imap_responses.LITERAL_NAME)[103]
+
+    assert fields[b'BODYSTRUCTURE'][1][2] == [b'name', 'Отчет за "май".pdf'.encode()]
+    assert fields[b'BODY[HEADER]'] == imap_responses.HEADER
+    assert _report_sections(fields[b'BODYSTRUCTURE']) == ['2']
+
+
+def test_several_messages_in_one_response():
+    result = _parse_fetch_response(imap_responses.NESTED + imap_responses.NO_REPORTS)
+
+    assert sorted(result) == [101, 104]
+
+
+def test_message_without_reports_is_not_downloaded():
+    mailbox = FakeMailBox([imap_responses.NO_REPORTS])
+
+    assert imap_partial_fetch.fetch_report_parts(mailbox, [104]) == {104: None}
+    assert len(mailbox.client.commands) == 1
+
+
+def test_only_report_parts_are_downloaded():
+    mailbox = FakeMailBox([imap_responses.NESTED, imap_responses.NESTED_PARTS])
+
+    message = imap_partial_fetch.fetch_report_parts(mailbox, [101])[101]
+
+    assert mailbox.client.commands[1] == ('FETCH', '101', '(UID BODY.PEEK[2.1.MIME] BODY.PEEK[2.1])')
+    assert message.subject == 'Отчет по продажам'
+    assert message.size == 6512
+    attachments = [part for part in message.obj.walk() if part.get_filename()]
+    assert [part.get_filename() for part in attachments] == ['report.pdf']
+    assert attachments[0].get_payload(decode=True).startswith(b'%PDF-1.4')
+
+
+def test_failed_body_fetch_falls_back_to_full_fetch():
+    full = object()
+    mailbox = FakeMailBox([imap_responses.SINGLE_PART, ('NO', [b'UID FETCH failed'])], messages=[full])
+
+    assert imap_partial_fetch.fetch_report_parts(mailbox, [105]) == {105: full}
+    assert mailbox.client.commands[1] == ('FETCH', '105', '(UID BODY.PEEK[])')
+    assert mailbox.fetched == [('(UID 105)', False)]
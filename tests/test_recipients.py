@@ -0,0 +1,54 @@
+import asyncio
+
+import recipients
+from tenants import current_tenant
+from fake_seatable import FakeSeaTable, mtime
+
+
+def test_reactivation_clears_seatable_flag_without_local_record(seatable_state, monkeypatch):
+    tables = {
+        "Users": [{"_id": "u1", "id_telegram": "1001", "inactive": True,
+                   "inactive_reason": "Forbidden: bot was blocked by the user", "_mtime": mtime()}],
+        "Mailboxes": [],
+        "T_chats": [{"_id": "c1", "id_telegram_chat": "-2002", "inactive": False, "_mtime": mtime()}],
+    }
+
+    async def scenario():
+        async with FakeSeaTable(tables) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            assert "1001" not in recipients.get_store().inactive
+
+            await recipients.reactivate_recipient(1001)
+            assert tables["Users"][0]["inactive"] is False
+            assert fake.requests["update"] == 1
+
+            # Активную группу повторно не переписываем
+            await recipients.reactivate_recipient(-2002)
+            assert fake.requests["update"] == 1
+            await seatable_state.close_session()
+
+    asyncio.run(scenario())
+
+
+def test_inactive_flag_is_set_on_every_matching_row(seatable_state, monkeypatch):
+    tables = {
+        "Users": [{"_id": "u1", "id_telegram": "1001", "_mtime": mtime()},
+                  {"_id": "u2", "id_telegram": "1001", "_mtime": mtime()},
+                  {"_id": "u3", "id_telegram": "1003", "_mtime": mtime()}],
+        "Mailboxes": [],
+        "T_chats": [{"_id": "c1", "id_telegram_chat": "1001", "_mtime": mtime()}],
+    }
+
+    async def scenario():
+        async with FakeSeaTable(tables) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            assert await seatable_state.set_recipient_inactive("1001", True, "Forbidden")
+            await seatable_state.close_session()
+            return fake.requests
+
+    requests = asyncio.run(scenario())
+
+    # Дубликаты в Users и запись в T_chats отмечены, чужая строка не тронута
+    assert requests["update"] == 3
+    assert [row.get("inactive") for row in tables["Users"]] == [True, True, None]
+    assert tables["T_chats"][0]["inactive_reason"] == "Forbidden"
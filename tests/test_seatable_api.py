@@ -0,0 +1,97 @@
+import time
+import asyncio
+import dataclasses
+
+import seatable_snapshot
+from config import Config
+from tenants import current_tenant, use_tenant
+from fake_seatable import FakeSeaTable, mtime
+
+
+def test_bot_writes_survive_restart(seatable_state, monkeypatch, tmp_path):
+    monkeypatch.setattr(current_tenant(), "snapshot_path", str(tmp_path / "snapshot.sqlite3"))
+    tables = {
+        "Users": [],
+        "Mailboxes": [{"_id": "m1", "email": "sr01@example.com", "last_uid": "10", "_mtime": mtime()}],
+        "T_chats": [],
+    }
+
+    async def scenario():
+        async with FakeSeaTable(tables) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            assert await seatable_state.get_last_uid("sr01@example.com") == "10"
+            assert await seatable_state.update_last_uid("sr01@example.com", "42")
+            await seatable_state.close_session()
+
+    asyncio.run(scenario())
+
+    # «Перезапуск»: кэш в памяти пуст, таблицы загружаются из локальной копии, SeaTable недоступен
+    seatable_state._rows_caches.clear()
+    seatable_snapshot._snapshots.clear()
+    assert seatable_state.load_cached_tables() == 1
+    rows = seatable_state._rows_cache()["Mailboxes"]["rows"]
+    assert rows[0]["last_uid"] == "42"
+
+
+def _tables():
+    return {"Users": [{"_id": "u1", "name": "Иван", "_mtime": mtime()}], "Mailboxes": [], "T_chats": []}
+
+
+def test_concurrent_identical_reads_share_one_request(seatable_state, monkeypatch):
+    async def scenario():
+        async with FakeSeaTable(_tables()) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            fake.rows_delay = 0.1
+            results = await asyncio.gather(*(seatable_state.refresh_table("Users") for _ in range(5)))
+            await seatable_state.close_session()
+            return results, fake.requests
+
+    results, requests = asyncio.run(scenario())
+
+    assert all(rows == results[0] and rows[0]["name"] == "Иван" for rows in results)
+    assert requests["token"] == 1
+    assert requests["rows"] == 1
+
+
+def test_rate_limited_read_is_retried_after_retry_after(seatable_state, monkeypatch):
+    async def scenario():
+        async with FakeSeaTable(_tables()) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            fake.rate_limited = 1
+            fake.retry_after = 0.3
+            rows = await seatable_state.refresh_table("Users")
+            await seatable_state.close_session()
+            return rows, fake
+
+    rows, fake = asyncio.run(scenario())
+
+    assert rows[0]["name"] == "Иван"
+    assert fake.requests["rows"] == 2
+    assert fake.rows_times[1] - fake.rows_times[0] >= 0.3
+
+
+def test_rate_limit_is_per_tenant(seatable_state, monkeypatch):
+    monkeypatch.setattr(Config, "SEATABLE_MAX_RETRIES", 1)
+
+    async def scenario():
+        async with FakeSeaTable(_tables()) as throttled, FakeSeaTable(_tables()) as other:
+            busy = dataclasses.replace(current_tenant(), name="busy", seatable_server=throttled.url)
+            quiet = dataclasses.replace(current_tenant(), name="quiet", seatable_server=other.url)
+            throttled.rate_limited = 1
+            throttled.retry_after = 1.0
+
+            with use_tenant(busy):
+                busy_read = asyncio.create_task(seatable_state.refresh_table("Users"))
+            await asyncio.sleep(0.1)
+            # 429 одного тенанта не приостанавливает запросы другого
+            started = time.monotonic()
+            with use_tenant(quiet):
+                assert await seatable_state.refresh_table("Users")
+            quiet_elapsed = time.monotonic() - started
+
+            assert await busy_read
+            await seatable_state.close_session()
+            assert seatable_state._rate_limiters.keys() == {"busy", "quiet"}
+            return quiet_elapsed
+
+    assert asyncio.run(scenario()) < 0.5
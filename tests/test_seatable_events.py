@@ -0,0 +1,100 @@
+import asyncio
+
+from config import Config
+from tenants import current_tenant
+import seatable_events
+from seatable_events import SeaTableSubscriber
+from fake_seatable import FakeSeaTable, mtime, wait_for
+
+
+def _tables():
+    return {
+        "Users": [{"_id": "u1", "name": "Иван", "_mtime": mtime()}],
+        "Mailboxes": [{"_id": "m1", "email": "sr01@example.com", "_mtime": mtime()}],
+        "T_chats": [],
+    }
+
+
+async def _subscribe(fake: FakeSeaTable, monkeypatch) -> asyncio.Task:
+    monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+    task = asyncio.create_task(SeaTableSubscriber().run())
+    await fake.wait_joined()
+    return task
+
+
+def test_row_change_event_updates_cache(seatable_state, monkeypatch):
+    monkeypatch.setattr(seatable_events, "_REFRESH_DEBOUNCE", 0.05)
+    rows_cache = seatable_state._rows_cache
+
+    async def scenario():
+        async with FakeSeaTable(_tables()) as fake:
+            task = await _subscribe(fake, monkeypatch)
+            # После подключения все таблицы перечитываются полностью
+            await wait_for(lambda: "Users" in rows_cache() and fake.requests["rows"] >= 3)
+            assert seatable_state._live_updates[current_tenant().name] is True
+
+            fake.update_row("Users", "u1", name="Петр")
+            await fake.emit_update("Users")
+            await wait_for(lambda: rows_cache()["Users"]["rows"][0]["name"] == "Петр")
+            # Изменение строки дочитывается по _mtime, а не полным чтением таблицы
+            assert fake.requests["query"] == 1
+
+            fake.delete_row("Mailboxes", "m1")
+            await fake.emit_update("Mailboxes", op_type="delete_row")
+            await wait_for(lambda: rows_cache()["Mailboxes"]["rows"] == [])
+
+            task.cancel()
+            await seatable_state.close_session()
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_falls_back_to_polling(seatable_state, monkeypatch):
+    monkeypatch.setattr(seatable_events, "_REFRESH_DEBOUNCE", 0.05)
+    monkeypatch.setattr(Config, "SEATABLE_POLL_INTERVAL", 0.2)
+    live_updates = seatable_state._live_updates
+
+    async def scenario():
+        async with FakeSeaTable(_tables()) as fake:
+            task = await _subscribe(fake, monkeypatch)
+            tenant_name = current_tenant().name
+            await wait_for(lambda: live_updates.get(tenant_name) is True and "Users" in seatable_state._rows_cache())
+
+            fake.accept_connections = False
+            await fake.disconnect_clients()
+            await wait_for(lambda: live_updates.get(tenant_name) is False)
+
+            # Без подписки таблицы перечитываются по таймеру
+            polled = fake.requests["rows"] + fake.requests["query"]
+            fake.update_row("Users", "u1", name="Петр")
+            await wait_for(lambda: seatable_state._rows_cache()["Users"]["rows"][0]["name"] == "Петр")
+            assert fake.requests["rows"] + fake.requests["query"] > polled
+
+            # Сервер снова принимает подключения — подписка восстанавливается
+            fake.accept_connections = True
+            await fake.wait_joined()
+            await wait_for(lambda: live_updates.get(tenant_name) is True)
+
+            task.cancel()
+            await seatable_state.close_session()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_subscriber_stops_polling(seatable_state, monkeypatch):
+    monkeypatch.setattr(Config, "SEATABLE_POLL_INTERVAL", 0.2)
+
+    async def scenario():
+        async with FakeSeaTable(_tables()) as fake:
+            task = await _subscribe(fake, monkeypatch)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0)
+
+            # Резервный опрос и отложенное обновление таблиц не переживают подписку
+            leftovers = [other for other in asyncio.all_tasks() if other is not asyncio.current_task()
+                         and other.get_coro().__name__ in ("_poll_while_disconnected", "_refresh_pending")]
+            assert leftovers == []
+            await seatable_state.close_session()
+
+    asyncio.run(scenario())
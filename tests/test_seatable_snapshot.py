@@ -0,0 +1,54 @@
+import time
+import asyncio
+
+import pytest
+
+import seatable_snapshot
+from seatable_snapshot import get_snapshot, save_table
+from tenants import current_tenant
+from fake_seatable import FakeSeaTable, mtime
+
+
+@pytest.fixture
+def snapshot_path(seatable_state, monkeypatch, tmp_path):
+    path = tmp_path / "snapshot.sqlite3"
+    monkeypatch.setattr(current_tenant(), "snapshot_path", str(path))
+    seatable_snapshot._snapshots.clear()
+    yield path
+    seatable_snapshot._snapshots.clear()
+
+
+def test_snapshot_prewarms_cache(seatable_state, snapshot_path, monkeypatch):
+    users = [{"_id": "u1", "name": "Иван", "_mtime": mtime()}]
+    get_snapshot().replace_table("Users", users, time.time())
+
+    # «Перезапуск»: кэш в памяти пуст
+    seatable_state._rows_caches.clear()
+    seatable_snapshot._snapshots.clear()
+    assert seatable_state.load_cached_tables() == 1
+
+    async def scenario():
+        async with FakeSeaTable({"Users": [], "Mailboxes": [], "T_chats": []}) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            rows = await seatable_state.get_table_rows("Users")
+            await seatable_state.close_session()
+            return rows, fake.requests
+
+    rows, requests = asyncio.run(scenario())
+
+    # Строки отданы из локальной копии, SeaTable не запрашивался
+    assert rows == users
+    assert sum(requests.values()) == 0
+
+
+def test_failed_write_keeps_previous_snapshot(snapshot_path):
+    users = [{"_id": "u1", "name": "Иван", "_mtime": mtime()}]
+    asyncio.run(save_table("Users", users, 100.0, full=True))
+
+    # Повторяющийся _id нарушает первичный ключ: запись падает посреди замены таблицы
+    broken = [{"_id": "u2", "name": "Петр"}, {"_id": "u2", "name": "Петр"}]
+    asyncio.run(save_table("Users", broken, 200.0, full=True))
+
+    tables = seatable_snapshot.load_snapshot()
+    assert tables["Users"]["rows"] == users
+    assert tables["Users"]["timestamp"] == 100.0
@@ -0,0 +1,111 @@
+import asyncio
+import smtplib
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+import pytest
+from aiosmtpd.smtp import SMTP
+
+import email_handler
+from smtp_receiver import ReportHandler
+from tenants import current_tenant
+from fake_seatable import FakeSeaTable, mtime
+
+PDF = b"%PDF-1.4 report"
+TABLES = {"Users": [], "T_chats": [],
+          "Mailboxes": [{"_id": "m1", "email": "SR01@company.ru", "_mtime": mtime()}]}
+
+
+def _report() -> bytes:
+    message = EmailMessage()
+    message["From"] = "superset@company.ru"
+    message["To"] = "sr01@company.ru"
+    message["Subject"] = "[Superset] Продажи"
+    message["Date"] = format_datetime(datetime(2026, 5, 4, 6, 30, tzinfo=timezone.utc))
+    message.set_content("Отчет во вложении")
+    message.add_attachment(PDF, maintype="application", subtype="pdf", filename="report.pdf")
+    return message.as_bytes()
+
+
+@pytest.fixture
+def smtp_server(seatable_state, monkeypatch):
+    """Запускает SMTP-приемник в цикле событий теста; рассылка подменена и только записывается"""
+    distributed = []
+
+    async def distribute_attachments(email, subject, attachments, loop, trace=None):
+        distributed.append((email, subject, attachments))
+        return True
+
+    monkeypatch.setattr(email_handler, "distribute_attachments", distribute_attachments)
+
+    async def run(client, handler: ReportHandler):
+        async with FakeSeaTable(TABLES) as fake:
+            monkeypatch.setattr(current_tenant(), "seatable_server", fake.url)
+            server = await asyncio.get_running_loop().create_server(lambda: SMTP(handler), "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                result = await asyncio.to_thread(client, port)
+                # Рассылка запускается в фоне после ответа на DATA
+                await asyncio.gather(*email_handler._background_deliveries)
+                return result
+            finally:
+                server.close()
+                await server.wait_closed()
+                await seatable_state.close_session()
+
+    return run, distributed
+
+
+def test_rcpt_accepts_only_known_mailboxes(smtp_server):
+    run, _ = smtp_server
+
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            smtp.ehlo()
+            smtp.mail("superset@company.ru")
+            return smtp.rcpt("unknown@company.ru"), smtp.rcpt("sr01@company.ru")
+
+    unknown, known = asyncio.run(run(client, ReportHandler()))
+
+    assert unknown[0] == 550
+    assert known[0] == 250
+
+
+def test_data_passes_attachments_to_distribution(smtp_server):
+    run, distributed = smtp_server
+
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            return smtp.sendmail("superset@company.ru", ["sr01@company.ru"], _report())
+
+    assert asyncio.run(run(client, ReportHandler())) == {}
+    # Рассылка идет от имени ящика в том виде, как он записан в таблице
+    assert [(email, subject) for email, subject, _ in distributed] == [("SR01@company.ru", "Продажи 04.05.2026 09:30")]
+    assert distributed[0][2] == [("report 04.05.2026 09:30.pdf", PDF)]
+
+
+@pytest.mark.parametrize("allowed_ips, allowed_senders", [
+    ("10.0.0.0/8", ""),
+    ("127.0.0.1", "@reports.company.ru"),
+])
+def test_mail_from_rejects_unknown_clients_and_senders(smtp_server, allowed_ips, allowed_senders):
+    run, distributed = smtp_server
+
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            smtp.ehlo()
+            return smtp.mail("superset@company.ru")
+
+    code, _ = asyncio.run(run(client, ReportHandler(allowed_ips, allowed_senders)))
+
+    assert code == 550
+    assert distributed == []
+
+
+def test_allowed_sender_domain():
+    handler = ReportHandler("127.0.0.1", "@company.ru, bot@other.ru")
+
+    assert handler._sender_allowed("Superset@Company.ru")
+    assert handler._sender_allowed("bot@other.ru")
+    assert not handler._sender_allowed("someone@other.ru")
@@ -0,0 +1,58 @@
+import time
+import asyncio
+import logging
+
+from aiogram import Dispatcher
+
+import main
+from health import watchdog
+from tenants import current_tenant
+
+# Длительность каждого этапа прогрева в тесте
+PHASE = 0.3
+
+
+def test_startup_warms_up_concurrently_and_becomes_ready(monkeypatch, caplog):
+    monkeypatch.setattr(watchdog, "_readiness", {})
+    monkeypatch.setattr(current_tenant(), "mailboxes", [{"email": "sr01@company.ru"}, {"email": "sr02@company.ru"}])
+    during_warm_up = {}
+    at_polling = {}
+
+    async def init_telegram(tenant):
+        await asyncio.sleep(PHASE / 3)
+        during_warm_up.update(watchdog.readiness())
+        await asyncio.sleep(PHASE * 2 / 3)
+
+    async def warm_seatable(tenant):
+        await asyncio.sleep(PHASE)
+
+    def imap_idle_listener(account, loop):
+        # Как и настоящий слушатель: ящик не готов, пока не выполнен вход
+        watchdog.set_ready(main.imap_ready_name(account["email"]), False)
+        time.sleep(PHASE)
+        watchdog.set_ready(main.imap_ready_name(account["email"]))
+
+    async def start_polling(dispatcher, *bots):
+        at_polling.update(watchdog.readiness())
+
+    monkeypatch.setattr(main, "_init_telegram", init_telegram)
+    monkeypatch.setattr(main, "_warm_seatable", warm_seatable)
+    monkeypatch.setattr(main, "imap_idle_listener", imap_idle_listener)
+    monkeypatch.setattr(Dispatcher, "start_polling", start_polling)
+
+    caplog.set_level(logging.INFO, logger="main")
+    started = time.perf_counter()
+    asyncio.run(main.main())
+    elapsed = time.perf_counter() - started
+
+    # Пока идет прогрев, бот не готов; после него готовы все части, включая оба ящика
+    assert during_warm_up["ready"] is False
+    assert {"startup", "telegram", "imap:default:sr01@company.ru"} <= set(during_warm_up["not_ready"])
+    assert at_polling["ready"] is True and at_polling["not_ready"] == []
+    assert set(watchdog._readiness) == {"startup", "telegram", "imap:default:sr01@company.ru",
+                                        "imap:default:sr02@company.ru"}
+
+    # Telegram, SeaTable и IMAP прогреваются одновременно, а не друг за другом
+    assert elapsed < 2 * PHASE
+    summary = next(record.getMessage() for record in caplog.records if record.getMessage().startswith("Запуск завершен"))
+    assert all(f"{phase} " in summary for phase in ("snapshot", "telegram", "seatable", "imap"))
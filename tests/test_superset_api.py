@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+import superset_api
+from config import Config
+from superset_api import ReportSchedule, SupersetClient, get_export
+from fake_superset import PDF, PNG, FakeSuperset
+
+
+@pytest.fixture(autouse=True)
+def superset_state(monkeypatch):
+    monkeypatch.setattr(Config, "SUPERSET_USERNAME", "admin")
+    monkeypatch.setattr(Config, "SUPERSET_PASSWORD", "secret")
+    monkeypatch.setattr(Config, "SUPERSET_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(superset_api, "_client", {"instance": None})
+    monkeypatch.setattr(superset_api, "_export_cache", {})
+    monkeypatch.setattr(superset_api, "_inflight_exports", {})
+
+
+def _run(fake: FakeSuperset, scenario, monkeypatch):
+    async def run():
+        async with fake:
+            monkeypatch.setattr(Config, "SUPERSET_URL", fake.url)
+            try:
+                return await scenario()
+            finally:
+                await superset_api.close_client()
+    return asyncio.run(run())
+
+
+def test_dashboard_and_chart_exports(monkeypatch):
+    fake = FakeSuperset(ready_after=2)
+    filters = {"NATIVE_FILTER-abc": {"filterState": {"value": ["Москва"]}}}
+
+    async def scenario():
+        client = superset_api.get_client()
+        return await client.export_dashboard(12, "pdf", filters), await client.export_chart(34)
+
+    assert _run(fake, scenario, monkeypatch) == (PDF, PNG)
+    # Снимок опрашивался, пока не был готов (202, 202, 200) — по три опроса на каждую выгрузку
+    assert fake.requests["poll"] == 6
+    assert fake.dashboard_states[0]["dataMask"] == filters
+
+
+def test_concurrent_exports_share_one_screenshot(monkeypatch):
+    fake = FakeSuperset(screenshot_delay=0.1)
+    schedules = [ReportSchedule(cron="", mailboxes=[mailbox], dashboard=12, time_bucket=3600)
+                 for mailbox in ("sr01@company.ru", "sr02@company.ru", "sr03@company.ru")]
+
+    async def scenario():
+        return await asyncio.gather(*(get_export(schedule) for schedule in schedules))
+
+    assert _run(fake, scenario, monkeypatch) == [PNG] * 3
+    assert fake.requests["dashboard"] == 1
+    assert not superset_api._inflight_exports
+
+
+def test_export_is_cached_within_bucket(monkeypatch):
+    fake = FakeSuperset()
+    schedule = ReportSchedule(cron="", mailboxes=["sr01@company.ru"], dashboard=12, time_bucket=3600)
+    other_filters = ReportSchedule(cron="", mailboxes=["sr01@company.ru"], dashboard=12, time_bucket=3600,
+                                   filters={"NATIVE_FILTER-abc": {"filterState": {"value": ["Казань"]}}})
+
+    async def scenario():
+        await get_export(schedule)
+        await get_export(schedule)
+        await get_export(other_filters)
+
+    _run(fake, scenario, monkeypatch)
+    assert fake.requests["dashboard"] == 2
+
+
+def test_cache_key_includes_bucket_size(monkeypatch):
+    # Номера часового и двухчасового интервалов здесь совпадают (0), но это разные интервалы
+    monkeypatch.setattr(superset_api.time, "time", lambda: 1000.0)
+    hourly = ReportSchedule(cron="", mailboxes=[], dashboard=12, time_bucket=3600)
+    two_hourly = ReportSchedule(cron="", mailboxes=[], dashboard=12, time_bucket=7200)
+
+    assert hourly.cache_key != two_hourly.cache_key
+    assert hourly.cache_key == ReportSchedule(cron="", mailboxes=["other"], dashboard=12, time_bucket=3600).cache_key
+
+
+def test_expired_token_is_renewed(monkeypatch):
+    fake = FakeSuperset()
+
+    async def scenario():
+        client = superset_api.get_client()
+        await client.export_chart(34)
+        fake.expire_tokens()
+        return await client.export_chart(34)
+
+    assert _run(fake, scenario, monkeypatch) == PNG
+    # Вход при первом запросе и повторный — после 401
+    assert fake.requests["login"] == 2
+    assert fake.requests["chart"] == 2
+
+
+def test_screenshot_timeout(monkeypatch):
+    fake = FakeSuperset(ready_after=10_000)
+    monkeypatch.setattr(Config, "SUPERSET_SCREENSHOT_TIMEOUT", 0.2)
+
+    async def scenario():
+        client = SupersetClient(fake.url, "admin", "secret")
+        try:
+            with pytest.raises(TimeoutError):
+                await client.export_dashboard(12)
+        finally:
+            await client.close()
+
+    _run(fake, scenario, monkeypatch)
+    assert fake.requests["poll"] > 1
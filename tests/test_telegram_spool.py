@@ -0,0 +1,133 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import email_handler
+import delivery_scheduler as scheduler_module
+from config import Config
+from delivery_scheduler import DeliveryScheduler, FileTooLargeError
+from tenants import current_tenant
+from fake_bot_api import FakeBotAPI
+
+PDF = b"%PDF-1.4 " + b"x" * 1000
+
+
+@pytest.fixture
+def delivery(monkeypatch, tmp_path):
+    """Рассылка двум получателям через свой планировщик; SeaTable и история доставки не нужны"""
+    monkeypatch.setattr(Config, "TELEGRAM_SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setattr(Config, "TELEGRAM_USER_INTERVAL", 0)
+    monkeypatch.setattr(scheduler_module, "record_delivery", lambda **row: None)
+
+    async def users(email):
+        return ["1001", "1002"]
+
+    async def no_chats(email):
+        return []
+
+    async def priority(email, subject):
+        return 1.0
+
+    monkeypatch.setattr(email_handler, "get_users_to_send", users)
+    monkeypatch.setattr(email_handler, "get_chats_to_send", no_chats)
+    monkeypatch.setattr(email_handler, "get_delivery_priority", priority)
+    monkeypatch.setattr(email_handler, "filter_active", lambda ids: ids)
+
+    def setup(fake: FakeBotAPI, local: bool) -> DeliveryScheduler:
+        monkeypatch.setattr(Config, "TELEGRAM_API_SERVER", fake.url if local else "")
+        monkeypatch.setattr(current_tenant(), "bot", fake.bot(Config.BOT_TOKEN, local))
+        scheduler = DeliveryScheduler()
+        monkeypatch.setattr(email_handler, "delivery_scheduler", scheduler)
+        return scheduler
+
+    return setup
+
+
+async def _shutdown(scheduler: DeliveryScheduler):
+    for worker in scheduler._workers:
+        worker.cancel()
+    await current_tenant().bot.session.close()
+
+
+def _spool_files() -> list[Path]:
+    spool_dir = Path(Config.TELEGRAM_SPOOL_DIR)
+    return sorted(spool_dir.rglob("*.*")) if spool_dir.is_dir() else []
+
+
+def test_public_api_uploads_file_body(delivery):
+    async def scenario():
+        async with FakeBotAPI() as fake:
+            scheduler = delivery(fake, local=False)
+            delivered = await email_handler.distribute_attachments(
+                "sr01@company.ru", "Продажи", [("Отчет.pdf", PDF)], asyncio.get_running_loop())
+            await _shutdown(scheduler)
+            return delivered, fake.documents
+
+    delivered, documents = asyncio.run(scenario())
+
+    assert delivered is True
+    assert [(d["chat_id"], d["path"], d["filename"], d["content"]) for d in documents] == [
+        ("1001", None, "Отчет.pdf", PDF), ("1002", None, "Отчет.pdf", PDF)]
+    assert _spool_files() == []
+
+
+def test_local_api_sends_one_spooled_path(delivery):
+    async def scenario():
+        async with FakeBotAPI() as fake:
+            scheduler = delivery(fake, local=True)
+            delivered = await email_handler.distribute_attachments(
+                "sr01@company.ru", "Продажи", [("Отчет.pdf", PDF)], asyncio.get_running_loop())
+            await asyncio.sleep(0)
+            await _shutdown(scheduler)
+            return delivered, fake.documents
+
+    delivered, documents = asyncio.run(scenario())
+
+    assert delivered is True
+    # Оба получателя получили один и тот же файл с диска, с исходным именем
+    assert {d["path"] for d in documents} == {documents[0]["path"]}
+    assert documents[0]["path"].startswith(str(Path(Config.TELEGRAM_SPOOL_DIR).resolve()))
+    assert [(d["filename"], d["content"]) for d in documents] == [("Отчет.pdf", PDF)] * 2
+    # После рассылки файл удален
+    assert _spool_files() == []
+
+
+def test_cancelled_distribution_keeps_file_until_sent(delivery):
+    async def scenario():
+        async with FakeBotAPI(delay=0.2) as fake:
+            scheduler = delivery(fake, local=True)
+            task = asyncio.create_task(email_handler.distribute_attachments(
+                "sr01@company.ru", "Продажи", [("report.pdf", PDF)], asyncio.get_running_loop()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # Рассылку отменили, но отправки уже в очереди — файл еще нужен серверу
+            assert len(_spool_files()) == 1
+
+            for _ in range(100):
+                if len(fake.documents) == 2 and not _spool_files():
+                    break
+                await asyncio.sleep(0.05)
+            await _shutdown(scheduler)
+            return fake.documents
+
+    documents = asyncio.run(scenario())
+
+    assert [d["content"] for d in documents] == [PDF, PDF]
+    assert _spool_files() == []
+
+
+def test_file_over_limit_is_not_uploaded(delivery, monkeypatch):
+    monkeypatch.setattr(Config, "TELEGRAM_MAX_FILE_MB", 1)
+
+    async def scenario():
+        async with FakeBotAPI() as fake:
+            scheduler = delivery(fake, local=False)
+            future = scheduler.submit("sr01@company.ru", "1001", "big.pdf", b"x" * (1024 * 1024 + 1), None)
+            with pytest.raises(FileTooLargeError):
+                await future
+            await _shutdown(scheduler)
+            return fake.documents
+
+    assert asyncio.run(scenario()) == []
@@ -0,0 +1,76 @@
+import json
+import asyncio
+
+import pytest
+
+import bot
+import tenants
+import email_handler
+from config import Config
+from delivery_scheduler import DeliveryScheduler
+from tenants import current_tenant, load_tenants, use_tenant
+
+
+@pytest.fixture
+def two_tenants(monkeypatch, tmp_path):
+    """Два тенанта из TENANTS_FILE, BOT_TOKEN в окружении не задан"""
+    tenants_file = tmp_path / "tenants.json"
+    tenants_file.write_text(json.dumps([
+        {"name": "sales", "bot_token": "111:SALES", "seatable_api_token": "sales-token",
+         "mailboxes": [{"email": "sr01@company.ru", "password": "x"}]},
+        {"name": "finance", "bot_token": "222:FINANCE", "seatable_api_token": "finance-token",
+         "mailboxes": [{"email": "sr01@company.ru", "password": "y"}]},
+    ]), encoding="utf-8")
+    monkeypatch.setattr(Config, "TENANTS_FILE", str(tenants_file))
+    monkeypatch.setattr(Config, "BOT_TOKEN", "")
+    monkeypatch.setattr(tenants, "_tenants", {})
+    monkeypatch.setattr(bot, "_default_bot", {"instance": None})
+    return load_tenants()
+
+
+def test_tenants_file_does_not_need_bot_token(two_tenants):
+    assert [tenant.bot.token for tenant in two_tenants] == ["111:SALES", "222:FINANCE"]
+    # Бот из BOT_TOKEN не создавался
+    assert bot._default_bot["instance"] is None
+
+
+def test_current_tenant_requires_context_with_several_tenants(two_tenants):
+    with pytest.raises(RuntimeError):
+        current_tenant()
+    with use_tenant(two_tenants[1]):
+        assert current_tenant().name == "finance"
+
+
+def test_same_mailbox_of_different_tenants_is_queued_separately(two_tenants):
+    async def scenario():
+        scheduler = DeliveryScheduler()
+        with use_tenant(two_tenants[0]):
+            for chat_id in ("1", "2", "3"):
+                scheduler.submit("sr01@company.ru", chat_id, "report.pdf", b"%PDF", None)
+        with use_tenant(two_tenants[1]):
+            scheduler.submit("sr01@company.ru", "4", "report.pdf", b"%PDF", None)
+        for worker in scheduler._workers:
+            worker.cancel()
+
+        tags = {job.chat_id: (job.tenant.name, job.finish_tag) for job in scheduler._queue}
+        # Отправка finance не встает за тремя отправками одноименного ящика sales
+        assert tags["3"] == ("sales", 3.0)
+        assert tags["4"] == ("finance", 1.0)
+
+    asyncio.run(scenario())
+
+
+def test_watchdog_names_include_tenant(two_tenants):
+    loop = asyncio.new_event_loop()
+    try:
+        names = set()
+        for tenant in two_tenants:
+            with use_tenant(tenant):
+                fetcher = email_handler.MailboxFetcher(tenant.mailboxes[0], loop)
+                names.update({fetcher._name, email_handler.imap_ready_name("sr01@company.ru")})
+    finally:
+        loop.close()
+
+    # Одноименные ящики двух тенантов не делят heartbeat и готовность
+    assert names == {"imap-fetch:sales:sr01@company.ru", "imap:sales:sr01@company.ru",
+                     "imap-fetch:finance:sr01@company.ru", "imap:finance:sr01@company.ru"}
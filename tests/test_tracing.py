@@ -0,0 +1,34 @@
+import json
+import threading
+
+import tracing
+from config import Config
+from tracing import Span
+
+
+def test_spans_are_written_off_the_calling_thread(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "TRACING_ENABLED", True)
+    monkeypatch.setattr(Config, "TRACES_FILE", str(tmp_path / "traces.jsonl"))
+    writers = []
+    original_emit = tracing.RotatingFileHandler.emit
+
+    def emit(self, record):
+        writers.append(threading.current_thread())
+        original_emit(self, record)
+
+    monkeypatch.setattr(tracing.RotatingFileHandler, "emit", emit)
+    tracing.setup_tracing()
+    try:
+        trace = Span("report", mailbox="sr01@example.com")
+        trace.child("handle_email", attachments=2).end()
+        trace.end(error=RuntimeError("сбой"))
+    finally:
+        tracing.stop_tracing()
+
+    lines = (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+    spans = [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0] for line in lines]
+    assert [span["name"] for span in spans] == ["handle_email", "report"]
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+    assert spans[1]["status"] == {"code": 2, "message": "сбой"}
+    # Запись в файл идет в потоке QueueListener
+    assert len(writers) == 2 and threading.current_thread() not in writers
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "superset-telegram-bot"
+
+# Спаны пишутся отдельным логгером в файл JSON lines, по одному запросу OTLP/JSON в строке —
+# такой файл читает, например, receiver otlpjsonfile из OpenTelemetry Collector
+_trace_logger = logging.getLogger("tracing.spans")
+_trace_logger.propagate = False
+_trace_logger.setLevel(logging.INFO)
+_listener: dict[str, QueueListener | None] = {"instance": None}
+
+
+class _SpanFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False)
+
+
+class _SpanQueueHandler(QueueHandler):
+    """Передает запись в очередь как есть: сериализация в JSON и запись в файл (с ротацией)
+    выполняются в потоке QueueListener, а не в цикле событий"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_tracing():
+    """Подключает ротируемый файл для спанов (TRACES_FILE), если трассировка включена."""
+    if not Config.TRACING_ENABLED or _listener["instance"] is not None:
+        return
+    path = Path(Config.TRACES_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8')
+    handler.setFormatter(_SpanFormatter())
+    spans: queue.SimpleQueue = queue.SimpleQueue()
+    _listener["instance"] = QueueListener(spans, handler)
+    _listener["instance"].start()
+    # При выходе дописываем спаны, оставшиеся в очереди
+    atexit.register(stop_tracing)
+    _trace_logger.addHandler(_SpanQueueHandler(spans))
+
+
+def stop_tracing():
+    """Дописывает спаны из очереди в файл и отключает запись"""
+    listener = _listener["instance"]
+    if listener is None:
+        return
+    _listener["instance"] = None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    for handler in [handler for handler in _trace_logger.handlers if isinstance(handler, _SpanQueueHandler)]:
+        _trace_logger.removeHandler(handler)
+
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """Этап обработки письма. Все этапы одного письма имеют общий trace_id, поэтому по файлу спанов
+    видно, на каком этапе отчет задержался: приход в ящик, выборка, разбор, поиск получателей,
+    отправка каждого файла, сохранение last_uid."""
+
+    def __init__(self, name: str, trace_id: str | None = None, parent_id: str | None = None,
+                 start_ns: int | None = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = dict(attributes)
+        self.error: str | None = None
+
+    def child(self, name: str, start_ns: int | None = None, **attributes) -> "Span":
+        return Span(name, self.trace_id, self.span_id, start_ns, **attributes)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, end_ns: int | None = None, error: BaseException | str | None = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        _export(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc)
+        return False
+
+
+def _export(span: Span):
+    if _listener["instance"] is None:
+        return
+    record = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,  # SPAN_KIND_INTERNAL
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": _attribute_value(value)}
+                                   for key, value in span.attributes.items() if value is not None],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                }],
+            }],
+        }],
+    }
+    try:
+        _trace_logger.info(record)
+    except Exception as e:
+        logger.warning(f"Не удалось записать спан {span.name}: {e}")
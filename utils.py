@@ -1,4 +1,7 @@
 import re
+import time
+import random
+import asyncio
 
 def normalize_phone(raw: str | None) -> str | None:
     """Приводит телефон к формату +7XXXXXXXXXX или возвращает None."""
@@ -16,4 +19,46 @@ def normalize_phone(raw: str | None) -> str | None:
     else:
         return None
 
-    return f"+{digits}"
\ No newline at end of file
+    return f"+{digits}"
+
+
+class Backoff:
+    """Экспоненциальная задержка с джиттером для повторных попыток.
+    Каждая следующая задержка растёт вдвое (до max_delay), половина её выбирается случайно,
+    чтобы несколько потоков не переподключались к серверу одновременно."""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 300.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.max_delay, self.base_delay * 2 ** min(self.attempt, 30))
+        self.attempt += 1
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class TokenBucket:
+    """Ограничитель частоты «ведро токенов»: в среднем не больше rate операций в секунду,
+    с допустимым всплеском до capacity операций подряд."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)